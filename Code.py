@@ -1,9 +1,24 @@
+import argparse
+import contextlib
+import copy
+import cProfile
+import dataclasses
+import datetime
+import functools
+import hashlib
+import json
+import os
+import pickle
+import re
+import shutil
+import sys
+import tempfile
+import time
+
 import pandas as pd
 import numpy as np
-from fuzzywuzzy import process, fuzz
-from openpyxl.styles import PatternFill
-from openpyxl.utils import get_column_letter
-from openpyxl import load_workbook
+# rapidfuzz, scipy, openpyxl, xlsxwriter and pyarrow are imported where they are used,
+# so summary-only runs and `import Code` do not pay for them
 
 
 # === Config ===
@@ -16,10 +31,179 @@ output_file = "/Users/rahulraj/desktop/SDS04_agrregate_testing_5385_27AUG.xlsx"
 # === FUZZY MATCHING SETTINGS ===
 MIN_FUZZY_SCORE = 85  # Increased from 92 for better matching
 EXACT_MATCH_BONUS = 10  # Bonus for exact substring matches
+COLUMN_MATCH_SCORE = 92  # Minimum score to pair data columns (changed the factor by 93 from 90 for better accuracy)
+
+# === COMPARISON SETTINGS ===
+# Cell values treated as empty (equivalent to 0, blank, NaN or None) when comparing
+EMPTY_LIKE_VALUES = ['', '0', '0.00', '0.0', 'nan', 'null', 'none', 'Not assigned', '-', '*', '#', ' ']
+# Per-column comparison policies, keyed by column name or by inferred dtype ('numeric', 'datetime', 'text');
+# a column's name policy overrides its dtype policy. Options:
+#   abs_tol / rel_tol: numbers within max(abs_tol, rel_tol * larger value) match
+#   round: decimals both numbers are rounded to first (e.g. 2 for currency)
+#   dates: 'date' or 'datetime', compare values parsed as dates at day or full precision
+#   case_insensitive: True to ignore case in text
+#   empty_values: tokens treated as empty instead of EMPTY_LIKE_VALUES
+# e.g. {'numeric': {'abs_tol': 0.005}, 'Posting Date': {'dates': 'date'}, 'Status': {'case_insensitive': True}}
+COLUMN_POLICIES = {}
+ROW_HASH_SHORT_CIRCUIT = True  # Rows whose raw matched values hash equal on both sides skip the cell-level comparison
+
+# === NEAR-MISS KEY SETTINGS ===
+NEAR_MISS_MATCHING = True  # Suggest Sheet1-only/Sheet2-only row pairs whose keys differ only slightly ("Near-miss Keys" sheet)
+NEAR_MISS_MIN_SCORE = 85  # Minimum fuzzy score of the differing key component
+NEAR_MISS_BLOCK_LENGTH = 3  # Candidates must share this many leading or trailing characters of that component
+NEAR_MISS_MAX_BLOCK_PAIRS = 250000  # Skip blocks that would need more comparisons than this
+
+# === DUPLICATE KEY SETTINGS ===
+# 'ordinal': the n-th occurrence of a key in Sheet1 is paired with the n-th occurrence in Sheet2
+# 'row_number': legacy rule, every key of a sheet with any duplicate gets its row number appended
+DUPLICATE_KEY_MODE = 'ordinal'
+DUPLICATE_SORT_COLUMN = None  # Optional column ordering the occurrences of a repeated key (sheet order otherwise)
+
+# === AGGREGATE SETTINGS ===
+AGGREGATE_MODE = False  # Compare per-group totals instead of every line, drilling down into failing groups
+AGGREGATE_GROUP_COLUMNS = ['Company Code', 'Profit Center']  # Subset of key_columns to group by
+AGGREGATE_FUNCTIONS = ['sum', 'count']  # Any of sum, count, min, max over the matched numeric columns
+AGGREGATE_DRILL_DOWN = True  # Line-level comparison of the rows in failing groups
+
+# === MEMORY SETTINGS ===
+MEMORY_LEAN = False  # Categorical text, downcast numbers and Arrow-backed keys to cut peak memory
+LEAN_CATEGORY_MAX_RATIO = 0.5  # Text columns with at most this share of distinct values become categorical
+
+# === STREAMING (OUT-OF-CORE) SETTINGS ===
+STREAMING_MODE = False  # Reconcile bucket by bucket instead of loading both sheets in full
+STREAM_SOURCES = None  # Optional (sheet1_path, sheet2_path) pair of .xlsx/.csv/.parquet files; default both sheets of file_path
+STREAM_BUCKETS = 64  # Number of on-disk hash buckets per sheet (peak memory ~ one bucket of each sheet)
+STREAM_CHUNK_ROWS = 50000  # Rows read per chunk while partitioning
+STREAM_WORK_DIR = None  # Where bucket files are written (a temporary directory when None)
+
+# === SQL BACKEND SETTINGS ===
+SQL_BACKEND = None  # 'sqlite', 'duckdb' or 'auto' (DuckDB when installed): build keys, join and compare inside an embedded database
+SQL_DATABASE = None  # New database file the sheets are loaded into (a temporary file when None); an existing file is refused
+
+# === PARSED INPUT CACHE SETTINGS ===
+USE_INPUT_CACHE = True  # Reuse sheets parsed by earlier runs of the same, unchanged input file
+CLEAR_INPUT_CACHE = False  # Empty the cache before loading
+INPUT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'table_matching_automation')
+INPUT_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently used entries are evicted beyond this size
+
+# === BATCH SETTINGS ===
+BATCH_WORKERS = None  # Process pool size (CPU count when None)
+BATCH_MEMORY_BUDGET = None  # Bytes all running jobs may use together (80% of available memory when None)
+BATCH_MEMORY_PER_INPUT_BYTE = 20  # Rough peak memory per byte of input file, used to cap concurrency
 
-# === Load Sheets ===
-sheet1 = pd.read_excel(file_path, sheet_name='Sheet1')
-sheet2 = pd.read_excel(file_path, sheet_name='Sheet2')
+# === PROFILING SETTINGS ===
+RUN_STATS_FILE = None  # Write per-stage wall/CPU time, peak RSS and sizes to this .json or .csv file
+RUN_STATS_SHEET = False  # Add a "Run Stats" sheet with the same numbers to the report
+PROFILE_DIR = None  # Dump cProfile stats of the hot stages into this directory
+
+# === REPORT OUTPUT SETTINGS ===
+REPORT_OUTPUT_FORMAT = 'xlsx'  # 'xlsx' writes every sheet; 'parquet' or 'csv' write the bulky tables as files next to a compact workbook
+REPORT_CSV_COMPRESSION = None  # e.g. 'gzip' for .csv.gz files
+REPORT_BULK_SHEETS = ['Source Data', 'Target Data', 'Row Comparison', 'Side by Side Result']
+REPORT_SPLIT_WORKBOOKS = False  # Past the Excel row limit, continue in report_part2.xlsx, ... instead of on "Sheet (2)" tabs
+
+# === INCREMENTAL SETTINGS ===
+INCREMENTAL_STATE_FILE = None  # Per-row digests of the last run; unchanged matching rows are not recompared
+
+# === Run Profiling ===
+class RunProfiler:
+    """Wall time, CPU time, peak RSS and row/column counts per pipeline stage.
+
+    Hot stages are additionally run under cProfile when cprofile_dir is set.
+    """
+
+    def __init__(self, cprofile_dir=None):
+        self.cprofile_dir = cprofile_dir
+        self.records = []
+        self.open_stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None, columns=None, hot=False):
+        record = {'stage': name, 'rows': rows, 'columns': columns}
+        reset_peak_rss()
+        profiler = None
+        if hot and self.cprofile_dir and not any(stage.get('cprofile') for stage in self.open_stages):
+            profiler = cProfile.Profile()
+            record['cprofile'] = True
+        self.open_stages.append(record)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+                os.makedirs(self.cprofile_dir, exist_ok=True)
+                dump_name = f"{len(self.records) + 1:02d}_{re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_')}.prof"
+                record['cprofile'] = os.path.join(self.cprofile_dir, dump_name)
+                profiler.dump_stats(record['cprofile'])
+            record['wall_s'] = round(time.perf_counter() - wall_start, 4)
+            record['cpu_s'] = round(time.process_time() - cpu_start, 4)
+            record['rss_mb'], record['peak_rss_mb'] = current_rss_mb()
+            self.open_stages.pop()
+            # Nested stages reset the peak, so carry their peaks up to the enclosing stages
+            for outer in self.open_stages:
+                outer['nested_peak_rss_mb'] = max(outer.get('nested_peak_rss_mb', 0), record['peak_rss_mb'])
+            record['peak_rss_mb'] = max(record['peak_rss_mb'], record.pop('nested_peak_rss_mb', 0))
+            self.records.append(record)
+
+    def to_frame(self):
+        columns = ['stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rss_mb', 'rows', 'columns', 'cprofile']
+        return pd.DataFrame(self.records).reindex(columns=columns).astype({'rows': 'Int64', 'columns': 'Int64'})
+
+    def save(self, path):
+        """Write the profile as JSON or CSV (by extension)."""
+        frame = self.to_frame()
+        if path.lower().endswith('.csv'):
+            frame.to_csv(path, index=False)
+        else:
+            frame.to_json(path, orient='records', indent=2)
+
+# Profiler the pipeline reports into; None keeps instrumentation free
+ACTIVE_PROFILER = None
+
+def profile_stage(name, rows=None, columns=None, hot=False):
+    """Context manager timing one stage on the active profiler (a no-op when profiling is off)."""
+    if ACTIVE_PROFILER is None:
+        return contextlib.nullcontext({})
+    return ACTIVE_PROFILER.stage(name, rows=rows, columns=columns, hot=hot)
+
+def start_profiling(cprofile_dir=None):
+    global ACTIVE_PROFILER
+    ACTIVE_PROFILER = RunProfiler(cprofile_dir)
+    return ACTIVE_PROFILER
+
+def stop_profiling():
+    global ACTIVE_PROFILER
+    profiler, ACTIVE_PROFILER = ACTIVE_PROFILER, None
+    return profiler
+
+def with_run_stats(sheets, run_stats_sheet):
+    """Append the stages measured so far as a "Run Stats" sheet when requested and profiling is on."""
+    if run_stats_sheet and ACTIVE_PROFILER is not None:
+        sheets = dict(sheets, **{"Run Stats": ACTIVE_PROFILER.to_frame()})
+    return sheets
+
+def reset_peak_rss():
+    """Reset the kernel's peak-RSS counter (Linux) so each stage reports its own peak."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as handle:
+            handle.write('5')
+    except OSError:
+        pass
+
+def current_rss_mb():
+    """(current RSS, peak RSS) in MB; peak falls back to the process-lifetime maximum."""
+    try:
+        with open('/proc/self/status') as handle:
+            status = dict(line.split(':', 1) for line in handle if ':' in line)
+        return round(int(status['VmRSS'].split()[0]) / 1024, 1), round(int(status['VmHWM'].split()[0]) / 1024, 1)
+    except (OSError, KeyError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_mb = peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+        return None, round(peak_mb, 1)
 
 # ---Column Cleaning ---
 def clean_columns(df):
@@ -32,487 +216,2390 @@ def clean_columns(df):
         cleaned_cols.append(clean_col.strip())
     return cleaned_cols
 
-sheet1.columns = clean_columns(sheet1)
-sheet2.columns = clean_columns(sheet2)
+# === Parsed Input Cache ===
+@functools.lru_cache(maxsize=None)
+def content_digest(path, size, mtime_ns):
+    """blake2b of the file contents (memoized per path/size/mtime within a run)."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def input_cache_key(file_path, sheet_name):
+    """Cache entry name from path, size, mtime, content hash and sheet name."""
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    identity = f'{path}|{stat.st_size}|{stat.st_mtime_ns}|{content_digest(path, stat.st_size, stat.st_mtime_ns)}|{sheet_name}'
+    return hashlib.blake2b(identity.encode('utf-8'), digest_size=16).hexdigest()
+
+def read_cached_sheet(cache_dir, entry):
+    """Memory-map a cached Arrow IPC sheet (or unpickle the fallback entry); None on a miss."""
+    arrow_path = os.path.join(cache_dir, f'{entry}.arrow')
+    pickle_path = os.path.join(cache_dir, f'{entry}.pkl')
+    try:
+        if os.path.exists(arrow_path):
+            import pyarrow as pa
+            path, frame = arrow_path, pa.ipc.open_file(pa.memory_map(arrow_path, 'r')).read_all().to_pandas()
+        elif os.path.exists(pickle_path):
+            path, frame = pickle_path, pd.read_pickle(pickle_path)
+        else:
+            return None
+    except FileNotFoundError:  # evicted by a concurrent job in between
+        return None
+    try:
+        os.utime(path)  # mark as recently used
+    except FileNotFoundError:
+        pass
+    return frame
+
+def write_cached_sheet(cache_dir, entry, frame):
+    """Store a parsed sheet as Arrow IPC; columns Arrow cannot type (mixed objects) fall back to pickle."""
+    import pyarrow as pa
+    os.makedirs(cache_dir, exist_ok=True)
+    try:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        table = None
+
+    # A unique temp file per writer: concurrent batch jobs may cache the same sheet at once
+    handle, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=f'{entry}.', suffix='.tmp')
+    os.close(handle)
+    try:
+        if table is not None:
+            target = os.path.join(cache_dir, f'{entry}.arrow')
+            with pa.OSFile(temp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            target = os.path.join(cache_dir, f'{entry}.pkl')
+            frame.to_pickle(temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def evict_input_cache(cache_dir, max_bytes):
+    """Drop least recently used entries until the cache fits in max_bytes."""
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(('.arrow', '.pkl')):
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # evicted by another process in the meantime
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort(reverse=True)
+    total = 0
+    for _, size, path in entries:
+        total += size
+        if total > max_bytes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def clear_input_cache(cache_dir):
+    """Remove every cached sheet."""
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+        print(f"🧹 Cleared input cache '{cache_dir}'")
+
+def load_sheet(file_path, sheet_name, use_cache=None, cache_dir=None, max_bytes=None):
+    """pd.read_excel + clean_columns, served from the parsed-input cache when the file is unchanged."""
+    use_cache = USE_INPUT_CACHE if use_cache is None else use_cache
+    cache_dir = INPUT_CACHE_DIR if cache_dir is None else cache_dir
+    max_bytes = INPUT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with profile_stage(f"load {sheet_name}", hot=True) as stage:
+        entry = None
+        if use_cache:
+            entry = input_cache_key(file_path, sheet_name)
+            cached = read_cached_sheet(cache_dir, entry)
+            if cached is not None:
+                print(f"⚡ Loaded '{sheet_name}' from input cache")
+                stage.update(rows=len(cached), columns=len(cached.columns))
+                return cached
+
+        sheet = pd.read_excel(file_path, sheet_name=sheet_name)
+        sheet.columns = clean_columns(sheet)
+        stage.update(rows=len(sheet), columns=len(sheet.columns))
+
+        if use_cache:
+            write_cached_sheet(cache_dir, entry, sheet)
+            evict_input_cache(cache_dir, max_bytes)
+        return sheet
+
+# === Memory-lean Frames ===
+def compact_column(series, category_max_ratio=None):
+    """Column in its smallest lossless dtype: repetitive text as categorical, numbers downcast."""
+    category_max_ratio = LEAN_CATEGORY_MAX_RATIO if category_max_ratio is None else category_max_ratio
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    kind = series.dtype.kind
+    if kind in 'iu':
+        return pd.to_numeric(series, downcast='integer' if kind == 'i' else 'unsigned')
+    if kind == 'f':
+        narrow = series.astype(np.float32)
+        if np.array_equal(narrow.to_numpy(dtype=np.float64), series.to_numpy(dtype=np.float64), equal_nan=True):
+            return narrow
+        return series
+    if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+        if series.nunique(dropna=False) <= category_max_ratio * len(series):
+            return series.astype('category')
+    return series
+
+def compact_dtypes(frame, category_max_ratio=None):
+    """Shallow copy of a sheet with every column in its smallest lossless dtype."""
+    compacted = frame.copy(deep=False)
+    for position, (_, series) in enumerate(frame.items()):
+        column = compact_column(series, category_max_ratio)
+        if column is not series:
+            compacted.isetitem(position, column)
+    return compacted
+
+def compact_keys(keys):
+    """Composite keys in Arrow string storage (a few bytes per key instead of a Python str); unchanged without pyarrow."""
+    try:
+        return keys.astype('string[pyarrow]')
+    except ImportError:
+        return keys
+
+def take_rows(frame, rows):
+    """frame.iloc[rows], as a view instead of a copy when rows is one ascending run of positions."""
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows) and (np.diff(rows) == 1).all():
+        return frame.iloc[rows[0]:rows[-1] + 1]
+    return frame.iloc[rows]
 
 # === IMPROVED KEY COLUMN VALIDATION ===
+def key_column_scorers():
+    """Scorers combined for key columns: standard ratio, partial ratio (substring matches),
+    token sort ratio (word order differences) and token set ratio (different word sets)."""
+    from rapidfuzz import fuzz, utils
+    return [
+        (fuzz.ratio, None),
+        (fuzz.partial_ratio, None),
+        (fuzz.token_sort_ratio, utils.default_process),
+        (fuzz.token_set_ratio, utils.default_process),
+    ]
+
 def find_key_column_improved(df_columns, target_key):
     """Find key column using exact match first, then comprehensive fuzzy matching."""
     # First try exact match
     if target_key in df_columns:
         return target_key, 100
-    
+
     if not df_columns:
         return None, 0
-    
-    # Try multiple fuzzy matching strategies
-    best_match = None
-    best_score = 0
-    
-    for col in df_columns:
-        # Strategy 1: Standard ratio
-        score1 = fuzz.ratio(target_key.lower(), col.lower())
-        
-        # Strategy 2: Partial ratio (good for substring matches)
-        score2 = fuzz.partial_ratio(target_key.lower(), col.lower())
-        
-        # Strategy 3: Token sort ratio (good for word order differences)
-        score3 = fuzz.token_sort_ratio(target_key.lower(), col.lower())
-        
-        # Strategy 4: Token set ratio (good for different word sets)
-        score4 = fuzz.token_set_ratio(target_key.lower(), col.lower())
-        
-        # Take the maximum score from all strategies
-        max_score = max(score1 ,  score2 , score3 , score4)
-        
-        # Bonus for exact substring matches
-        if target_key.lower() in col.lower() or col.lower() in target_key.lower():
-            max_score = min(100, max_score + EXACT_MATCH_BONUS)
-        
-        if max_score > best_score:
-            best_score = max_score
-            best_match = col
-    
-    return best_match, best_score
 
-# === DUPLICATE COLUMN CHECK ===
-dupe_cols = sheet1.columns[sheet1.columns.duplicated()].tolist()
-if dupe_cols:
-    print("❌ Duplicate columns in Sheet1:", dupe_cols)
-    raise ValueError('❌ Duplicate columns in Sheet1 ❌')
+    from rapidfuzz import process
 
-dupe_2cols = sheet2.columns[sheet2.columns.duplicated()].tolist()
-if dupe_2cols:
-    print("❌ Duplicate columns in Sheet2:", dupe_2cols)
-    raise ValueError('❌ Duplicate columns in Sheet2 ❌')
+    # Score every column with each strategy in one batched call and take the maximum
+    target = target_key.lower()
+    lowered_cols = [col.lower() for col in df_columns]
+    scores = np.max([
+        process.cdist([target], lowered_cols, scorer=scorer, processor=processor, workers=-1)[0]
+        for scorer, processor in key_column_scorers()
+    ], axis=0)
+    scores = np.rint(scores).astype(int)
+
+    # Bonus for exact substring matches
+    substring = np.array([target in col or col in target for col in lowered_cols])
+    scores = np.where(substring, np.minimum(100, scores + EXACT_MATCH_BONUS), scores)
+
+    best = int(np.argmax(scores))
+    if scores[best] <= 0:
+        return None, 0
+    return df_columns[best], int(scores[best])
+
+# === DUPLICATE COLUMN CHECK ===
+def check_duplicate_columns(columns, sheet_name):
+    """Raise if cleaned column names collide."""
+    columns = pd.Index(columns)
+    dupe_cols = columns[columns.duplicated()].tolist()
+    if dupe_cols:
+        print(f"❌ Duplicate columns in {sheet_name}:", dupe_cols)
+        raise ValueError(f'❌ Duplicate columns in {sheet_name} ❌')
 
 # === KEY COLUMN MATCHING ===
-actual_key_columns = []
-for key in key_columns:
-    found_key1, score1 = find_key_column_improved(sheet1.columns.tolist(), key)
-    found_key2, score2 = find_key_column_improved(sheet2.columns.tolist(), key)
-    
-    if found_key1 and found_key2 and score1 >= MIN_FUZZY_SCORE and score2 >= MIN_FUZZY_SCORE:
-        actual_key_columns.append(key)
-        if found_key1 != key: 
-            print(f"🔄 Renaming '{found_key1}' to '{key}' in Sheet1 (score: {score1})")
-            sheet1.rename(columns={found_key1: key}, inplace=True)
-        if found_key2 != key: 
-            print(f"🔄 Renaming '{found_key2}' to '{key}' in Sheet2 (score: {score2})")
-            sheet2.rename(columns={found_key2: key}, inplace=True)
+def resolve_key_columns(sheet1_columns, sheet2_columns, key_columns):
+    """Find each key column in both sheets; returns (key_columns, sheet1_renames, sheet2_renames)."""
+    actual_key_columns = []
+    sheet1_renames, sheet2_renames = {}, {}
+    for key in key_columns:
+        found_key1, score1 = find_key_column_improved(list(sheet1_columns), key)
+        found_key2, score2 = find_key_column_improved(list(sheet2_columns), key)
+
+        if found_key1 and found_key2 and score1 >= MIN_FUZZY_SCORE and score2 >= MIN_FUZZY_SCORE:
+            actual_key_columns.append(key)
+            if found_key1 != key:
+                print(f"🔄 Renaming '{found_key1}' to '{key}' in Sheet1 (score: {score1})")
+                sheet1_renames[found_key1] = key
+            if found_key2 != key:
+                print(f"🔄 Renaming '{found_key2}' to '{key}' in Sheet2 (score: {score2})")
+                sheet2_renames[found_key2] = key
+        else:
+            print(f"❌ Error: Key column '{key}' not found!")
+            print(f"   Sheet1 best match: '{found_key1}' (score: {score1})")
+            print(f"   Sheet2 best match: '{found_key2}' (score: {score2})")
+            raise Exception(f"Missing key column: {key}")
+
+    return actual_key_columns, sheet1_renames, sheet2_renames
+
+# === Vectorized Key Normalization ===
+def column_to_text(series):
+    """Vectorized str() of every value of a column, missing ones included ('nan', 'None', 'NaT')."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        if getattr(series.dt, 'tz', None) is not None:
+            return series.astype(object).map(str)
+        text = series.dt.strftime('%Y-%m-%d %H:%M:%S')
+        # Like str(Timestamp): microseconds (or nanoseconds) only when the value has them
+        micro = series.dt.microsecond.fillna(0).astype(np.int64)
+        nano = series.dt.nanosecond.fillna(0).astype(np.int64)
+        fraction = np.where(nano != 0, '.' + (micro * 1000 + nano).astype(str).str.zfill(9),
+                            np.where(micro != 0, '.' + micro.astype(str).str.zfill(6), ''))
+        text = text + pd.Series(fraction, index=series.index, dtype=text.dtype)
     else:
-        print(f"❌ Error: Key column '{key}' not found!")
-        print(f"   Sheet1 best match: '{found_key1}' (score: {score1})")
-        print(f"   Sheet2 best match: '{found_key2}' (score: {score2})")
-        raise Exception(f"Missing key column: {key}")
-
-key_columns = actual_key_columns
-
-# === Store Original Key Values Before Processing ===
-original_keys_sheet1 = {key: sheet1[key].copy() for key in key_columns}
-original_keys_sheet2 = {key: sheet2[key].copy() for key in key_columns}
-
-# === Fixed Normalize Key Columns ===
-def normalize_key_value(val):
-    """Normalize key values to clean string format without .0 suffix."""
-    if pd.isna(val): 
-        return str(val)
-    
-    str_val = str(val).strip()
-    
-    if str_val.endswith('.0'):
-        str_val = str_val[:-2]
-    
-    if str_val.replace('.', '').replace('-', '').isdigit():
+        text = series.astype(str)
+    missing = series.isna()
+    if missing.any():
+        text = text.mask(missing, series[missing].astype(object).map(str))
+    return text
+
+def normalize_key_column(series):
+    """Normalize a key column to clean strings without .0 suffix, integers canonicalized."""
+    text = column_to_text(series).str.strip()
+    text = text.str.replace(r'\.0$', '', regex=True)
+
+    # Same rule as before: digits once '.' and '-' are removed -> str(int(float(value)))
+    integer_like = text.str.replace(r'[.-]', '', regex=True).str.fullmatch(r'\d+').fillna(False).astype(bool)
+    numbers = pd.to_numeric(text.where(integer_like), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+    normalized = text.to_numpy(dtype=object, copy=True)
+    convertible = np.isfinite(numbers)
+    exact = convertible & (np.abs(numbers) < 2**53)
+    normalized[exact] = np.trunc(numbers[exact]).astype(np.int64).astype(str)
+    # Very large numbers are rare; keep Python's float() rounding for them
+    for pos in np.flatnonzero(convertible & ~exact):
+        normalized[pos] = str(int(float(normalized[pos])))
+
+    return pd.Series(normalized, index=series.index, dtype=object)
+
+def build_composite_key(df, key_columns):
+    """Join normalized key columns with '|'."""
+    normalized = [normalize_key_column(df[col]) for col in key_columns]
+    keys = normalized[0]
+    if len(normalized) > 1:
+        keys = keys.str.cat(normalized[1:], sep='|')
+    return keys
+
+# === Duplicate Keys ===
+def number_duplicate_keys(keys, sort_values=None):
+    """Suffix the 2nd, 3rd, ... occurrence of a key with _dup2, _dup3, ...
+
+    Occurrences are numbered in sort_values order (sheet order for ties or without it),
+    so the n-th occurrence in Sheet1 gets the same key as the n-th in Sheet2.
+    """
+    if not keys.duplicated().any():
+        return keys
+    order = np.arange(len(keys))
+    if sort_values is not None:
+        sort_values = pd.Series(sort_values.to_numpy(), copy=False)
         try:
-            return str(int(float(str_val)))
-        except (ValueError, OverflowError):
-            return str_val
-    
-    return str_val
-
-for col in key_columns:
-    sheet1[f'{col}_normalized'] = sheet1[col].apply(normalize_key_value)
-    sheet2[f'{col}_normalized'] = sheet2[col].apply(normalize_key_value)
-normalized_key_cols = [f'{col}_normalized' for col in key_columns]
-
-# === Create Unique Composite Keys ===
-sheet1['__key__'] = sheet1[normalized_key_cols].agg('|'.join, axis=1)
-sheet2['__key__'] = sheet2[normalized_key_cols].agg('|'.join, axis=1)
-
-if sheet1['__key__'].duplicated().any():
-    sheet1['__key__'] += '_row' + (sheet1.index + 1).astype(str)
-if sheet2['__key__'].duplicated().any():
-    sheet2['__key__'] += '_row' + (sheet2.index + 1).astype(str)
-
-# === NEW: Identify Common and Extra Rows ===
-sheet1_keys = set(sheet1['__key__'])
-sheet2_keys = set(sheet2['__key__'])
-
-# Find common keys and extra keys
-common_keys = sheet1_keys & sheet2_keys
-extra_in_sheet1 = sheet1_keys - sheet2_keys  # In Sheet1 but not in Sheet2
-extra_in_sheet2 = sheet2_keys - sheet1_keys  # In Sheet2 but not in Sheet1
-
-print(f"📊 Key Analysis:")
-print(f"  - Total keys in Sheet1: {len(sheet1_keys)}")
-print(f"  - Total keys in Sheet2: {len(sheet2_keys)}")
-print(f"  - Common keys (for comparison): {len(common_keys)}")
-print(f"  - Extra in Sheet1 only: {len(extra_in_sheet1)}")
-print(f"  - Extra in Sheet2 only: {len(extra_in_sheet2)}")
-
-# === Clean up normalized columns ===
-for col in normalized_key_cols:
-    if col in sheet1.columns:
-        sheet1.drop(columns=[col], inplace=True)
-    if col in sheet2.columns:
-        sheet2.drop(columns=[col], inplace=True)
-
-sheet1.set_index('__key__', inplace=True)
-sheet2.set_index('__key__', inplace=True)
-
-# === NEW: Filter to Common Keys Only for Comparison ===
-sheet1_common = sheet1.loc[list(common_keys)]
-sheet2_common = sheet2.loc[list(common_keys)]
+            order = sort_values.sort_values(kind='stable').index.to_numpy()
+        except TypeError:  # mixed types, order by their text instead
+            order = column_to_text(sort_values).sort_values(kind='stable').index.to_numpy()
+
+    occurrence = np.empty(len(keys), dtype=np.int64)
+    occurrence[order] = pd.Series(keys.to_numpy()[order]).groupby(keys.to_numpy()[order], sort=False).cumcount().to_numpy()
+    repeated = occurrence > 0
+    numbered = keys.to_numpy(dtype=object, copy=True)
+    numbered[repeated] = pd.Series(numbered[repeated]).str.cat((occurrence[repeated] + 1).astype(str), sep='_dup').to_numpy()
+    return pd.Series(numbered, index=keys.index, dtype=object)
+
+def find_sort_column(columns, sort_column, sheet_label):
+    """The DUPLICATE_SORT_COLUMN as named in a sheet, or None (sheet order) when it is not found."""
+    if not sort_column:
+        return None
+    found, score = find_key_column_improved(list(columns), sort_column)
+    if found is None or score < MIN_FUZZY_SCORE:
+        print(f"⚠️ Duplicate sort column '{sort_column}' not found in {sheet_label}, using sheet order")
+        return None
+    return found
+
+def disambiguate_duplicate_keys(sheet, sheet_label, sort_column=None):
+    """Unique '__key__' values following DUPLICATE_KEY_MODE (occurrences ordered by sort_column, default DUPLICATE_SORT_COLUMN)."""
+    sort_column = DUPLICATE_SORT_COLUMN if sort_column is None else sort_column
+    keys = sheet['__key__']
+    duplicate_count = int(keys.duplicated().sum())
+    if not duplicate_count:
+        return keys
+    if DUPLICATE_KEY_MODE == 'row_number':
+        return keys + '_row' + (sheet.index + 1).astype(str)
+    print(f"🔁 {sheet_label}: {duplicate_count} repeated keys paired by occurrence")
+    sort_column = find_sort_column(sheet.columns, sort_column, sheet_label)
+    return number_duplicate_keys(keys, sheet[sort_column] if sort_column else None)
+
+# === Identify Common and Extra Rows (single indicator join) ===
+def partition_rows(keys1, keys2):
+    """Positional rows of common, Sheet1-only and Sheet2-only keys.
+
+    Rows keep Sheet1 order, Sheet2-only rows follow in Sheet2 order.
+    """
+    key_join = pd.merge(
+        pd.DataFrame({'__key__': pd.Series(keys1, copy=False).array, 'sheet1_row': np.arange(len(keys1))}),
+        pd.DataFrame({'__key__': pd.Series(keys2, copy=False).array, 'sheet2_row': np.arange(len(keys2))}),
+        on='__key__', how='outer', indicator=True,
+    ).sort_values(['sheet1_row', 'sheet2_row'], na_position='last', kind='stable')
+
+    common_join = key_join[key_join['_merge'] == 'both']
+    common_rows_sheet1 = common_join['sheet1_row'].to_numpy(dtype=np.int64)
+    common_rows_sheet2 = common_join['sheet2_row'].to_numpy(dtype=np.int64)
+    extra_rows_sheet1 = key_join.loc[key_join['_merge'] == 'left_only', 'sheet1_row'].to_numpy(dtype=np.int64)  # In Sheet1 but not in Sheet2
+    extra_rows_sheet2 = key_join.loc[key_join['_merge'] == 'right_only', 'sheet2_row'].to_numpy(dtype=np.int64)  # In Sheet2 but not in Sheet1
+    return common_rows_sheet1, common_rows_sheet2, extra_rows_sheet1, extra_rows_sheet2
 
 # === IMPROVED FUZZY MATCH COLUMNS (UPDATED SECTION) ===
-# Only include actual data columns, exclude key columns and any remaining normalized columns
-sheet1_cols = [c for c in sheet1_common.columns if c not in key_columns and not c.endswith('_normalized')]
-sheet2_cols = [c for c in sheet2_common.columns if c not in key_columns and not c.endswith('_normalized')]
-
-print(f"\n🔍 Starting fuzzy column matching...")
-print(f"   Source columns: {len(sheet1_cols)}")
-print(f"   Target columns: {len(sheet2_cols)}")
-
-matched_cols, unmatched_cols = {}, []
-for col1 in sheet1_cols:
-    match, score = process.extractOne(col1, sheet2_cols)
-    if score >= 92:  # changed the factor by 93 from 90 for better accuracy
-        matched_cols[col1] = match
-        print(f"   ✅ Matched: '{col1}' → '{match}' (score: {score})")
-    else:
-        unmatched_cols.append(col1)
-        print(f"   ❌ No match: '{col1}' (best: '{match}', score: {score})")
+def data_columns(columns, key_columns):
+    """Only include actual data columns, exclude key columns and any remaining normalized columns."""
+    return [c for c in columns if c not in key_columns and c != '__key__' and not c.endswith('_normalized')]
+
+def column_score_matrix(sheet1_cols, sheet2_cols):
+    """WRatio score of every source/target column pair in one batched, multi-core call."""
+    if not sheet1_cols or not sheet2_cols:
+        return np.zeros((len(sheet1_cols), len(sheet2_cols)), dtype=int)
+    from rapidfuzz import fuzz, process, utils
+    scores = process.cdist(sheet1_cols, sheet2_cols, scorer=fuzz.WRatio, processor=utils.default_process, workers=-1)
+    return np.rint(scores).astype(int)
+
+# Column mappings already computed in this process, keyed by both header lists
+COLUMN_MATCH_CACHE = {}
+
+def match_columns(sheet1_cols, sheet2_cols):
+    """One-to-one fuzzy pairing of data columns.
 
-# Find unmatched columns in sheet2
-matched_sheet2_cols = set(matched_cols.values())
-unmatched_sheet2 = [col for col in sheet2_cols if col not in matched_sheet2_cols]
+    Returns (matched_cols, unmatched_cols, unmatched_sheet2, match_scores) where
+    match_scores holds the score of each matched source column. Identical header
+    lists reuse the mapping computed earlier in the same process.
+    """
+    cache_key = (tuple(sheet1_cols), tuple(sheet2_cols), COLUMN_MATCH_SCORE)
+    if cache_key in COLUMN_MATCH_CACHE:
+        print(f"\n♻️ Reusing column mapping for identical headers")
+        return copy.deepcopy(COLUMN_MATCH_CACHE[cache_key])
 
-print(f"\n📊 Matching Results:")
-print(f"   ✅ Successfully matched: {len(matched_cols)} pairs")
-print(f"   ❌ Unmatched in Sheet1: {len(unmatched_cols)}")
-print(f"   ❌ Unmatched in Sheet2: {len(unmatched_sheet2)}")
+    print(f"\n🔍 Starting fuzzy column matching...")
+    print(f"   Source columns: {len(sheet1_cols)}")
+    print(f"   Target columns: {len(sheet2_cols)}")
 
-if unmatched_cols:
-    print(f"   📝 Unmatched Sheet1 columns: {unmatched_cols}")
-if unmatched_sheet2:
-    print(f"   📝 Unmatched Sheet2 columns: {unmatched_sheet2}")
+    # Identical headers pair up directly; only the rest go through the fuzzy score matrix
+    sheet2_col_set = set(sheet2_cols)
+    exact_cols = [col for col in sheet1_cols if col in sheet2_col_set]
+    fuzzy_cols1 = [col for col in sheet1_cols if col not in sheet2_col_set]
+    fuzzy_cols2 = [col for col in sheet2_cols if col not in set(exact_cols)]
+    scores = column_score_matrix(fuzzy_cols1, fuzzy_cols2)
+
+    # Optimal assignment over pairs that clear the threshold, so no target is claimed twice
+    eligible = np.where(scores >= COLUMN_MATCH_SCORE, scores, 0)
+    assigned = {}
+    if eligible.any():
+        from scipy.optimize import linear_sum_assignment
+        assigned = dict(zip(*linear_sum_assignment(eligible, maximize=True)))
+
+    pairs = {col: (col, 100) for col in exact_cols}
+    best_candidates = {}
+    for i, col1 in enumerate(fuzzy_cols1):
+        j = assigned.get(i)
+        if j is not None and eligible[i, j] > 0:
+            pairs[col1] = (fuzzy_cols2[j], int(scores[i, j]))
+        elif fuzzy_cols2:
+            best = int(np.argmax(scores[i]))
+            best_candidates[col1] = (fuzzy_cols2[best], int(scores[i, best]))
+
+    matched_cols, unmatched_cols, match_scores = {}, [], {}
+    for col1 in sheet1_cols:
+        if col1 in pairs:
+            match, score = pairs[col1]
+            matched_cols[col1] = match
+            match_scores[col1] = score
+            print(f"   ✅ Matched: '{col1}' → '{match}' (score: {score})")
+        else:
+            unmatched_cols.append(col1)
+            if col1 in best_candidates:
+                match, score = best_candidates[col1]
+                print(f"   ❌ No match: '{col1}' (best: '{match}', score: {score})")
+            else:
+                print(f"   ❌ No match: '{col1}' (no target columns left)")
+
+    # Find unmatched columns in sheet2
+    matched_sheet2_cols = set(matched_cols.values())
+    unmatched_sheet2 = [col for col in sheet2_cols if col not in matched_sheet2_cols]
+
+    print(f"\n📊 Matching Results:")
+    print(f"   ✅ Successfully matched: {len(matched_cols)} pairs")
+    print(f"   ❌ Unmatched in Sheet1: {len(unmatched_cols)}")
+    print(f"   ❌ Unmatched in Sheet2: {len(unmatched_sheet2)}")
+
+    if unmatched_cols:
+        print(f"   📝 Unmatched Sheet1 columns: {unmatched_cols}")
+    if unmatched_sheet2:
+        print(f"   📝 Unmatched Sheet2 columns: {unmatched_sheet2}")
+
+    COLUMN_MATCH_CACHE[cache_key] = copy.deepcopy((matched_cols, unmatched_cols, unmatched_sheet2, match_scores))
+    return matched_cols, unmatched_cols, unmatched_sheet2, match_scores
 
 # === Build Side-by-side Sheet (Common Keys Only) ===
-sheet1_comparison_result = pd.DataFrame(index=sheet1_common.index)
-for col1 in sheet1_cols:
-    sheet1_comparison_result[col1] = sheet1_common[col1]
-    if col1 in matched_cols:
-        col2 = matched_cols[col1]
-        sheet1_comparison_result[f"{col2} (target)"] = sheet2_common[col2]
+def build_side_by_side(sheet1_common, sheet2_common, sheet1_cols, matched_cols, key_columns):
+    """Source columns next to their matched target columns, composite and original keys first.
+
+    The frame is assembled from the columns' own arrays, so it shares memory with the common rows.
+    """
+    # Composite key, then the original key columns (last key first)
+    columns = {'__key__': sheet1_common.index.array}
+    for key in reversed(key_columns):
+        columns[key] = sheet1_common[key].array
+    for col1 in sheet1_cols:
+        columns[col1] = sheet1_common[col1].array
+        if col1 in matched_cols:
+            col2 = matched_cols[col1]
+            columns[f"{col2} (target)"] = sheet2_common[col2].array
+        else:
+            columns[f"Missing (target)"] = "Missing in Target"
+    return pd.DataFrame(columns, index=sheet1_common.index, copy=False)
+
+# === Vectorized Value Comparison ===
+POLICY_OPTIONS = {'abs_tol', 'rel_tol', 'round', 'dates', 'case_insensitive', 'empty_values'}
+
+def column_policy(col1, col2, series1, series2, policies=None):
+    """Comparison policy of a column pair: the inferred-dtype policy overridden by the
+    policy named after the source (or else the target) column."""
+    policies = COLUMN_POLICIES if policies is None else policies
+    if pd.api.types.is_datetime64_any_dtype(series1) or pd.api.types.is_datetime64_any_dtype(series2):
+        kind = 'datetime'
+    elif all(pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series) for series in (series1, series2)):
+        kind = 'numeric'
     else:
-        sheet1_comparison_result[f"Missing (target)"] = "Missing in Target"
-
-# Insert composite key
-sheet1_comparison_result.insert(0, '__key__', sheet1_comparison_result.index)
-
-# Create mapping for original key values (common keys only)
-key_to_original_sheet1 = {}
-key_to_original_sheet2 = {}
-
-# Get original indices for common keys
-original_sheet1_indices = []
-original_sheet2_indices = []
-
-for comp_key in common_keys:
-    # Find original index in sheet1
-    orig_idx1 = sheet1.index.get_loc(comp_key)
-    original_sheet1_indices.append(orig_idx1)
-    key_to_original_sheet1[comp_key] = {key: original_keys_sheet1[key].iloc[orig_idx1] for key in key_columns}
-    
-    # Find original index in sheet2  
-    orig_idx2 = sheet2.index.get_loc(comp_key)
-    original_sheet2_indices.append(orig_idx2)
-    key_to_original_sheet2[comp_key] = {key: original_keys_sheet2[key].iloc[orig_idx2] for key in key_columns}
-
-# Insert original key columns
-for idx, key in enumerate(reversed(key_columns), 1):
-    original_values = [key_to_original_sheet1[comp_key][key] for comp_key in sheet1_comparison_result.index]
-    sheet1_comparison_result.insert(idx, key, original_values)
-
-def are_values_equal_enhanced(v1, v2):
-    """Enhanced comparison with more robust empty value handling."""
-    
-    def normalize_value(val):
-        """Normalize a value to a standard form for comparison."""
-        if pd.isna(val) or val is None:
-            return 0  # Treat NaN/None as equivalent to 0
-        
-        # Handle numeric values
-        if isinstance(val, (int, float)):
-            if val == 0 or val == 0.0 or val == 0.00:
-                return 0
-            return val
-        
-        # Handle string values
-        if isinstance(val, str):
-            cleaned = val.strip()
-            
-            # Check for various empty representations - treat them as equivalent to 0
-            if cleaned in ['', '0', '0.00', '0.0', 'nan', 'null', 'none', 'Not assigned', '-', '*', '#',' ']:
-                return 0
-            
-            # Try to convert to number if it looks like one
-            try:
-                num_val = float(cleaned)
-                if num_val == 0.0:
-                    return 0
-                return num_val
-            except (ValueError, TypeError):
-                return cleaned
-        
-        # Try to convert other types to string and normalize
-        str_val = str(val).strip()
-        if str_val in ['', '0', '0.00', '0.0', 'nan', 'null', 'none', 'Not assigned', '-', '*','#', ' ']:
-            return 0
-        
-        try:
-            num_val = float(str_val)
-            if num_val == 0.0:
-                return 0
-            return num_val
-        except (ValueError, TypeError):
-            return str_val
-    
-    # Normalize both values
-    norm_v1 = normalize_value(v1)
-    norm_v2 = normalize_value(v2)
-    
-    # Compare normalized values
-    if norm_v1 == 0 and norm_v2 == 0:
-        return True  # Both are zero/equivalent (including NaN, None, empty strings, etc.)
-    
-    return norm_v1 == norm_v2
+        kind = 'text'
+    policy = dict(policies.get(kind, {}))
+    policy.update(policies.get(col1, policies.get(col2, {})))
+
+    unknown = set(policy) - POLICY_OPTIONS
+    if unknown:
+        raise ValueError(f"Unknown comparison policy options for '{col1}': {sorted(unknown)}")
+    if policy.get('dates') not in (None, 'date', 'datetime'):
+        raise ValueError(f"Comparison policy 'dates' for '{col1}' must be 'date' or 'datetime'")
+    return policy
+
+def normalize_comparison_column(series, policy=None):
+    """Normalize a whole column once for comparison.
+
+    Returns (zero_mask, numeric_values, text_values) where empty-like cells
+    (NaN/None, 0, and EMPTY_LIKE_VALUES or the policy's empty_values) are flagged
+    in zero_mask, numeric cells carry their float value (rounded per policy) and
+    everything else its stripped (optionally case-folded) text.
+    """
+    policy = policy or {}
+    empty_values = policy.get('empty_values', EMPTY_LIKE_VALUES)
+
+    # Boolean columns compare by their 'True'/'False' text, like the cell-by-cell comparison did
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        numeric = series.to_numpy(dtype=float, na_value=np.nan, copy=True)
+        if policy.get('round') is not None:
+            numeric = np.round(numeric, policy['round'])
+        zero = np.isnan(numeric) | (numeric == 0)
+        numeric[zero] = np.nan
+        text = np.full(len(series), None, dtype=object)
+        return zero, numeric, text
+
+    missing = series.isna().to_numpy()
+    text = column_to_text(series).str.strip()
+
+    zero = missing | text.isin(empty_values).to_numpy()
+    numeric = pd.to_numeric(text.where(~zero), errors='coerce').to_numpy(dtype=float, na_value=np.nan, copy=True)
+    python_bools = object_bool_mask(series)
+    if python_bools is not None:
+        numeric[python_bools] = series[python_bools].to_numpy(dtype=float)  # bool cells of object columns count as 1/0
+    if policy.get('round') is not None:
+        numeric = np.round(numeric, policy['round'])
+    zero |= (numeric == 0)
+    is_number = ~np.isnan(numeric) & ~zero
+    numeric[~is_number] = np.nan
+
+    if policy.get('case_insensitive'):
+        text = text.str.casefold()
+    text = text.to_numpy(dtype=object, copy=True)
+    text[zero | is_number] = None
+    return zero, numeric, text
+
+def object_bool_mask(series):
+    """Boolean mask of the Python bool cells of an object column, or None when there are none."""
+    if not pd.api.types.is_object_dtype(series):
+        return None
+    if pd.api.types.infer_dtype(series, skipna=True) not in ('boolean', 'mixed', 'mixed-integer', 'mixed-integer-float'):
+        return None
+    mask = series.map(type).eq(bool).to_numpy()
+    return mask if mask.any() else None
+
+def comparison_datetimes(series, resolution):
+    """Column parsed as datetimes (NaT where it is not a date), floored to the day for 'date'."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series
+    elif pd.api.types.is_numeric_dtype(series):
+        return pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')  # numbers are not dates
+    else:
+        values = pd.to_datetime(column_to_text(series).str.strip(), errors='coerce', format='mixed')
+    if getattr(values.dt, 'tz', None) is not None:
+        values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+    return values.dt.normalize() if resolution == 'date' else values
+
+def exact_integer_columns(series1, series2, policy):
+    """True for two NumPy integer columns whose policy has no tolerance, rounding or dates."""
+    return (series1.dtype.kind in 'iu' and series2.dtype.kind in 'iu' and isinstance(series1.dtype, np.dtype)
+            and isinstance(series2.dtype, np.dtype) and not set(policy) & {'abs_tol', 'rel_tol', 'round', 'dates'})
+
+def compare_columns_vectorized(series1, series2, policy=None):
+    """Element-wise equality of two aligned columns, empty-like values are equivalent.
+
+    The policy adds an absolute/relative numeric tolerance, rounding, date or
+    datetime comparison of parsed dates, case-insensitive text and its own empty tokens.
+    """
+    policy = policy or {}
+    if exact_integer_columns(series1, series2, policy):
+        # Integers compare exactly; as floats, values above 2**53 would collapse together
+        return series1.to_numpy() == series2.to_numpy()
+    zero1, num1, text1 = normalize_comparison_column(series1, policy)
+    zero2, num2, text2 = normalize_comparison_column(series2, policy)
+
+    both_zero = zero1 & zero2
+    abs_tol, rel_tol = policy.get('abs_tol', 0), policy.get('rel_tol', 0)
+    if abs_tol or rel_tol:
+        with np.errstate(invalid='ignore'):
+            allowed = np.maximum(abs_tol, rel_tol * np.maximum(np.abs(num1), np.abs(num2)))
+            # NaN never within tolerance; equal infinities still match, as identical rows do in differing_rows()
+            numbers_equal = (np.abs(num1 - num2) <= allowed) | (num1 == num2)
+    else:
+        numbers_equal = num1 == num2  # NaN never compares equal
+    text_present = pd.notna(text1) & pd.notna(text2)
+    texts_equal = np.zeros(len(text1), dtype=bool)
+    texts_equal[text_present] = text1[text_present] == text2[text_present]
+    equal = both_zero | numbers_equal | texts_equal
+
+    if policy.get('dates'):
+        dates1 = comparison_datetimes(series1, policy['dates']).to_numpy()
+        dates2 = comparison_datetimes(series2, policy['dates']).to_numpy()
+        equal |= ~pd.isna(dates1) & (dates1 == dates2)
+    return equal
 
 # === Build Comparison (Common Keys Only) ===
-comparison = pd.DataFrame(index=sheet1_common.index)
-for col1, col2 in matched_cols.items():
-    val1 = sheet1_common[col1]
-    val2 = sheet2_common[col2]
-    comparison[col1] = [are_values_equal_enhanced(val1.iloc[i], val2.iloc[i]) for i in range(len(val1))]
+def column_pair_policies(matched_cols, sheet1, sheet2):
+    """column_policy() of every matched pair, keyed by the Sheet1 column; sheet1/sheet2 only lend their dtypes."""
+    return {col1: column_policy(col1, col2, sheet1[col1], sheet2[col2]) for col1, col2 in matched_cols.items()}
+
+def build_comparison(sheet1_common, sheet2_common, matched_cols, unmatched_cols, compare_rows=None, lean=False, policies=None):
+    """Boolean match frame per matched column; unmatched source columns are flagged as missing.
+
+    The matched columns share one boolean NumPy matrix (one byte per cell). With a
+    compare_rows mask only those rows are compared, all others count as matching.
+    With lean=True the missing flags are one-byte categorical codes instead of strings.
+    policies (see column_pair_policies()) default to the dtypes of the frames compared.
+    """
+    if policies is None:
+        policies = column_pair_policies(matched_cols, sheet1_common, sheet2_common)
+    matches = np.ones((len(sheet1_common), len(matched_cols)), dtype=bool, order='F')
+    if compare_rows is None:
+        for position, (col1, col2) in enumerate(matched_cols.items()):
+            matches[:, position] = compare_columns_vectorized(sheet1_common[col1], sheet2_common[col2], policies[col1])
+    else:
+        positions = np.flatnonzero(compare_rows)
+        subset1 = sheet1_common.iloc[positions]
+        subset2 = sheet2_common.iloc[positions]
+        for position, (col1, col2) in enumerate(matched_cols.items()):
+            matches[positions, position] = compare_columns_vectorized(subset1[col1], subset2[col2], policies[col1])
+    comparison = pd.DataFrame(matches, index=sheet1_common.index, columns=list(matched_cols), copy=False)
+
+    for col1 in unmatched_cols:
+        if lean:
+            comparison[col1] = pd.Categorical.from_codes(np.zeros(len(comparison), dtype=np.int8), ["Missing in Sheet2"])
+        else:
+            comparison[col1] = "Missing in Sheet2"
+
+    return comparison
+
+def mismatch_rows(comparison, compare_rows=None):
+    """Boolean mask of rows with at least one mismatching cell, scanning only the compared rows."""
+    if compare_rows is None:
+        return (comparison == False).any(axis=1).to_numpy()
+    positions = np.flatnonzero(compare_rows)
+    mask = np.zeros(len(comparison), dtype=bool)
+    mask[positions] = (comparison.iloc[positions] == False).any(axis=1).to_numpy()
+    return mask
+
+def count_mismatches(comparison, matched_cols):
+    """Number of False cells per matched column."""
+    return {col: int((~comparison[col].astype(bool)).sum()) for col in matched_cols}
+
+# === Row Digests (short-circuit and incremental state) ===
+def row_digests(frame, columns):
+    """uint64 digest per row over the given columns (in order), from the raw cell values."""
+    digests = np.zeros(len(frame), dtype=np.uint64)
+    for col in columns:
+        values = frame[col]
+        if values.dtype.kind in 'iuf' and values.dtype.itemsize < 8:
+            values = values.astype(f'{values.dtype.kind}8')  # downcast numbers hash like their 64-bit values
+        column_hash = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        if frame[col].dtype.kind in 'mM':
+            column_hash = column_hash ^ np.uint64(0x9E3779B97F4A7C15)  # dates never hash like their int64 storage
+        elif pd.api.types.is_bool_dtype(frame[col]):
+            column_hash = column_hash ^ np.uint64(0xC2B2AE3D27D4EB4F)  # True/False hash like 1/0 but compare as text
+        python_bools = object_bool_mask(frame[col])
+        if python_bools is not None:
+            column_hash = column_hash.copy()
+            column_hash[python_bools] ^= np.uint64(0x165667B19E3779F9)  # bool cells hash like 'True' but count as 1/0
+        digests = digests * np.uint64(1000003) ^ column_hash
+    return digests
+
+def differing_rows(sheet1_common, sheet2_common, matched_cols):
+    """Rows whose raw matched values differ between the sheets.
 
-for col1 in unmatched_cols:
-    comparison[col1] = "Missing in Sheet2"
+    Equal digests mean values that normalize identically (row_digests() tags the
+    dtypes pandas hashes alike but that compare differently, such as True vs 1), so
+    all other rows match; rows that only match after normalization (e.g. 5 vs '5')
+    are flagged here too.
+    """
+    return row_digests(sheet1_common, list(matched_cols)) != row_digests(sheet2_common, list(matched_cols.values()))
+
+def state_signature(key_columns, matched_cols):
+    """Stored digests are only reusable for the same keys, column pairs and comparison rules."""
+    settings = [list(key_columns), sorted(matched_cols.items()), EMPTY_LIKE_VALUES, COLUMN_POLICIES]
+    return hashlib.sha256(json.dumps(settings, default=str, sort_keys=True).encode()).hexdigest()
+
+def unchanged_matching_rows(previous_state, signature, keys, source_digests, target_digests):
+    """Rows whose digests on both sides equal the stored ones and that fully matched last time."""
+    if not previous_state or previous_state.get('signature') != signature:
+        return np.zeros(len(keys), dtype=bool)
+    previous = previous_state['rows']
+    previous = previous[~previous.index.duplicated()]
+    positions = previous.index.get_indexer(keys)
+    found = positions >= 0
+    rows = positions[found]
+    unchanged = np.zeros(len(keys), dtype=bool)
+    unchanged[found] = ((previous['source_digest'].to_numpy()[rows] == source_digests[found])
+                        & (previous['target_digest'].to_numpy()[rows] == target_digests[found])
+                        & previous['all_match'].to_numpy()[rows])
+    return unchanged
+
+def load_incremental_state(path):
+    """Saved state of the previous run, or None on the first run."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as handle:
+        return pickle.load(handle)
+
+def save_incremental_state(path, state):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as handle:
+        pickle.dump(state, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
 
 # === Overall result Sheet ===
-column_status = []
-for col2 in unmatched_sheet2: 
-    column_status.append({'Column': col2, 'Status': 'Missing in Source', 'KPI': 'FAIL'})
-for col1 in unmatched_cols: 
-    column_status.append({'Column': col1, 'Status': 'Missing in Target', 'KPI': 'FAIL'})
-for col in matched_cols:
-    if comparison[col].dtype == bool:
-        if comparison[col].all():
+def build_column_status(mismatch_counts, common_row_count, unmatched_cols, unmatched_sheet2):
+    """PASS/FAIL report card per column."""
+    column_status = []
+    for col2 in unmatched_sheet2:
+        column_status.append({'Column': col2, 'Status': 'Missing in Source', 'KPI': 'FAIL'})
+    for col1 in unmatched_cols:
+        column_status.append({'Column': col1, 'Status': 'Missing in Target', 'KPI': 'FAIL'})
+    for col, mismatch_count in mismatch_counts.items():
+        if mismatch_count == 0:
             column_status.append({'Column': col, 'Status': 'All values match', 'KPI': 'PASS'})
         else:
-            mismatch_count = (~comparison[col]).sum()
-            column_status.append({'Column': col, 'Status': f'Mismatches: {mismatch_count}/{len(comparison[col])}', 'KPI': 'FAIL'})
-column_status_df = pd.DataFrame(column_status)
+            column_status.append({'Column': col, 'Status': f'Mismatches: {mismatch_count}/{common_row_count}', 'KPI': 'FAIL'})
+    return pd.DataFrame(column_status)
 
 # === Column Mapping Sheet ===
-column_comparison_data = []
-for col1, col2 in matched_cols.items(): 
-    # Get the actual score from the matching process
-    _, score = process.extractOne(col1, sheet2_cols)
-    column_comparison_data.append({'Source_Column': col1, 'Target_Column': col2, 'Match_Status': 'Matched', 'Fuzzy_Score': score})
-
-for col1 in unmatched_cols: 
-    column_comparison_data.append({'Source_Column': col1, 'Target_Column': 'Not Found', 'Match_Status': 'Missing in Target', 'Fuzzy_Score': 'N/A'})
-for col2 in unmatched_sheet2: 
-    column_comparison_data.append({'Source_Column': 'Not Found', 'Target_Column': col2, 'Match_Status': 'Missing in Source', 'Fuzzy_Score': 'N/A'})
-column_comparison_df = pd.DataFrame(column_comparison_data)
+def build_column_mapping(matched_cols, unmatched_cols, unmatched_sheet2, match_scores):
+    """How source columns were paired with target columns, reusing the matcher's scores."""
+    column_comparison_data = []
+    for col1, col2 in matched_cols.items():
+        column_comparison_data.append({'Source_Column': col1, 'Target_Column': col2, 'Match_Status': 'Matched', 'Fuzzy_Score': match_scores[col1]})
+
+    for col1 in unmatched_cols:
+        column_comparison_data.append({'Source_Column': col1, 'Target_Column': 'Not Found', 'Match_Status': 'Missing in Target', 'Fuzzy_Score': 'N/A'})
+    for col2 in unmatched_sheet2:
+        column_comparison_data.append({'Source_Column': 'Not Found', 'Target_Column': col2, 'Match_Status': 'Missing in Source', 'Fuzzy_Score': 'N/A'})
+    return pd.DataFrame(column_comparison_data)
 
 # === Mismatch Details (Common Keys Only) ===
-mismatch_rows_mask = (comparison == False).any(axis=1)
+def build_mismatch_details(sheet1_comparison_result, mismatch_rows_mask, column_status_df, matched_cols, key_columns):
+    """Mismatching rows restricted to key columns and failed columns (source and target)."""
+    # Use Overall Result sheet to identify failed columns
+    failed_columns = column_status_df[column_status_df['KPI'] == 'FAIL']['Column'].tolist()
 
-# NEW: Use Overall Result sheet to identify failed columns
-failed_columns = column_status_df[column_status_df['KPI'] == 'FAIL']['Column'].tolist()
+    # Build final mismatch columns list - only include failed columns
+    final_mismatch_cols = ['__key__'] + key_columns
 
-# Build final mismatch columns list - only include failed columns
-final_mismatch_cols = ['__key__'] + key_columns
+    # Add only failed columns (both source and target versions)
+    for col1 in failed_columns:
+        if col1 in sheet1_comparison_result.columns:
+            final_mismatch_cols.append(col1)
+            # Add corresponding target column if it exists
+            if col1 in matched_cols:
+                col2 = matched_cols[col1]
+                target_col_name = f"{col2} (target)"
+                if target_col_name in sheet1_comparison_result.columns:
+                    final_mismatch_cols.append(target_col_name)
 
-# Add only failed columns (both source and target versions)
-for col1 in failed_columns:
-    if col1 in sheet1_comparison_result.columns:
-        final_mismatch_cols.append(col1)
-        # Add corresponding target column if it exists
-        if col1 in matched_cols:
-            col2 = matched_cols[col1]
-            target_col_name = f"{col2} (target)"
-            if target_col_name in sheet1_comparison_result.columns:
-                final_mismatch_cols.append(target_col_name)
-
-# Filter to only available columns
-available_cols = [col for col in final_mismatch_cols if col in sheet1_comparison_result.columns]
-mismatch_df = sheet1_comparison_result.loc[mismatch_rows_mask, available_cols].copy()
-
-# === NEW: Create Extra Rows Sheet ===
-extra_rows_data = []
-
-# Add extra rows from Sheet1 (Yellow)
-if extra_in_sheet1:
-    for key in extra_in_sheet1:
-        row_data = {'__key__': key, 'Source': 'Sheet1 Only'}
-        
-        # Add original key values
-        orig_idx = sheet1.index.get_loc(key)
-        for col in key_columns:
-            row_data[col] = original_keys_sheet1[col].iloc[orig_idx]
-        
-        # Add all other columns from sheet1
-        for col in sheet1.columns:
-            if col not in key_columns:
-                row_data[f'{col} (Sheet1)'] = sheet1.loc[key, col]
-        
-        extra_rows_data.append(row_data)
-
-# Add extra rows from Sheet2 (Blue)
-if extra_in_sheet2:
-    for key in extra_in_sheet2:
-        row_data = {'__key__': key, 'Source': 'Sheet2 Only'}
-        
-        # Add original key values
-        orig_idx = sheet2.index.get_loc(key)
-        for col in key_columns:
-            row_data[col] = original_keys_sheet2[col].iloc[orig_idx]
-        
-        # Add all other columns from sheet2
-        for col in sheet2.columns:
-            if col not in key_columns:
-                row_data[f'{col} (Sheet2)'] = sheet2.loc[key, col]
-        
-        extra_rows_data.append(row_data)
-
-# Create DataFrame for extra rows
-if extra_rows_data:
-    extra_rows_df = pd.DataFrame(extra_rows_data)
-    # Reorder columns to have key columns first
-    cols_order = ['__key__', 'Source'] + key_columns + [col for col in extra_rows_df.columns if col not in (['__key__', 'Source'] + key_columns)]
-    extra_rows_df = extra_rows_df.reindex(columns=cols_order)
-else:
-    extra_rows_df = pd.DataFrame()
+    # Filter to only available columns
+    available_cols = [col for col in final_mismatch_cols if col in sheet1_comparison_result.columns]
+    return sheet1_comparison_result.loc[mismatch_rows_mask, available_cols]
+
+# === Create Extra Rows Sheet ===
+def build_extra_rows(sheet, rows, sheet_label, key_columns):
+    """One-sided rows with key columns first and data columns suffixed by the sheet label."""
+    extra = sheet.iloc[rows]
+    data_cols = [col for col in extra.columns if col not in key_columns]
+    frame = pd.concat([extra[key_columns], extra[data_cols].add_suffix(f' ({sheet_label})')], axis=1)
+    frame.insert(0, 'Source', f'{sheet_label} Only')
+    frame.insert(0, '__key__', extra.index)
+    return frame.reset_index(drop=True)
+
+def combine_extra_rows(extra_frames):
+    """Stack Sheet1-only (Yellow) and Sheet2-only (Blue) frames."""
+    extra_frames = [frame for frame in extra_frames if len(frame)]
+    if extra_frames:
+        return pd.concat(extra_frames, ignore_index=True)
+    return pd.DataFrame()
+
+# === Near-miss Keys (Extra Rows) ===
+def near_miss_candidates(left, right, block_columns, max_block_pairs):
+    """Candidate (left, right) row pairs sharing every block column value.
+
+    Blocks with more than max_block_pairs pairs (e.g. a prefix every document shares)
+    are skipped; the other blocking key usually still covers their rows.
+    """
+    sizes = pd.merge(left.groupby(block_columns).size().rename('left_size').reset_index(),
+                     right.groupby(block_columns).size().rename('right_size').reset_index(), on=block_columns)
+    sizes = sizes[sizes['left_size'] * sizes['right_size'] <= max_block_pairs][block_columns]
+    left = left.merge(sizes, on=block_columns)
+    return left.merge(right, on=block_columns, suffixes=('_sheet1', '_sheet2'))[['row_sheet1', 'row_sheet2', 'value_sheet1', 'value_sheet2']]
+
+def pair_mutual_best(candidates):
+    """One-to-one pairs: repeatedly accept pairs that are the best option of both their rows."""
+    accepted = []
+    while len(candidates):
+        best_for_left = candidates['score'] == candidates.groupby('row_sheet1')['score'].transform('max')
+        best_for_right = candidates['score'] == candidates.groupby('row_sheet2')['score'].transform('max')
+        mutual = candidates[best_for_left & best_for_right].drop_duplicates('row_sheet1').drop_duplicates('row_sheet2')
+        accepted.append(mutual)
+        candidates = candidates[~candidates['row_sheet1'].isin(mutual['row_sheet1'])
+                                & ~candidates['row_sheet2'].isin(mutual['row_sheet2'])]
+    return pd.concat(accepted) if accepted else candidates
+
+def find_near_miss_keys(extra_rows_df, key_columns, min_score=None, block_length=None, max_block_pairs=None):
+    """Suggest Sheet1-only / Sheet2-only rows whose keys differ in one component only.
+
+    For each key column in turn, candidates must agree exactly on all other key columns
+    and share the first or last block_length characters of this one; only those pairs
+    are fuzzy-scored, so the cost follows the block sizes instead of n x m.
+    """
+    from rapidfuzz import fuzz, process
+
+    min_score = NEAR_MISS_MIN_SCORE if min_score is None else min_score
+    block_length = NEAR_MISS_BLOCK_LENGTH if block_length is None else block_length
+    max_block_pairs = NEAR_MISS_MAX_BLOCK_PAIRS if max_block_pairs is None else max_block_pairs
+    columns = ['Sheet1 Key', 'Sheet2 Key', 'Differing Column', 'Sheet1 Value', 'Sheet2 Value', 'Score']
+    if not len(extra_rows_df):
+        return pd.DataFrame(columns=columns)
+
+    sides = {}
+    for side, label in (('sheet1', 'Sheet1 Only'), ('sheet2', 'Sheet2 Only')):
+        rows = extra_rows_df[extra_rows_df['Source'] == label]
+        sides[side] = pd.DataFrame({col: normalize_key_column(rows[col]).to_numpy() for col in key_columns})
+        sides[side]['row'] = np.arange(len(rows))
+        sides[side]['__key__'] = rows['__key__'].to_numpy()
+    paired = {'sheet1': set(), 'sheet2': set()}
+
+    suggestions = []
+    for fuzzy_col in key_columns:
+        other_cols = [col for col in key_columns if col != fuzzy_col]
+        left = sides['sheet1'][~sides['sheet1']['row'].isin(paired['sheet1'])]
+        right = sides['sheet2'][~sides['sheet2']['row'].isin(paired['sheet2'])]
+        if not len(left) or not len(right):
+            break
+        left = left[other_cols + ['row']].assign(value=left[fuzzy_col])
+        right = right[other_cols + ['row']].assign(value=right[fuzzy_col])
+
+        candidates = pd.concat([
+            near_miss_candidates(left.assign(block=left['value'].str[:block_length]),
+                                 right.assign(block=right['value'].str[:block_length]), other_cols + ['block'], max_block_pairs),
+            near_miss_candidates(left.assign(block=left['value'].str[-block_length:]),
+                                 right.assign(block=right['value'].str[-block_length:]), other_cols + ['block'], max_block_pairs),
+        ]).drop_duplicates(['row_sheet1', 'row_sheet2'])
+        candidates = candidates[candidates['value_sheet1'] != candidates['value_sheet2']]
+        if not len(candidates):
+            continue
+
+        candidates = candidates.assign(score=process.cpdist(candidates['value_sheet1'].tolist(), candidates['value_sheet2'].tolist(),
+                                                            scorer=fuzz.WRatio, workers=-1))
+        pairs = pair_mutual_best(candidates[candidates['score'] >= min_score])
+        paired['sheet1'].update(pairs['row_sheet1'])
+        paired['sheet2'].update(pairs['row_sheet2'])
+        suggestions.append(pd.DataFrame({
+            'Sheet1 Key': sides['sheet1']['__key__'].to_numpy()[pairs['row_sheet1'].to_numpy()],
+            'Sheet2 Key': sides['sheet2']['__key__'].to_numpy()[pairs['row_sheet2'].to_numpy()],
+            'Differing Column': fuzzy_col,
+            'Sheet1 Value': pairs['value_sheet1'].to_numpy(),
+            'Sheet2 Value': pairs['value_sheet2'].to_numpy(),
+            'Score': np.rint(pairs['score'].to_numpy()).astype(int),
+        }))
+
+    suggestions = [frame for frame in suggestions if len(frame)]
+    if not suggestions:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(suggestions, ignore_index=True).sort_values('Score', ascending=False, kind='stable').reset_index(drop=True)
 
 # === Write to Excel ===
-with pd.ExcelWriter(output_file, engine="openpyxl") as writer:
-    sheet1.reset_index().to_excel(writer, sheet_name="Source Data", index=False)
-    sheet2.reset_index().to_excel(writer, sheet_name="Target Data", index=False)
-    comparison.reset_index().to_excel(writer, sheet_name="Row Comparison", index=False)
-    column_status_df.to_excel(writer, sheet_name="Overall Result", index=False)
-    column_comparison_df.to_excel(writer, sheet_name="Column Mapping", index=False)
-    sheet1_comparison_result.reset_index(drop=True).to_excel(writer, sheet_name="Side by Side Result", index=False)
-    mismatch_df.reset_index(drop=True).to_excel(writer, sheet_name="Mismatch Details", index=False)
-    extra_rows_df.to_excel(writer, sheet_name="Extra Rows Analysis", index=False)  # NEW SHEET
-
-# === Apply color formatting ===
-wb = load_workbook(output_file)
-orange_fill = PatternFill(start_color="FFE4B5", end_color="FFE4B5", fill_type="solid")
-grey_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-yellow_fill = PatternFill(start_color="FFFF99", end_color="FFFF99", fill_type="solid")  # Sheet1 extra rows
-blue_fill = PatternFill(start_color="ADD8E6", end_color="ADD8E6", fill_type="solid")    # Sheet2 extra rows
-
-def auto_fit_columns_simple(worksheet):
-    for column_cells in worksheet.columns:
-        length = max(len(str(cell.value or "")) for cell in column_cells)
-        worksheet.column_dimensions[get_column_letter(column_cells[0].column)].width = length + 4
-
-sheet_names = wb.sheetnames
-for sheet_name in sheet_names:
-    auto_fit_columns_simple(wb[sheet_name])
-
-# Color Side by Side Result
-ws_sbs = wb["Side by Side Result"]
-for col_idx in range(1, ws_sbs.max_column + 1):
-    header = ws_sbs.cell(row=1, column=col_idx).value
-    if not header: continue
-    fill = None
-    if header in key_columns or header == '__key__': fill = orange_fill
-    elif header.endswith("(target)"): fill = grey_fill
-    if fill:
-        for row_num in range(1, ws_sbs.max_row + 1):
-            ws_sbs[f"{get_column_letter(col_idx)}{row_num}"].fill = fill
-
-# Color Overall Result
-ws_or = wb["Overall Result"]
-for row in ws_or.iter_rows(min_row=2):
-    kpi = row[2].value
-    fill = green_fill if kpi == "PASS" else red_fill if kpi == "FAIL" else None
-    if fill:
-        for cell in row: cell.fill = fill
-
-# Color Column Mapping
-ws_cm = wb["Column Mapping"]
-for row in ws_cm.iter_rows(min_row=2):
-    status = row[2].value
-    fill = green_fill if status == "Matched" else red_fill if "Missing" in status else None
-    if fill:
-        for cell in row: cell.fill = fill
-
-# Color Mismatch Details Sheet
-if "Mismatch Details" in wb.sheetnames and len(mismatch_df) > 0:
-    ws_md = wb["Mismatch Details"]
-    headers = [cell.value for cell in ws_md[1]]
-    
-    mismatch_comparison_df = comparison[mismatch_rows_mask].copy()
-
-    for r_idx, row in enumerate(ws_md.iter_rows(min_row=2), start=2):
-        row_key = row[0].value
-        for c_idx, cell in enumerate(row, start=1):
-            header = headers[c_idx - 1]
-            original_col_name = header.replace(" (target)", "")
-
-            if original_col_name in mismatch_comparison_df.columns:
-                is_match = mismatch_comparison_df.loc[row_key, original_col_name]
-                if is_match == False:
-                    cell.fill = red_fill
-
-# NEW: Color Extra Rows Analysis Sheet
-if "Extra Rows Analysis" in wb.sheetnames and len(extra_rows_df) > 0:
-    ws_era = wb["Extra Rows Analysis"]
-    
-    # Color header row (Source column in orange, key columns in orange)
-    for col_idx in range(1, ws_era.max_column + 1):
-        header = ws_era.cell(row=1, column=col_idx).value
-        if header in key_columns or header == '__key__' or header == 'Source':
-            ws_era.cell(row=1, column=col_idx).fill = orange_fill
-    
-    # Color data rows based on source
-    for row_num in range(2, ws_era.max_row + 1):
-        source_cell = ws_era.cell(row=row_num, column=2)  # 'Source' column
-        if source_cell.value == "Sheet1 Only":
-            fill = yellow_fill
-        elif source_cell.value == "Sheet2 Only":
-            fill = blue_fill
+REPORT_FILLS = {
+    'orange': "#FFE4B5",
+    'grey': "#D9D9D9",
+    'green': "#C6EFCE",
+    'red': "#FFC7CE",
+    'yellow': "#FFFF99",  # Sheet1 extra rows
+    'blue': "#ADD8E6",    # Sheet2 extra rows
+}
+REPORT_DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+REPORT_WRITE_BLOCK_ROWS = 10000  # Rows converted to Python values at a time while streaming a sheet out
+EXCEL_MAX_ROWS = 1048576  # Worksheet row limit (header included)
+
+class ReportFormats:
+    """Lazily created xlsxwriter formats keyed by (fill, is_header, is_date)."""
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self.cache = {}
+
+    def get(self, fill=None, header=False, date=False):
+        if not (fill or header or date):
+            return None
+        cache_key = (fill, header, date)
+        if cache_key not in self.cache:
+            properties = {}
+            if fill:
+                properties.update({'bg_color': REPORT_FILLS[fill], 'pattern': 1})
+            if header:
+                properties.update({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+            if date:
+                properties['num_format'] = REPORT_DATE_FORMAT
+            self.cache[cache_key] = self.workbook.add_format(properties)
+        return self.cache[cache_key]
+
+def column_widths(frame):
+    """Column widths from vectorized string lengths of header and values (+4 padding)."""
+    widths = []
+    for position, col in enumerate(frame.columns):
+        series = frame.iloc[:, position]
+        lengths = column_to_text(series).str.len().where(series.notna(), 0)
+        widths.append(max(len(str(col)), int(lengths.max()) if len(lengths) else 0) + 4)
+    return widths
+
+def write_sheet(workbook, formats, sheet_name, frame, column_fills=None, header_fills=None, row_fills=None, cell_fill_mask=None):
+    """Stream one DataFrame into a worksheet row by row, emitting fills as cells are written.
+
+    column_fills / header_fills are per-column fill names, row_fills per-row fill names
+    and cell_fill_mask a positional (rows x columns) boolean array of red cells.
+    """
+    worksheet = workbook.add_worksheet(sheet_name)
+    n_cols = len(frame.columns)
+    column_fills = column_fills or [None] * n_cols
+    header_fills = header_fills or column_fills
+
+    for position, width in enumerate(column_widths(frame)):
+        worksheet.set_column(position, position, width)
+
+    for position, col in enumerate(frame.columns):
+        worksheet.write(0, position, str(col), formats.get(header_fills[position], header=True))
+
+    for start in range(0, len(frame), REPORT_WRITE_BLOCK_ROWS):
+        block = frame.iloc[start:start + REPORT_WRITE_BLOCK_ROWS].astype(object)
+        block = block.where(block.notna(), None).to_numpy()
+        block[block == np.inf] = 'inf'  # ±inf as text, like pandas' to_excel (inf_rep)
+        block[block == -np.inf] = '-inf'
+        for offset, values in enumerate(block):
+            row = start + offset
+            row_fill = row_fills[row] if row_fills is not None else None
+            for position, value in enumerate(values):
+                fill = row_fill or column_fills[position]
+                if cell_fill_mask is not None and cell_fill_mask[row, position]:
+                    fill = 'red'
+                if value is None:
+                    if fill:
+                        worksheet.write_blank(row + 1, position, None, formats.get(fill))
+                    continue
+                is_date = isinstance(value, (datetime.date, datetime.time, datetime.timedelta))
+                worksheet.write(row + 1, position, value, formats.get(fill, date=is_date))
+    return worksheet
+
+def parquet_safe(frame):
+    """Frame Arrow can store: string column names and mixed-type object columns as text."""
+    frame = frame.copy(deep=False)
+    frame.columns = [str(col) for col in frame.columns]
+    for col in frame.columns:
+        if frame[col].dtype == object and pd.api.types.infer_dtype(frame[col], skipna=True).startswith('mixed'):
+            frame[col] = column_to_text(frame[col]).where(frame[col].notna(), None)
+    return frame
+
+def write_bulk_tables(output_file, sheets, output_format, csv_compression=None):
+    """Write the REPORT_BULK_SHEETS tables as Parquet/CSV files next to the report;
+    returns the remaining sheets plus an "Output Files" index sheet."""
+    stem = os.path.splitext(output_file)[0]
+    extension = '.parquet' if output_format == 'parquet' else '.csv' + ({'gzip': '.gz', 'bz2': '.bz2', 'zstd': '.zst',
+                                                                          'xz': '.xz', 'zip': '.zip'}.get(csv_compression, ''))
+    written = []
+    for sheet_name in REPORT_BULK_SHEETS:
+        if sheet_name not in sheets:
+            continue
+        frame = sheets[sheet_name]
+        path = f"{stem}_{re.sub(r'[^A-Za-z0-9]+', '_', sheet_name).strip('_').lower()}{extension}"
+        if output_format == 'parquet':
+            parquet_safe(frame).to_parquet(path, index=False)
+        else:
+            frame.to_csv(path, index=False, compression=csv_compression)
+        written.append({'Sheet': sheet_name, 'File': os.path.abspath(path), 'Rows': len(frame), 'Columns': len(frame.columns)})
+        print(f"🗃️ '{sheet_name}' written to '{path}'")
+
+    remaining = {name: frame for name, frame in sheets.items() if name not in REPORT_BULK_SHEETS}
+    if written:
+        remaining["Output Files"] = pd.DataFrame(written)
+    return remaining
+
+def write_report(output_file, sheets, key_columns, mismatch_comparison_df=None, output_format=None,
+                 csv_compression=None, split_workbooks=None):
+    """Write the report sheets (name -> DataFrame, in order) with formatting in a single pass.
+
+    With output_format 'parquet' or 'csv' the bulky tables go to separate files and the
+    workbook keeps the summary, mapping and mismatch sheets.
+    """
+    output_format = output_format or REPORT_OUTPUT_FORMAT
+    csv_compression = REPORT_CSV_COMPRESSION if csv_compression is None else csv_compression
+    split_workbooks = REPORT_SPLIT_WORKBOOKS if split_workbooks is None else split_workbooks
+    if output_format not in ('xlsx', 'parquet', 'csv'):
+        raise ValueError(f"Unknown report output format '{output_format}' (use xlsx, parquet or csv)")
+
+    with profile_stage("write report", rows=sum(len(frame) for frame in sheets.values()), columns=len(sheets), hot=True):
+        if output_format != 'xlsx':
+            sheets = write_bulk_tables(output_file, sheets, output_format, csv_compression)
+        write_report_sheets(output_file, sheets, key_columns, mismatch_comparison_df, split_workbooks)
+
+def continuation_sheet_name(sheet_name, part):
+    """'Side by Side Result (2)' style names within Excel's 31-character limit."""
+    if part == 1:
+        return sheet_name
+    suffix = f" ({part})"
+    return sheet_name[:31 - len(suffix)] + suffix
+
+def write_report_sheets(output_file, sheets, key_columns, mismatch_comparison_df, split_workbooks=False):
+    """Sheets longer than EXCEL_MAX_ROWS continue on numbered sheets, or in numbered
+    workbooks (report_part2.xlsx, ...) with split_workbooks."""
+    import xlsxwriter
+
+    workbooks = {}
+
+    def report_workbook(part):
+        if part not in workbooks:
+            path = output_file if part == 1 else f"{os.path.splitext(output_file)[0]}_part{part}.xlsx"
+            workbook = xlsxwriter.Workbook(path, {
+                'constant_memory': True,
+                'strings_to_numbers': False,
+                'strings_to_formulas': False,
+                'strings_to_urls': False,
+                'remove_timezone': True,
+            })
+            workbooks[part] = (workbook, ReportFormats(workbook))
+        return workbooks[part]
+
+    report_workbook(1)
+    key_headers = set(key_columns) | {'__key__'}
+
+    for sheet_name, frame in sheets.items():
+        headers = [str(col) for col in frame.columns]
+        options = {}
+
+        if sheet_name == "Side by Side Result":
+            # Key columns orange, target columns grey (header included)
+            options['column_fills'] = ['orange' if header in key_headers else 'grey' if header.endswith("(target)") else None
+                                       for header in headers]
+
+        elif sheet_name in ("Overall Result", "Drill-down Result") and len(frame):
+            kpi = frame.iloc[:, 2]
+            options['row_fills'] = np.where(kpi == "PASS", 'green', np.where(kpi == "FAIL", 'red', None))
+
+        elif sheet_name == "Column Mapping" and len(frame):
+            status = frame.iloc[:, 2].astype(str)
+            options['row_fills'] = np.where(status == "Matched", 'green', np.where(status.str.contains("Missing"), 'red', None))
+
+        elif sheet_name == "Mismatch Details" and mismatch_comparison_df is not None and len(frame):
+            # Rows of the mismatch frame line up with rows of mismatch_comparison_df
+            mask = np.zeros((len(frame), len(headers)), dtype=bool)
+            for position, header in enumerate(headers):
+                original_col_name = header.replace(" (target)", "")
+                if original_col_name in mismatch_comparison_df.columns:
+                    column_mask = mismatch_comparison_df[original_col_name]
+                    if column_mask.dtype == bool:
+                        mask[:, position] = ~column_mask.to_numpy()
+            options['cell_fill_mask'] = mask
+
+        elif sheet_name == "Group Totals" and len(frame):
+            status = frame['Status']
+            options['row_fills'] = np.where(status == "PASS", 'green', np.where(status == "FAIL", 'red',
+                                            np.where(status == "Only in Sheet1", 'yellow', 'blue')))
+
+        elif sheet_name == "Extra Rows Analysis" and len(frame):
+            options['header_fills'] = ['orange' if header in key_headers or header == 'Source' else None for header in headers]
+            source = frame.iloc[:, 1]
+            options['row_fills'] = np.where(source == "Sheet1 Only", 'yellow', np.where(source == "Sheet2 Only", 'blue', None))
+
+        rows_per_sheet = EXCEL_MAX_ROWS - 1
+        parts = max(1, -(-len(frame) // rows_per_sheet))
+        if parts > 1:
+            print(f"✂️ '{sheet_name}' has {len(frame)} rows, splitting it into {parts} "
+                  f"{'workbooks' if split_workbooks else 'sheets'}")
+        for part in range(1, parts + 1):
+            rows = slice((part - 1) * rows_per_sheet, part * rows_per_sheet)
+            part_options = dict(options)
+            if options.get('row_fills') is not None:
+                part_options['row_fills'] = options['row_fills'][rows]
+            if options.get('cell_fill_mask') is not None:
+                part_options['cell_fill_mask'] = options['cell_fill_mask'][rows]
+            workbook, formats = report_workbook(part if split_workbooks else 1)
+            name = sheet_name if split_workbooks else continuation_sheet_name(sheet_name, part)
+            write_sheet(workbook, formats, name, frame.iloc[rows] if parts > 1 else frame, **part_options)
+
+    for workbook, _ in workbooks.values():
+        workbook.close()
+
+def print_key_analysis(sheet1_key_count, sheet2_key_count, common_count, extra1_count, extra2_count):
+    print(f"📊 Key Analysis:")
+    print(f"  - Total keys in Sheet1: {sheet1_key_count}")
+    print(f"  - Total keys in Sheet2: {sheet2_key_count}")
+    print(f"  - Common keys (for comparison): {common_count}")
+    print(f"  - Extra in Sheet1 only: {extra1_count}")
+    print(f"  - Extra in Sheet2 only: {extra2_count}")
+
+def print_final_summary(key_columns, sample_keys, common_count, extra1_count, extra2_count, output_file):
+    print("Key columns:", key_columns)
+    print("Sample common keys:")
+    for key in sample_keys:
+        print(f"  {key}")
+    print(f"📊 Final Summary:")
+    print(f"  - Common rows compared: {common_count}")
+    print(f"  - Extra in Sheet1 (Yellow): {extra1_count}")
+    print(f"  - Extra in Sheet2 (Blue): {extra2_count}")
+    print(f"✨ Abracadabra! File magically appeared at '{output_file}' 🪄")
+
+# === In-memory Reconciliation ===
+@dataclasses.dataclass
+class ReconciliationResult:
+    """Everything one in-memory reconciliation produces.
+
+    source/target are the input sheets indexed by composite key, comparison is the
+    boolean match frame of the common rows. Row-level frames (side_by_side,
+    mismatch_details, mismatch_comparison, extra_rows) are None for summary-only runs.
+    """
+    key_columns: list
+    source: pd.DataFrame
+    target: pd.DataFrame
+    matched_cols: dict
+    unmatched_cols: list
+    unmatched_target_cols: list
+    match_scores: dict
+    comparison: pd.DataFrame
+    column_status: pd.DataFrame
+    column_mapping: pd.DataFrame
+    common_count: int
+    extra_source_count: int
+    extra_target_count: int
+    side_by_side: pd.DataFrame = None
+    mismatch_details: pd.DataFrame = None
+    mismatch_comparison: pd.DataFrame = None
+    extra_rows: pd.DataFrame = None
+    near_misses: pd.DataFrame = None
+    state: dict = None  # Per-row digests for the next incremental run
+    carried_forward_count: int = 0
+
+    @property
+    def summary_only(self):
+        return self.side_by_side is None
+
+    def report_sheets(self):
+        """Report sheets in workbook order (name -> DataFrame)."""
+        if self.summary_only:
+            return {"Overall Result": self.column_status, "Column Mapping": self.column_mapping}
+        return {
+            "Source Data": self.source.reset_index(),
+            "Target Data": self.target.reset_index(),
+            "Row Comparison": self.comparison.reset_index(),
+            "Overall Result": self.column_status,
+            "Column Mapping": self.column_mapping,
+            "Side by Side Result": self.side_by_side.reset_index(drop=True),
+            "Mismatch Details": self.mismatch_details.reset_index(drop=True),
+            "Extra Rows Analysis": self.extra_rows,
+            **({"Near-miss Keys": self.near_misses} if self.near_misses is not None else {}),
+        }
+
+def align_sheets(source_df, target_df, key_columns):
+    """Shallow copies of both sheets with cleaned headers and key columns renamed to the
+    configured names; returns (sheet1, sheet2, key_columns)."""
+    sheet1 = source_df.copy(deep=False)
+    sheet2 = target_df.copy(deep=False)
+    sheet1.columns = clean_columns(sheet1)
+    sheet2.columns = clean_columns(sheet2)
+
+    check_duplicate_columns(sheet1.columns, 'Sheet1')
+    check_duplicate_columns(sheet2.columns, 'Sheet2')
+
+    with profile_stage("resolve key columns"):
+        key_columns, sheet1_renames, sheet2_renames = resolve_key_columns(sheet1.columns, sheet2.columns, key_columns)
+    sheet1.rename(columns=sheet1_renames, inplace=True)
+    sheet2.rename(columns=sheet2_renames, inplace=True)
+    return sheet1, sheet2, key_columns
+
+def reconcile(source_df, target_df, key_columns, summary_only=False, incremental=False, previous_state=None, lean=None,
+              sort_column=None):
+    """Reconcile a source (Sheet1) and target (Sheet2) DataFrame on the given key columns.
+
+    The input frames are not modified. With summary_only=True only the per-column
+    PASS/FAIL status and the column mapping are built. With incremental=True the
+    result carries per-row digests (result.state); rows that fully matched in
+    previous_state and whose values did not change are not compared again.
+    With lean=True (default MEMORY_LEAN) keys and missing-column flags use compact
+    storage; pass frames through compact_dtypes() first to shrink the data columns too.
+    sort_column (default DUPLICATE_SORT_COLUMN) orders the occurrences of repeated keys.
+    """
+    lean = MEMORY_LEAN if lean is None else lean
+    sheet1, sheet2, key_columns = align_sheets(source_df, target_df, key_columns)
+
+    # === Create Unique Composite Keys ===
+    with profile_stage("build keys", rows=len(sheet1) + len(sheet2), columns=len(key_columns), hot=True):
+        for sheet, sheet_label in ((sheet1, 'Sheet1'), (sheet2, 'Sheet2')):
+            sheet['__key__'] = build_composite_key(sheet, key_columns)
+            sheet['__key__'] = disambiguate_duplicate_keys(sheet, sheet_label, sort_column)
+            if lean:
+                sheet['__key__'] = compact_keys(sheet['__key__'])
+
+    with profile_stage("join keys", rows=len(sheet1) + len(sheet2)):
+        common_rows_sheet1, common_rows_sheet2, extra_rows_sheet1, extra_rows_sheet2 = partition_rows(sheet1['__key__'], sheet2['__key__'])
+    print_key_analysis(len(sheet1), len(sheet2), len(common_rows_sheet1), len(extra_rows_sheet1), len(extra_rows_sheet2))
+
+    sheet1.set_index('__key__', inplace=True)
+    sheet2.set_index('__key__', inplace=True)
+
+    # === Filter to Common Keys Only for Comparison ===
+    sheet1_common = take_rows(sheet1, common_rows_sheet1)
+    sheet2_common = take_rows(sheet2, common_rows_sheet2)
+
+    sheet1_cols = data_columns(sheet1_common.columns, key_columns)
+    sheet2_cols = data_columns(sheet2_common.columns, key_columns)
+    with profile_stage("match columns", columns=len(sheet1_cols) + len(sheet2_cols), hot=True):
+        matched_cols, unmatched_cols, unmatched_sheet2, match_scores = match_columns(sheet1_cols, sheet2_cols)
+
+    compare_rows = None
+    if incremental or ROW_HASH_SHORT_CIRCUIT:
+        with profile_stage("row digests", rows=len(sheet1_common), columns=len(matched_cols)):
+            source_digests = row_digests(sheet1_common, list(matched_cols))
+            target_digests = row_digests(sheet2_common, list(matched_cols.values()))
+            if ROW_HASH_SHORT_CIRCUIT:
+                compare_rows = source_digests != target_digests
+            else:
+                compare_rows = np.ones(len(sheet1_common), dtype=bool)
+            if incremental:
+                signature = state_signature(key_columns, matched_cols)
+                carried_forward = unchanged_matching_rows(previous_state, signature, sheet1_common.index, source_digests, target_digests)
+                compare_rows &= ~carried_forward
+        if incremental:
+            print(f"♻️ Incremental: {int(carried_forward.sum())} unchanged matching rows carried forward")
+        print(f"⚡ {len(compare_rows) - int(compare_rows.sum())} rows identical on both sides, {int(compare_rows.sum())} rows compared cell by cell")
+
+    with profile_stage("compare", rows=len(sheet1_common), columns=len(matched_cols), hot=True):
+        comparison = build_comparison(sheet1_common, sheet2_common, matched_cols, unmatched_cols, compare_rows, lean=lean)
+        column_status_df = build_column_status(count_mismatches(comparison, matched_cols), len(comparison), unmatched_cols, unmatched_sheet2)
+        column_comparison_df = build_column_mapping(matched_cols, unmatched_cols, unmatched_sheet2, match_scores)
+
+    result = ReconciliationResult(
+        key_columns=key_columns, source=sheet1, target=sheet2,
+        matched_cols=matched_cols, unmatched_cols=unmatched_cols, unmatched_target_cols=unmatched_sheet2,
+        match_scores=match_scores, comparison=comparison,
+        column_status=column_status_df, column_mapping=column_comparison_df,
+        common_count=len(common_rows_sheet1), extra_source_count=len(extra_rows_sheet1),
+        extra_target_count=len(extra_rows_sheet2),
+    )
+    if incremental:
+        result.carried_forward_count = int(carried_forward.sum())
+        result.state = {
+            'signature': signature,
+            'rows': pd.DataFrame({
+                'source_digest': source_digests,
+                'target_digest': target_digests,
+                'all_match': comparison[list(matched_cols)].all(axis=1).to_numpy(dtype=bool),
+            }, index=sheet1_common.index),
+        }
+    if summary_only:
+        return result
+
+    with profile_stage("mismatch details", rows=len(sheet1_common), columns=len(sheet1_cols)):
+        result.side_by_side = build_side_by_side(sheet1_common, sheet2_common, sheet1_cols, matched_cols, key_columns)
+        mismatch_rows_mask = mismatch_rows(comparison, compare_rows)
+        result.mismatch_details = build_mismatch_details(result.side_by_side, mismatch_rows_mask, column_status_df, matched_cols, key_columns)
+        result.mismatch_comparison = comparison[mismatch_rows_mask]
+    with profile_stage("extra rows", rows=len(extra_rows_sheet1) + len(extra_rows_sheet2)):
+        result.extra_rows = combine_extra_rows([
+            build_extra_rows(sheet1, extra_rows_sheet1, 'Sheet1', key_columns),
+            build_extra_rows(sheet2, extra_rows_sheet2, 'Sheet2', key_columns),
+        ])
+    if NEAR_MISS_MATCHING:
+        with profile_stage("near-miss keys", rows=len(result.extra_rows), columns=len(key_columns), hot=True):
+            result.near_misses = find_near_miss_keys(result.extra_rows, key_columns)
+        print(f"🧩 {len(result.near_misses)} near-miss key pairs suggested among the extra rows")
+    return result
+
+def run_in_memory(file_path, key_columns, output_file=None, sheet1_name='Sheet1', sheet2_name='Sheet2',
+                  summary_only=False, use_cache=None, target_path=None, run_stats_sheet=None, state_file=None, lean=None):
+    """Load both sheets in full, reconcile them and write the report when output_file is given.
+
+    Sheet2 is read from target_path when given, otherwise from file_path. With a
+    state_file the run is incremental against the digests saved by the previous run.
+    With lean=True the sheets are compacted right after loading. Settings left at None
+    take their Config value at call time (state_file=False turns incremental runs off).
+    """
+    run_stats_sheet = RUN_STATS_SHEET if run_stats_sheet is None else run_stats_sheet
+    state_file = INCREMENTAL_STATE_FILE if state_file is None else state_file
+    lean = MEMORY_LEAN if lean is None else lean
+    # === Load Sheets ===
+    sheet1 = load_sheet(file_path, sheet1_name, use_cache=use_cache)
+    sheet2 = load_sheet(target_path or file_path, sheet2_name, use_cache=use_cache)
+    if lean:
+        with profile_stage("compact dtypes", rows=len(sheet1) + len(sheet2)):
+            sheet1, sheet2 = compact_dtypes(sheet1), compact_dtypes(sheet2)
+
+    result = reconcile(sheet1, sheet2, key_columns, summary_only=summary_only,
+                       incremental=bool(state_file), previous_state=load_incremental_state(state_file), lean=lean)
+    if state_file:
+        save_incremental_state(state_file, result.state)
+
+    if summary_only:
+        print(f"\n📋 Overall Result:")
+        print(result.column_status.to_string(index=False))
+
+    if output_file:
+        write_report(output_file, with_run_stats(result.report_sheets(), run_stats_sheet), result.key_columns,
+                     result.mismatch_comparison)
+        print_final_summary(result.key_columns, result.source.index[:0] if summary_only else result.side_by_side.index[:5],
+                            result.common_count, result.extra_source_count, result.extra_target_count, output_file)
+    return result
+
+# === Aggregate Reconciliation ===
+@dataclasses.dataclass
+class AggregateReconciliationResult:
+    """Group-level totals comparison plus the line-level drill-down into failing groups.
+
+    group_totals has one row per group with a Status and the source/target value of
+    every measure; drill_down is None when no group failed or drill-down is off.
+    """
+    key_columns: list
+    group_columns: list
+    measures: dict
+    column_status: pd.DataFrame
+    column_mapping: pd.DataFrame
+    group_totals: pd.DataFrame
+    failed_groups: int
+    drill_down: ReconciliationResult = None
+
+    def report_sheets(self):
+        """Report sheets in workbook order (name -> DataFrame)."""
+        sheets = {"Overall Result": self.column_status, "Column Mapping": self.column_mapping, "Group Totals": self.group_totals}
+        if self.drill_down is not None:
+            sheets["Drill-down Result"] = self.drill_down.column_status
+            sheets["Mismatch Details"] = self.drill_down.mismatch_details.reset_index(drop=True)
+            sheets["Extra Rows Analysis"] = self.drill_down.extra_rows
+            if self.drill_down.near_misses is not None:
+                sheets["Near-miss Keys"] = self.drill_down.near_misses
+        return sheets
+
+def numeric_measure_columns(sheet1, sheet2, matched_cols):
+    """Matched column pairs whose non-empty cells are numbers on both sides, with their normalized values."""
+    measures = {}
+    for col1, col2 in matched_cols.items():
+        policy = column_policy(col1, col2, sheet1[col1], sheet2[col2])
+        zero1, numeric1, text1 = normalize_comparison_column(sheet1[col1], policy)
+        zero2, numeric2, text2 = normalize_comparison_column(sheet2[col2], policy)
+        if pd.isna(text1).all() and pd.isna(text2).all():
+            measures[col1] = (policy, np.where(zero1, 0.0, numeric1), ~zero1, np.where(zero2, 0.0, numeric2), ~zero2)
+    return measures
+
+def aggregate_sheet(sheet, group_columns, measures, functions, side):
+    """Group totals of one sheet indexed by its normalized group columns.
+
+    'count' counts non-empty values, sum/min/max treat empty-like cells as 0.
+    """
+    frame = pd.DataFrame({col: normalize_key_column(sheet[col]).to_numpy() for col in group_columns})
+    aggregations = {'Row Count': (group_columns[0], 'size')}
+    for col, (_, values1, present1, values2, present2) in measures.items():
+        values, present = (values1, present1) if side == 'sheet1' else (values2, present2)
+        frame[f'{col}__value'] = values
+        frame[f'{col}__present'] = present
+        for func in functions:
+            if func == 'count':
+                aggregations[f'{col} (count)'] = (f'{col}__present', 'sum')
+            else:
+                aggregations[f'{col} ({func})'] = (f'{col}__value', func)
+    return frame.groupby(group_columns, sort=False).agg(**aggregations)
+
+def reconcile_aggregate(source_df, target_df, key_columns, group_columns=None, functions=None, drill_down=None):
+    """Compare per-group totals of the matched numeric columns and reconcile the rows of
+    failing groups line by line."""
+    group_columns = list(group_columns or AGGREGATE_GROUP_COLUMNS)
+    functions = list(functions or AGGREGATE_FUNCTIONS)
+    drill_down = AGGREGATE_DRILL_DOWN if drill_down is None else drill_down
+    unknown = set(functions) - {'sum', 'count', 'min', 'max'}
+    if unknown:
+        raise ValueError(f"Unsupported aggregate functions: {sorted(unknown)} (use sum, count, min, max)")
+    missing = [col for col in group_columns if col not in key_columns]
+    if missing:
+        raise ValueError(f"Aggregate group columns must be key columns, got: {missing}")
+
+    sheet1, sheet2, key_columns = align_sheets(source_df, target_df, key_columns)
+    sheet1_cols = data_columns(sheet1.columns, key_columns)
+    sheet2_cols = data_columns(sheet2.columns, key_columns)
+    with profile_stage("match columns", columns=len(sheet1_cols) + len(sheet2_cols), hot=True):
+        matched_cols, unmatched_cols, unmatched_sheet2, match_scores = match_columns(sheet1_cols, sheet2_cols)
+
+    with profile_stage("aggregate", rows=len(sheet1) + len(sheet2), columns=len(matched_cols), hot=True):
+        measures = numeric_measure_columns(sheet1, sheet2, matched_cols)
+        totals1 = aggregate_sheet(sheet1, group_columns, measures, functions, 'sheet1')
+        totals2 = aggregate_sheet(sheet2, group_columns, measures, functions, 'sheet2')
+    print(f"🧮 Aggregating {len(measures)} numeric columns ({', '.join(functions)}) over {len(totals1)} / {len(totals2)} groups "
+          f"by {group_columns}")
+
+    with profile_stage("compare totals", rows=len(totals1) + len(totals2), columns=len(totals1.columns)):
+        joined = totals1.join(totals2, how='outer', rsuffix=' (target)', sort=False)
+        in_sheet1 = joined.index.isin(totals1.index)
+        in_sheet2 = joined.index.isin(totals2.index)
+        common = in_sheet1 & in_sheet2
+
+        mismatch_counts = {}
+        group_failed = ~common
+        for measure in totals1.columns:
+            source_col = measure.rsplit(' (', 1)[0]
+            policy = {'rel_tol': 1e-9}  # sums of the same values in another order differ in the last bits
+            if source_col in measures:
+                policy.update(measures[source_col][0])
+            matches = compare_columns_vectorized(joined[measure][common], joined[f'{measure} (target)'][common], policy)
+            mismatch_counts[measure] = int((~matches).sum())
+            group_failed[np.flatnonzero(common)[~matches]] = True
+
+        status = np.where(~in_sheet2, 'Only in Sheet1', np.where(~in_sheet1, 'Only in Sheet2',
+                                                                 np.where(group_failed, 'FAIL', 'PASS')))
+        group_totals = joined[[col for measure in totals1.columns for col in (measure, f'{measure} (target)')]].reset_index()
+        group_totals.insert(len(group_columns), 'Status', status)
+
+        column_status_df = build_column_status(mismatch_counts, int(common.sum()), unmatched_cols, unmatched_sheet2)
+        one_sided = int((~common).sum())
+        column_status_df = pd.concat([pd.DataFrame([{
+            'Column': 'Groups',
+            'Status': f'{int((~in_sheet2).sum())} only in Sheet1, {int((~in_sheet1).sum())} only in Sheet2' if one_sided
+                      else 'All groups in both sheets',
+            'KPI': 'FAIL' if one_sided else 'PASS',
+        }]), column_status_df], ignore_index=True)
+        column_comparison_df = build_column_mapping(matched_cols, unmatched_cols, unmatched_sheet2, match_scores)
+
+    failed_groups = int(group_failed.sum())
+    print(f"📊 {failed_groups} of {len(joined)} groups fail")
+    result = AggregateReconciliationResult(
+        key_columns=key_columns, group_columns=group_columns, measures={col: matched_cols[col] for col in measures},
+        column_status=column_status_df, column_mapping=column_comparison_df, group_totals=group_totals,
+        failed_groups=failed_groups,
+    )
+    if drill_down and failed_groups:
+        # Same '|'-joined normalized values build_composite_key uses for the group columns
+        failed_keys = pd.Series(['|'.join(map(str, group if isinstance(group, tuple) else (group,)))
+                                 for group in joined.index[group_failed]], dtype=object)
+        rows1 = build_composite_key(sheet1, group_columns).isin(failed_keys).to_numpy()
+        rows2 = build_composite_key(sheet2, group_columns).isin(failed_keys).to_numpy()
+        print(f"🔎 Drilling down into {int(rows1.sum())} Sheet1 and {int(rows2.sum())} Sheet2 rows of failing groups")
+        result.drill_down = reconcile(sheet1[rows1], sheet2[rows2], key_columns)
+    return result
+
+def run_aggregate(file_path, key_columns, output_file=None, sheet1_name='Sheet1', sheet2_name='Sheet2',
+                  group_columns=None, functions=None, use_cache=None, target_path=None, run_stats_sheet=None):
+    """Load both sheets, compare group totals with drill-down and write the report when output_file is given."""
+    run_stats_sheet = RUN_STATS_SHEET if run_stats_sheet is None else run_stats_sheet
+    sheet1 = load_sheet(file_path, sheet1_name, use_cache=use_cache)
+    sheet2 = load_sheet(target_path or file_path, sheet2_name, use_cache=use_cache)
+
+    result = reconcile_aggregate(sheet1, sheet2, key_columns, group_columns, functions)
+    print(f"\n📋 Overall Result:")
+    print(result.column_status.to_string(index=False))
+
+    if output_file:
+        drill_down = result.drill_down
+        write_report(output_file, with_run_stats(result.report_sheets(), run_stats_sheet), result.key_columns,
+                     drill_down.mismatch_comparison if drill_down is not None else None)
+        print(f"✨ Abracadabra! File magically appeared at '{output_file}' 🪄")
+    return result
+
+# === Streaming (Out-of-core) Reconciliation ===
+def iter_sheet_chunks(path, sheet_name, chunk_rows):
+    """Yield DataFrame chunks of a sheet without loading it in full (.xlsx, .csv or .parquet)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+        return
+    if extension == '.parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+        return
+
+    from openpyxl import load_workbook
+    from pandas.io.parsers import TextParser
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [f'Unnamed: {idx}' if col is None else col for idx, col in enumerate(header)]
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            # Parsed like pd.read_excel: integral numbers as int, then its parser for NA strings ('NaN', 'null', ...) and dtypes
+            chunk.append([int(value) if isinstance(value, float) and value.is_integer() else value for value in row])
+            if len(chunk) == chunk_rows:
+                yield TextParser(chunk, names=header, header=None).read()
+                chunk = []
+        if chunk:
+            yield TextParser(chunk, names=header, header=None).read()
+    finally:
+        wb.close()
+
+def read_sheet_header(path, sheet_name):
+    """Cleaned column names of a sheet, read from its first chunk only."""
+    first_chunk = next(iter_sheet_chunks(path, sheet_name, 1), pd.DataFrame())
+    return clean_columns(first_chunk)
+
+def bucket_path(work_dir, side, bucket):
+    return os.path.join(work_dir, f'{side}_bucket_{bucket:04d}.pkl')
+
+def append_pickle(path, obj):
+    """Append one object to a spill file; read them back in order with read_pickles()."""
+    with open(path, 'ab') as handle:
+        pickle.dump(obj, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_pickles(path):
+    """Yield every object appended to a spill file (nothing when it does not exist)."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as handle:
+        while True:
+            try:
+                yield pickle.load(handle)
+            except EOFError:
+                return
+
+def update_dtype_sample(sample, chunk):
+    """Fold one chunk into sample ({column: (empty Series, has values)}), the dtype each column
+    has across all chunks so far, as pandas infers it when reading the whole column."""
+    for col in chunk.columns:
+        values = chunk[col]
+        has_values = bool(values.notna().any())
+        if col not in sample or (has_values and not sample[col][1]):
+            sample[col] = (values.iloc[:0], has_values)
+        elif has_values:
+            sample[col] = (pd.concat([sample[col][0], values.iloc[:0]]), True)
+        elif sample[col][0].dtype.kind in 'iub':
+            # Missing cells turn a whole int column into float and a bool column into object
+            sample[col] = (pd.concat([sample[col][0], pd.Series(dtype=float)]), sample[col][1])
+    return sample
+
+def dtype_sample_frame(sample, header):
+    """Empty frame with the whole-column dtypes collected by update_dtype_sample()."""
+    return pd.DataFrame({col: sample[col][0] if col in sample else pd.Series(dtype=object) for col in header})
+
+def partition_sheet_to_buckets(path, sheet_name, side, renames, key_columns, work_dir, n_buckets, chunk_rows):
+    """Stream a sheet into on-disk buckets by hash of its composite key.
+
+    Returns (row count, dtype sample); see update_dtype_sample(). A single bucket's
+    dtypes need not match the whole sheet's.
+    """
+    row_offset = 0
+    sample = {}
+    for chunk in iter_sheet_chunks(path, sheet_name, chunk_rows):
+        chunk.columns = clean_columns(chunk)
+        chunk.rename(columns=renames, inplace=True)
+        chunk.index = pd.RangeIndex(row_offset, row_offset + len(chunk))
+        row_offset += len(chunk)
+        update_dtype_sample(sample, chunk)
+
+        chunk['__key__'] = build_composite_key(chunk, key_columns)
+        buckets = (pd.util.hash_pandas_object(chunk['__key__'], index=False).to_numpy() % n_buckets).astype(np.int64)
+        for bucket in np.unique(buckets):
+            append_pickle(bucket_path(work_dir, side, bucket), chunk[buckets == bucket])
+    return row_offset, sample
+
+def load_bucket(work_dir, side, bucket, columns):
+    """Concatenate the chunks appended to one bucket file (an empty frame when the bucket is empty)."""
+    chunks = list(read_pickles(bucket_path(work_dir, side, bucket)))
+    if not chunks:
+        return pd.DataFrame(columns=columns + ['__key__'])
+    return pd.concat(chunks)
+
+def has_duplicate_keys(work_dir, side, n_buckets, columns):
+    """Equal keys always share a bucket, so duplicates can be found one bucket at a time."""
+    for bucket in range(n_buckets):
+        if load_bucket(work_dir, side, bucket, columns)['__key__'].duplicated().any():
+            return True
+    return False
+
+def prepare_bucket(bucket_df, add_row_suffix, sort_column=None):
+    """Apply the duplicate key rule and index by composite key; returns (frame, sheet row numbers).
+
+    Equal keys share a bucket and buckets keep sheet order, so ordinal numbering per bucket
+    matches numbering the whole sheet; the legacy row-number rule needs the whole-sheet flag.
+    """
+    sheet_rows = bucket_df.index.to_numpy()
+    if add_row_suffix:
+        bucket_df['__key__'] += '_row' + (bucket_df.index + 1).astype(str)
+    elif DUPLICATE_KEY_MODE == 'ordinal':
+        bucket_df['__key__'] = number_duplicate_keys(bucket_df['__key__'], bucket_df[sort_column] if sort_column else None)
+    return bucket_df.set_index('__key__'), sheet_rows
+
+@dataclasses.dataclass
+class SheetLayout:
+    """Resolved keys, renamed headers and column match the out-of-core runs (streaming, SQL) work from."""
+    key_columns: list
+    sheet1_header: list
+    sheet2_header: list
+    sheet1_renames: dict
+    sheet2_renames: dict
+    sheet1_cols: list
+    matched_cols: dict
+    unmatched_cols: list
+    unmatched_sheet2: list
+    match_scores: dict
+
+def resolve_sheet_layout(sheet1_path, sheet2_path, sheet1_name, sheet2_name, key_columns):
+    """Read both header rows, resolve the key columns and match the data columns."""
+    sheet1_header = read_sheet_header(sheet1_path, sheet1_name)
+    sheet2_header = read_sheet_header(sheet2_path, sheet2_name)
+    check_duplicate_columns(sheet1_header, 'Sheet1')
+    check_duplicate_columns(sheet2_header, 'Sheet2')
+
+    key_columns, sheet1_renames, sheet2_renames = resolve_key_columns(sheet1_header, sheet2_header, key_columns)
+    sheet1_header = [sheet1_renames.get(col, col) for col in sheet1_header]
+    sheet2_header = [sheet2_renames.get(col, col) for col in sheet2_header]
+
+    sheet1_cols = data_columns(sheet1_header, key_columns)
+    sheet2_cols = data_columns(sheet2_header, key_columns)
+    with profile_stage("match columns", columns=len(sheet1_cols) + len(sheet2_cols), hot=True):
+        matched_cols, unmatched_cols, unmatched_sheet2, match_scores = match_columns(sheet1_cols, sheet2_cols)
+    return SheetLayout(key_columns, sheet1_header, sheet2_header, sheet1_renames, sheet2_renames,
+                       sheet1_cols, matched_cols, unmatched_cols, unmatched_sheet2, match_scores)
+
+def write_out_of_core_report(output_file, layout, mismatch_counts, common_count, extra1_count, extra2_count, sample_keys,
+                             mismatch_side_by_side, mismatch_comparison_df, extra_rows_df, run_stats_sheet):
+    """Write the summary, mapping, mismatch, extra-rows (and near-miss) sheets from merged out-of-core results."""
+    key_columns = layout.key_columns
+    column_status_df = build_column_status(mismatch_counts, common_count, layout.unmatched_cols, layout.unmatched_sheet2)
+    column_comparison_df = build_column_mapping(layout.matched_cols, layout.unmatched_cols, layout.unmatched_sheet2,
+                                                layout.match_scores)
+    mismatch_df = build_mismatch_details(mismatch_side_by_side, np.ones(len(mismatch_side_by_side), dtype=bool),
+                                         column_status_df, layout.matched_cols, key_columns)
+    report_sheets = {
+        "Overall Result": column_status_df,
+        "Column Mapping": column_comparison_df,
+        "Mismatch Details": mismatch_df.reset_index(drop=True),
+        "Extra Rows Analysis": extra_rows_df,
+    }
+    if NEAR_MISS_MATCHING:
+        with profile_stage("near-miss keys", rows=len(extra_rows_df), columns=len(key_columns), hot=True):
+            report_sheets["Near-miss Keys"] = find_near_miss_keys(extra_rows_df, key_columns)
+        print(f"🧩 {len(report_sheets['Near-miss Keys'])} near-miss key pairs suggested among the extra rows")
+
+    write_report(output_file, with_run_stats(report_sheets, run_stats_sheet), key_columns, mismatch_comparison_df)
+
+    print_final_summary(key_columns, sample_keys, common_count, extra1_count, extra2_count, output_file)
+
+def run_streaming(file_path, key_columns, output_file, sources=None, sheet1_name='Sheet1', sheet2_name='Sheet2',
+                  n_buckets=None, chunk_rows=None, work_dir=None, run_stats_sheet=None):
+    """Reconcile bucket by bucket; writes the summary, mapping, mismatch and extra-rows sheets."""
+    n_buckets = STREAM_BUCKETS if n_buckets is None else n_buckets
+    chunk_rows = STREAM_CHUNK_ROWS if chunk_rows is None else chunk_rows
+    run_stats_sheet = RUN_STATS_SHEET if run_stats_sheet is None else run_stats_sheet
+    sheet1_path, sheet2_path = sources or (file_path, file_path)
+    layout = resolve_sheet_layout(sheet1_path, sheet2_path, sheet1_name, sheet2_name, key_columns)
+    key_columns, sheet1_header, sheet2_header = layout.key_columns, layout.sheet1_header, layout.sheet2_header
+    sheet1_cols, matched_cols, unmatched_cols = layout.sheet1_cols, layout.matched_cols, layout.unmatched_cols
+
+    own_work_dir = work_dir is None
+    work_dir = tempfile.mkdtemp(prefix='reconcile_buckets_') if own_work_dir else work_dir
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        print(f"\n📦 Partitioning sheets into {n_buckets} buckets under '{work_dir}'...")
+        with profile_stage("partition Sheet1", columns=len(sheet1_header), hot=True) as stage:
+            sheet1_rows, sheet1_sample = partition_sheet_to_buckets(sheet1_path, sheet1_name, 'sheet1', layout.sheet1_renames,
+                                                                      key_columns, work_dir, n_buckets, chunk_rows)
+            stage['rows'] = sheet1_rows
+        with profile_stage("partition Sheet2", columns=len(sheet2_header), hot=True) as stage:
+            sheet2_rows, sheet2_sample = partition_sheet_to_buckets(sheet2_path, sheet2_name, 'sheet2', layout.sheet2_renames,
+                                                                      key_columns, work_dir, n_buckets, chunk_rows)
+            stage['rows'] = sheet2_rows
+        # Dtype-keyed policies follow the whole columns, as in memory, not each bucket's dtypes
+        policies = column_pair_policies(matched_cols, dtype_sample_frame(sheet1_sample, sheet1_header),
+                                        dtype_sample_frame(sheet2_sample, sheet2_header))
+
+        sheet1_has_dupes = sheet2_has_dupes = False
+        if DUPLICATE_KEY_MODE == 'row_number':
+            with profile_stage("duplicate key scan", rows=sheet1_rows + sheet2_rows):
+                sheet1_has_dupes = has_duplicate_keys(work_dir, 'sheet1', n_buckets, sheet1_header)
+                sheet2_has_dupes = has_duplicate_keys(work_dir, 'sheet2', n_buckets, sheet2_header)
+        sheet1_sort = find_sort_column(sheet1_header, DUPLICATE_SORT_COLUMN, 'Sheet1')
+        sheet2_sort = find_sort_column(sheet2_header, DUPLICATE_SORT_COLUMN, 'Sheet2')
+
+        mismatch_counts = {col: 0 for col in matched_cols}
+        common_count = 0
+        sample_keys = []
+        # Per-bucket results are spilled next to the buckets, so memory stays at one bucket until the merge
+        mismatch_spill = os.path.join(work_dir, 'mismatch_results.pkl')
+        extra_spills = {'Sheet1': os.path.join(work_dir, 'extra_sheet1.pkl'),
+                        'Sheet2': os.path.join(work_dir, 'extra_sheet2.pkl')}
+        extra_counts = {'Sheet1': 0, 'Sheet2': 0}
+
+        with profile_stage("reconcile buckets", rows=sheet1_rows + sheet2_rows, columns=len(matched_cols), hot=True):
+            for bucket in range(n_buckets):
+                sheet1, sheet1_order = prepare_bucket(load_bucket(work_dir, 'sheet1', bucket, sheet1_header), sheet1_has_dupes, sheet1_sort)
+                sheet2, sheet2_order = prepare_bucket(load_bucket(work_dir, 'sheet2', bucket, sheet2_header), sheet2_has_dupes, sheet2_sort)
+
+                common_rows_sheet1, common_rows_sheet2, extra_rows_sheet1, extra_rows_sheet2 = partition_rows(sheet1.index, sheet2.index)
+                sheet1_common = sheet1.iloc[common_rows_sheet1]
+                sheet2_common = sheet2.iloc[common_rows_sheet2]
+
+                compare_rows = differing_rows(sheet1_common, sheet2_common, matched_cols) if ROW_HASH_SHORT_CIRCUIT else None
+                comparison = build_comparison(sheet1_common, sheet2_common, matched_cols, unmatched_cols, compare_rows,
+                                              policies=policies)
+                for col, count in count_mismatches(comparison, matched_cols).items():
+                    mismatch_counts[col] += count
+                common_count += len(comparison)
+                sample_keys.extend(sheet1_common.index[:5 - len(sample_keys)])
+
+                mismatch_rows_mask = mismatch_rows(comparison, compare_rows)
+                if mismatch_rows_mask.any():
+                    append_pickle(mismatch_spill, (
+                        build_side_by_side(sheet1_common[mismatch_rows_mask], sheet2_common[mismatch_rows_mask],
+                                           sheet1_cols, matched_cols, key_columns),
+                        comparison[mismatch_rows_mask],
+                        sheet1_order[common_rows_sheet1][mismatch_rows_mask]))
+
+                for sheet_label, sheet, extra_rows, sheet_order in (('Sheet1', sheet1, extra_rows_sheet1, sheet1_order),
+                                                                    ('Sheet2', sheet2, extra_rows_sheet2, sheet2_order)):
+                    if len(extra_rows):
+                        append_pickle(extra_spills[sheet_label], (build_extra_rows(sheet, extra_rows, sheet_label, key_columns),
+                                                                  sheet_order[extra_rows]))
+                        extra_counts[sheet_label] += len(extra_rows)
+
+        with profile_stage("merge bucket results"):
+            # Restore the Sheet1 row order used by the in-memory run
+            mismatch_parts = list(read_pickles(mismatch_spill))
+            if mismatch_parts:
+                side_by_side_parts, comparison_parts, order_parts = zip(*mismatch_parts)
+                order = np.argsort(np.concatenate(order_parts), kind='stable')
+                mismatch_side_by_side = pd.concat(side_by_side_parts).iloc[order]
+                mismatch_comparison_df = pd.concat(comparison_parts).iloc[order]
+            else:
+                mismatch_side_by_side = build_side_by_side(sheet1_common.iloc[:0], sheet2_common.iloc[:0],
+                                                           sheet1_cols, matched_cols, key_columns)
+                mismatch_comparison_df = None
+            del mismatch_parts
+
+            extra_frames = []
+            for sheet_label in ('Sheet1', 'Sheet2'):
+                extra_parts = list(read_pickles(extra_spills[sheet_label]))
+                if extra_parts:
+                    frames, order_parts = zip(*extra_parts)
+                    order = np.argsort(np.concatenate(order_parts), kind='stable')
+                    extra_frames.append(combine_extra_rows(list(frames)).iloc[order])
+            extra_rows_df = combine_extra_rows(extra_frames)
+    finally:
+        if own_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    extra1_count, extra2_count = extra_counts['Sheet1'], extra_counts['Sheet2']
+    print_key_analysis(sheet1_rows, sheet2_rows, common_count, extra1_count, extra2_count)
+
+    write_out_of_core_report(output_file, layout, mismatch_counts, common_count, extra1_count, extra2_count, sample_keys,
+                             mismatch_side_by_side, mismatch_comparison_df, extra_rows_df, run_stats_sheet)
+
+# === SQL Backend (SQLite / DuckDB) ===
+SQL_WHITESPACE = " \t\n\r\x0b\x0c"  # Characters str.strip() removes in the pandas pipeline
+SQL_NUMBER_PATTERN = r'[+-]?([0-9]+[.]?[0-9]*|[.][0-9]+)([eE][+-]?[0-9]+)?'  # Decimal text pd.to_numeric parses ('nan', 'inf', '1_000' excluded)
+SQL_INFINITY_WORDS = ('inf', 'infinity')  # pd.to_numeric also parses these, signed and in any letter case
+
+# Engine-specific SQL; {0} is a column or expression, everything else is shared
+SQL_DIALECTS = {
+    'sqlite': {
+        'row_type': 'INTEGER PRIMARY KEY',
+        'key_type': 'TEXT',
+        'data_type': 'TEXT',  # cells keep their text; numbers are only read inside the comparison
+        # Comparing text with its NUMERIC cast applies NUMERIC affinity to it, which converts only well-formed numbers
+        'number': "(CASE WHEN {0} = CAST({0} AS NUMERIC) THEN CAST({0} AS REAL) END)",
+        'infinity': "9e999",
+        'all_digits': "({0} <> '' AND {0} NOT GLOB '*[^0-9]*')",
+        # NULL beyond int64, where CAST would clamp to 9223372036854775807 (printf() is not exact there either)
+        'truncate': "(CASE WHEN ABS(CAST({0} AS REAL)) < 9223372036854775808.0 THEN CAST(CAST({0} AS REAL) AS INTEGER) END)",
+        'trunc': "CAST({0} AS INTEGER)",
+        'to_number': "CAST({0} AS REAL)",
+        'greatest': 'MAX',
+        'index_keys': True,
+    },
+    'duckdb': {
+        'row_type': 'BIGINT',
+        'key_type': 'VARCHAR',
+        'data_type': 'VARCHAR',
+        # TRY_CAST alone would also read 'nan', 'inf' and '1_000' as numbers
+        'number': "(CASE WHEN regexp_full_match({0}, '" + SQL_NUMBER_PATTERN + "') THEN TRY_CAST({0} AS DOUBLE) END)",
+        'infinity': "CAST('inf' AS DOUBLE)",
+        'all_digits': "regexp_full_match({0}, '[0-9]+')",
+        'truncate': "TRY_CAST(TRUNC(CAST({0} AS DOUBLE)) AS HUGEINT)",  # NULL beyond the 128-bit range
+        'trunc': "TRUNC({0})",
+        'to_number': "TRY_CAST({0} AS DOUBLE)",
+        'greatest': 'GREATEST',
+        'index_keys': False,  # hash joins need no index
+    },
+}
+
+def sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def resolve_sql_engine(engine):
+    """'sqlite' or 'duckdb'; 'auto' picks DuckDB when it is installed."""
+    if engine == 'auto':
+        try:
+            import duckdb  # noqa: F401
+            return 'duckdb'
+        except ImportError:
+            return 'sqlite'
+    if engine not in SQL_DIALECTS:
+        raise ValueError(f"Unknown SQL backend '{engine}', expected 'sqlite', 'duckdb' or 'auto'")
+    return engine
+
+def open_sql_database(engine, path):
+    if engine == 'duckdb':
+        import duckdb
+        return duckdb.connect(path)
+    import sqlite3
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode = OFF')  # scratch database, nothing to recover
+    connection.execute('PRAGMA synchronous = OFF')
+    return connection
+
+def sql_frame(connection, query):
+    """Run a query and return its rows as a DataFrame."""
+    cursor = connection.execute(query)
+    return pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+
+def sql_cell_values(series, is_key):
+    """Cells as the text the pandas pipeline normalizes (str() of each value); missing data cells become NULL."""
+    text = column_to_text(series)
+    if is_key:
+        return text.to_numpy(dtype=object)
+    return text.astype(object).where(series.notna(), None).to_numpy(dtype=object)
+
+def load_sheet_into_sql(connection, engine, table, path, sheet_name, renames, header, key_columns, chunk_rows):
+    """Stream a sheet into table (__row, c0, c1, ...) chunk by chunk; returns (row count, empty frame with the whole-column dtypes)."""
+    dialect = SQL_DIALECTS[engine]
+    column_types = [dialect['key_type'] if col in key_columns else dialect['data_type'] for col in header]
+    connection.execute(f"CREATE TABLE {table} (__row {dialect['row_type']}, "
+                       + ", ".join(f"c{position} {column_type}" for position, column_type in enumerate(column_types)) + ")")
+
+    row_offset = 0
+    sample = {}
+    for chunk in iter_sheet_chunks(path, sheet_name, chunk_rows):
+        chunk.columns = clean_columns(chunk)
+        chunk.rename(columns=renames, inplace=True)
+        update_dtype_sample(sample, chunk)
+        columns = [np.arange(row_offset, row_offset + len(chunk))]
+        columns += [sql_cell_values(chunk.iloc[:, position], col in key_columns) for position, col in enumerate(header)]
+        row_offset += len(chunk)
+
+        if engine == 'duckdb':
+            connection.register('sql_chunk', pd.DataFrame({f'c{position - 1}' if position else '__row': values
+                                                          for position, values in enumerate(columns)}))
+            connection.execute(f"INSERT INTO {table} SELECT * FROM sql_chunk")
+            connection.unregister('sql_chunk')
         else:
+            placeholders = ", ".join("?" * len(columns))
+            connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})",
+                                   zip(columns[0].tolist(), *[values.tolist() for values in columns[1:]]))
+    return row_offset, dtype_sample_frame(sample, header)
+
+def sql_key_expression(engine, column):
+    """normalize_key_column() in SQL: strip, drop one trailing '.0', canonicalize integer-like text.
+
+    Integers outside the dialect's 'truncate' range keep their stripped text.
+    """
+    dialect = SQL_DIALECTS[engine]
+    stripped = f"TRIM({column}, '{SQL_WHITESPACE}')"
+    text = f"(CASE WHEN {stripped} LIKE '%.0' THEN SUBSTR({stripped}, 1, LENGTH({stripped}) - 2) ELSE {stripped} END)"
+    digits = f"REPLACE(REPLACE({text}, '.', ''), '-', '')"
+    integer_like = (dialect['all_digits'].format(digits)
+                    + f" AND {text} NOT LIKE '_%-%'"  # a sign only in front
+                    + f" AND LENGTH({text}) - LENGTH(REPLACE({text}, '.', '')) <= 1")
+    return f"(CASE WHEN {integer_like} THEN COALESCE(CAST({dialect['truncate'].format(text)} AS TEXT), {text}) ELSE {text} END)"
+
+def restore_sql_dtypes(frame, samples):
+    """Turn database text back into numbers/datetimes where the loaded column (samples: name -> column
+    of the whole sheet) had that dtype and every value converts."""
+    for col in frame.columns:
+        sample = samples.get(col)
+        if sample is None or pd.api.types.is_bool_dtype(sample):
             continue
-            
-        # Apply color to entire row
-        for col_num in range(1, ws_era.max_column + 1):
-            ws_era.cell(row=row_num, column=col_num).fill = fill
-
-wb.save(output_file)
-print("Key columns:", key_columns)
-print("Sample common keys:")
-for i, key in enumerate(list(common_keys)[:5]):
-    print(f"  {key}")
-print(f"📊 Final Summary:")
-print(f"  - Common rows compared: {len(common_keys)}")
-print(f"  - Extra in Sheet1 (Yellow): {len(extra_in_sheet1)}")
-print(f"  - Extra in Sheet2 (Blue): {len(extra_in_sheet2)}")
-print(f"✨ Abracadabra! File magically appeared at '{output_file}' 🪄")
+        if pd.api.types.is_numeric_dtype(sample):
+            converted = pd.to_numeric(frame[col], errors='coerce')
+        elif pd.api.types.is_datetime64_any_dtype(sample):
+            converted = pd.to_datetime(frame[col], errors='coerce', format='%Y-%m-%d %H:%M:%S')
+        else:
+            continue
+        if converted.notna().sum() == frame[col].notna().sum():
+            frame[col] = converted
+    return frame
+
+def build_sql_keys(connection, engine, table, keys_table, header, key_columns, sheet_label, sort_column=None, sample=None):
+    """keys_table (__row, __key__) with the composite key and DUPLICATE_KEY_MODE applied.
+
+    Repeated keys are numbered in sort_column order, by number when the column's dtype
+    in sample (the whole sheet) is numeric, so 9 sorts before 10 as in pandas.
+    """
+    composite = " || '|' || ".join(sql_key_expression(engine, f"c{header.index(col)}") for col in key_columns)
+    connection.execute(f"CREATE TABLE {keys_table}_raw AS SELECT __row, {composite} AS __key__ FROM {table}")
+
+    (duplicate_count,), = connection.execute(f"SELECT COUNT(*) - COUNT(DISTINCT __key__) FROM {keys_table}_raw").fetchall()
+    if not duplicate_count:
+        connection.execute(f"ALTER TABLE {keys_table}_raw RENAME TO {keys_table}")
+    elif DUPLICATE_KEY_MODE == 'row_number':
+        connection.execute(f"CREATE TABLE {keys_table} AS SELECT __row, __key__ || '_row' || CAST(__row + 1 AS TEXT) AS __key__ "
+                           f"FROM {keys_table}_raw")
+    else:
+        print(f"🔁 {sheet_label}: {duplicate_count} repeated keys paired by occurrence")
+        order = 'k.__row'
+        if sort_column:
+            value = f"s.c{header.index(sort_column)}"
+            sort_dtype = sample[sort_column].dtype if sample is not None else object
+            if pd.api.types.is_numeric_dtype(sort_dtype) and not pd.api.types.is_bool_dtype(sort_dtype):
+                value = SQL_DIALECTS[engine]['to_number'].format(value)
+            # Datetimes are stored as str(Timestamp), ISO text that already sorts in time order
+            order = f"{value} IS NULL, {value}, k.__row"
+        connection.execute(
+            f"CREATE TABLE {keys_table} AS SELECT __row, "
+            f"CASE WHEN occurrence > 1 THEN __key__ || '_dup' || CAST(occurrence AS TEXT) ELSE __key__ END AS __key__ "
+            f"FROM (SELECT k.__row, k.__key__, ROW_NUMBER() OVER (PARTITION BY k.__key__ ORDER BY {order}) AS occurrence "
+            f"FROM {keys_table}_raw k JOIN {table} s ON s.__row = k.__row)"
+        )
+    if SQL_DIALECTS[engine]['index_keys']:
+        connection.execute(f"CREATE INDEX {keys_table}_key ON {keys_table} (__key__)")
+
+def sql_join_keys(connection):
+    """joined (__key__, r1, r2): a full outer join of both key tables (r1/r2 NULL on the side missing the key)."""
+    connection.execute(
+        "CREATE TABLE joined AS "
+        "SELECT k1.__key__, k1.__row AS r1, k2.__row AS r2 FROM keys1 k1 LEFT JOIN keys2 k2 ON k2.__key__ = k1.__key__ "
+        "UNION ALL "
+        "SELECT k2.__key__, NULL, k2.__row FROM keys2 k2 WHERE NOT EXISTS (SELECT 1 FROM keys1 k1 WHERE k1.__key__ = k2.__key__)"
+    )
+    (common, extra1, extra2), = connection.execute(
+        "SELECT COALESCE(SUM(CASE WHEN r1 IS NOT NULL AND r2 IS NOT NULL THEN 1 ELSE 0 END), 0), "
+        "COALESCE(SUM(CASE WHEN r2 IS NULL THEN 1 ELSE 0 END), 0), "
+        "COALESCE(SUM(CASE WHEN r1 IS NULL THEN 1 ELSE 0 END), 0) FROM joined"
+    ).fetchall()
+    return int(common), int(extra1), int(extra2)
+
+def sql_round_half_even(engine, number, digits):
+    """np.round() in SQL: scale by 10**digits, round halves to even, scale back (SQL ROUND rounds them away from zero)."""
+    trunc = SQL_DIALECTS[engine]['trunc']
+    scale, unscale = ('*', '/') if digits >= 0 else ('/', '*')
+    scaled = f"({number} {scale} 1e{abs(digits)})"
+    nearest = (f"(CASE WHEN ABS({scaled} - {trunc.format(scaled)}) = 0.5 THEN 2 * ROUND({scaled} / 2) "
+               f"ELSE ROUND({scaled}) END)")
+    return f"({nearest} {unscale} 1e{abs(digits)})"
+
+def sql_normalize_columns(connection, engine, table, normalized_table, columns):
+    """normalized_table (__row, t0, e0, n0, ...): normalize_comparison_column() for each (column, policy).
+
+    t is the stripped text, e flags empty tokens and n is the number the text parses
+    to, rounded per policy. Written once, so the comparison never re-parses a cell.
+    """
+    dialect = SQL_DIALECTS[engine]
+    definitions, selected = [], []
+    for position, (column, policy) in enumerate(columns):
+        if policy.get('dates'):
+            raise ValueError("Comparison policy 'dates' is not supported by the SQL backend")
+        empty_values = ", ".join(sql_literal(value) for value in policy.get('empty_values', EMPTY_LIKE_VALUES)) or "NULL"
+        text = f"TRIM({column}, '{SQL_WHITESPACE}')"
+        positive = ", ".join(sql_literal(sign + word) for sign in ('', '+') for word in SQL_INFINITY_WORDS)
+        negative = ", ".join(sql_literal('-' + word) for word in SQL_INFINITY_WORDS)
+        number = (f"(CASE WHEN LOWER({text}) IN ({positive}) THEN {dialect['infinity']} "
+                  f"WHEN LOWER({text}) IN ({negative}) THEN -{dialect['infinity']} ELSE {dialect['number'].format(text)} END)")
+        if policy.get('round') is not None:
+            number = sql_round_half_even(engine, number, int(policy['round']))
+        definitions += [f", t{position} {dialect['data_type']}", f", e{position} INTEGER", f", n{position} DOUBLE"]
+        selected += [f", {text}", f", (CASE WHEN {column} IS NULL OR {text} IN ({empty_values}) THEN 1 ELSE 0 END)", f", {number}"]
+    connection.execute(f"CREATE TABLE {normalized_table} (__row {dialect['row_type']}{''.join(definitions)})")
+    connection.execute(f"INSERT INTO {normalized_table} SELECT __row{''.join(selected)} FROM {table}")
+
+def sql_mismatch_expression(engine, side1, side2, policy, integers=False):
+    """1 where compare_columns_vectorized() would report a mismatch, else 0.
+
+    side1/side2 are the (text, empty flag, number) columns of sql_normalize_columns();
+    with integers=True integer text compares exactly, as two integer columns do in pandas.
+    """
+    dialect = SQL_DIALECTS[engine]
+    sides = []
+    for text, empty, number in (side1, side2):
+        # Same order as normalize_comparison_column(): empty tokens first, then numbers, then text
+        zero = f"({empty} = 1 OR {number} = 0)"
+        value = f"(CASE WHEN {empty} = 0 AND {number} <> 0 THEN {number} END)"
+        word = f"(CASE WHEN {empty} = 0 AND {number} IS NULL THEN {text} END)"
+        if policy.get('case_insensitive'):
+            word = f"LOWER({word})"
+        sides.append((value, word, zero))
+    (number1, text1, zero1), (number2, text2, zero2) = sides
+
+    abs_tol, rel_tol = policy.get('abs_tol', 0), policy.get('rel_tol', 0)
+    if abs_tol or rel_tol:
+        greatest = dialect['greatest']
+        allowed = f"{float(abs_tol)}"
+        if rel_tol:  # 0 * inf would be NaN, which DuckDB's GREATEST() and <= treat as the largest value
+            allowed = f"{greatest}({allowed}, {float(rel_tol)} * {greatest}(ABS({number1}), ABS({number2})))"
+        numbers_equal = f"(ABS({number1} - {number2}) <= {allowed} OR {number1} = {number2})"
+    else:
+        numbers_equal = f"{number1} = {number2}"
+    equal = f"({zero1} AND {zero2}) OR {numbers_equal} OR {text1} = {text2}"
+    if integers:
+        # As doubles, integers above 2**53 would collapse together
+        is_integer = " AND ".join(dialect['all_digits'].format(f"LTRIM({text}, '-')") for text, _, _ in (side1, side2))
+        equal = f"CASE WHEN {is_integer} THEN {side1[0]} = {side2[0]} ELSE {equal} END"
+    return f"(CASE WHEN {equal} THEN 0 ELSE 1 END)"
+
+def run_sql(file_path, key_columns, output_file, sources=None, sheet1_name='Sheet1', sheet2_name='Sheet2',
+            engine=None, database=None, chunk_rows=None, run_stats_sheet=None):
+    """Reconcile inside an embedded SQLite/DuckDB database; writes the summary, mapping, mismatch and extra-rows sheets.
+
+    Key normalization, the outer join and the cell comparison run as SQL; only the
+    per-column mismatch counts, the mismatching rows and the one-sided rows come back.
+    """
+    engine = resolve_sql_engine(engine or SQL_BACKEND or 'auto')
+    chunk_rows = STREAM_CHUNK_ROWS if chunk_rows is None else chunk_rows
+    run_stats_sheet = RUN_STATS_SHEET if run_stats_sheet is None else run_stats_sheet
+    if database is not None and os.path.exists(database):
+        raise FileExistsError(f"SQL database '{database}' already exists; remove it or pass a new path")
+    sheet1_path, sheet2_path = sources or (file_path, file_path)
+    layout = resolve_sheet_layout(sheet1_path, sheet2_path, sheet1_name, sheet2_name, key_columns)
+    key_columns, sheet1_header, sheet2_header = layout.key_columns, layout.sheet1_header, layout.sheet2_header
+    sheet1_cols, matched_cols, unmatched_cols = layout.sheet1_cols, layout.matched_cols, layout.unmatched_cols
+
+    work_dir = None
+    if database is None:
+        work_dir = tempfile.mkdtemp(prefix='reconcile_sql_')
+        database = os.path.join(work_dir, f'reconcile.{engine}')
+    print(f"\n🗄️ Loading sheets into {engine} database '{database}'...")
+    connection = open_sql_database(engine, database)
+    try:
+        with profile_stage("load Sheet1", columns=len(sheet1_header), hot=True) as stage:
+            sheet1_rows, sheet1_sample = load_sheet_into_sql(connection, engine, 'sheet1', sheet1_path, sheet1_name, layout.sheet1_renames,
+                                                             sheet1_header, key_columns, chunk_rows)
+            stage['rows'] = sheet1_rows
+        with profile_stage("load Sheet2", columns=len(sheet2_header), hot=True) as stage:
+            sheet2_rows, sheet2_sample = load_sheet_into_sql(connection, engine, 'sheet2', sheet2_path, sheet2_name, layout.sheet2_renames,
+                                                             sheet2_header, key_columns, chunk_rows)
+            stage['rows'] = sheet2_rows
+
+        with profile_stage("build keys", rows=sheet1_rows + sheet2_rows, columns=len(key_columns)):
+            build_sql_keys(connection, engine, 'sheet1', 'keys1', sheet1_header, key_columns, 'Sheet1',
+                           find_sort_column(sheet1_header, DUPLICATE_SORT_COLUMN, 'Sheet1'), sheet1_sample)
+            build_sql_keys(connection, engine, 'sheet2', 'keys2', sheet2_header, key_columns, 'Sheet2',
+                           find_sort_column(sheet2_header, DUPLICATE_SORT_COLUMN, 'Sheet2'), sheet2_sample)
+        with profile_stage("join keys", rows=sheet1_rows + sheet2_rows):
+            common_count, extra1_count, extra2_count = sql_join_keys(connection)
+        print_key_analysis(sheet1_rows, sheet2_rows, common_count, extra1_count, extra2_count)
+
+        # === Compare in SQL: one 0/1 mismatch flag per matched column ===
+        sheet1_ref = {col: f"s.c{position}" for position, col in enumerate(sheet1_header)}
+        sheet2_ref = {col: f"t.c{position}" for position, col in enumerate(sheet2_header)}
+        flags = {col1: f"m{position}" for position, col1 in enumerate(matched_cols)}
+        policies = list(column_pair_policies(matched_cols, sheet1_sample, sheet2_sample).values())
+        with profile_stage("normalize", rows=sheet1_rows + sheet2_rows, columns=len(matched_cols), hot=True):
+            sql_normalize_columns(connection, engine, 'sheet1', 'normalized1',
+                                  [(f"c{sheet1_header.index(col1)}", policy) for col1, policy in zip(matched_cols, policies)])
+            sql_normalize_columns(connection, engine, 'sheet2', 'normalized2',
+                                  [(f"c{sheet2_header.index(col2)}", policy) for col2, policy in zip(matched_cols.values(), policies)])
+        flag_expressions = [
+            sql_mismatch_expression(engine, (f"n1.t{position}", f"n1.e{position}", f"n1.n{position}"),
+                                    (f"n2.t{position}", f"n2.e{position}", f"n2.n{position}"), policy,
+                                    exact_integer_columns(sheet1_sample[col1], sheet2_sample[col2], policy))
+            for position, ((col1, col2), policy) in enumerate(zip(matched_cols.items(), policies))
+        ]
+        with profile_stage("compare", rows=common_count, columns=len(matched_cols), hot=True):
+            connection.execute(
+                "CREATE TABLE compared AS SELECT j.__key__, j.r1, j.r2"
+                + "".join(f", {expression} AS {flags[col1]}" for col1, expression in zip(matched_cols, flag_expressions))
+                + " FROM joined j JOIN normalized1 n1 ON n1.__row = j.r1 JOIN normalized2 n2 ON n2.__row = j.r2"
+            )
+            totals = connection.execute(
+                "SELECT COUNT(*)" + "".join(f", COALESCE(SUM({flags[col1]}), 0)" for col1 in matched_cols) + " FROM compared"
+            ).fetchall()[0]
+        mismatch_counts = {col1: int(count) for col1, count in zip(matched_cols, totals[1:])}
+
+        # === Pull back only the mismatching rows, in Sheet1 order ===
+        failed = [col1 for col1 in sheet1_cols if col1 in unmatched_cols or mismatch_counts.get(col1)]
+        with profile_stage("mismatch details", columns=len(failed)) as stage:
+            selected = ["c.__key__"] + [sheet1_ref[key] for key in reversed(key_columns)]
+            names = ['__key__'] + list(reversed(key_columns))
+            for col1 in failed:
+                selected.append(sheet1_ref[col1])
+                names.append(col1)
+                if col1 in matched_cols:
+                    selected += [sheet2_ref[matched_cols[col1]], flags[col1]]
+                    names += [f"{matched_cols[col1]} (target)", flags[col1]]
+            failed_flags = [flags[col1] for col1 in failed if col1 in matched_cols]
+            mismatches = sql_frame(connection, (
+                "SELECT " + ", ".join(selected)
+                + " FROM compared c JOIN sheet1 s ON s.__row = c.r1 JOIN sheet2 t ON t.__row = c.r2"
+                + f" WHERE {' + '.join(failed_flags) if failed_flags else '0'} > 0 ORDER BY c.r1"
+            ))
+            mismatches.columns = names
+            samples = {f"{col2} (target)": sheet2_sample[col2] for col2 in matched_cols.values()}
+            samples.update(sheet1_sample.items())
+            restore_sql_dtypes(mismatches, samples)
+            mismatches.index = pd.Index(mismatches['__key__'].to_numpy(), name='__key__')
+            stage['rows'] = len(mismatches)
+        mismatch_comparison_df = pd.DataFrame({
+            col1: mismatches[flags[col1]].to_numpy() == 0 if col1 in failed else np.ones(len(mismatches), dtype=bool)
+            for col1 in matched_cols
+        }, index=mismatches.index)
+        mismatch_side_by_side = mismatches.drop(columns=failed_flags)
+        sample_keys = [key for (key,) in connection.execute("SELECT __key__ FROM compared ORDER BY r1 LIMIT 5").fetchall()]
+
+        with profile_stage("extra rows", rows=extra1_count + extra2_count):
+            extra_frames = []
+            for sheet_label, table, own_row, other_row, header, sample in (
+                    ('Sheet1', 'sheet1', 'r1', 'r2', sheet1_header, sheet1_sample),
+                    ('Sheet2', 'sheet2', 'r2', 'r1', sheet2_header, sheet2_sample)):
+                extra = sql_frame(connection, (
+                    "SELECT j.__key__, " + ", ".join(f"s.c{position}" for position in range(len(header)))
+                    + f" FROM joined j JOIN {table} s ON s.__row = j.{own_row} WHERE j.{other_row} IS NULL ORDER BY j.{own_row}"
+                ))
+                extra = extra.set_index('__key__')
+                extra.columns = header
+                restore_sql_dtypes(extra, dict(sample.items()))
+                extra_frames.append(build_extra_rows(extra, np.arange(len(extra)), sheet_label, key_columns))
+            extra_rows_df = combine_extra_rows(extra_frames)
+    finally:
+        connection.close()
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    write_out_of_core_report(output_file, layout, mismatch_counts, common_count, extra1_count, extra2_count, sample_keys,
+                             mismatch_side_by_side, mismatch_comparison_df, extra_rows_df, run_stats_sheet)
+
+# === Batch Reconciliation ===
+def batch_settings(**overrides):
+    """Run settings every batch job carries: the Config values, updated with overrides.
+
+    Spawned workers start from the Config values, so settings changed in the parent
+    (e.g. from the command line) only reach them through the job itself.
+    """
+    settings = {
+        'use_cache': USE_INPUT_CACHE,
+        'lean': MEMORY_LEAN,
+        'incremental': INCREMENTAL_STATE_FILE,
+        'stats': RUN_STATS_FILE,
+        'run_stats_sheet': RUN_STATS_SHEET,
+        'profile': PROFILE_DIR,
+        'policies': COLUMN_POLICIES,
+        'output_format': REPORT_OUTPUT_FORMAT,
+        'csv_compression': REPORT_CSV_COMPRESSION,
+        'split_workbooks': REPORT_SPLIT_WORKBOOKS,
+    }
+    settings.update(overrides)
+    return settings
+
+def read_batch_manifest(manifest_path, settings=None):
+    """Jobs from a JSON list or CSV file with source, target, sheet1, sheet2, key_columns and output.
+
+    Only source and output are required; target defaults to source, sheets to Sheet1/Sheet2
+    and key_columns to the Config value. In CSV files key columns are separated by ';'.
+    Every job gets the run settings (see batch_settings()); the incremental state, stats and
+    cProfile paths get a _job<N> suffix per job unless the entry names its own.
+    """
+    settings = batch_settings() if settings is None else settings
+    if manifest_path.lower().endswith('.json'):
+        with open(manifest_path, encoding='utf-8') as handle:
+            entries = json.load(handle)
+    else:
+        entries = pd.read_csv(manifest_path, dtype=str, keep_default_na=False).to_dict('records')
+
+    jobs = []
+    for position, entry in enumerate(entries, start=1):
+        job_keys = entry.get('key_columns') or key_columns
+        if isinstance(job_keys, str):
+            job_keys = [key.strip() for key in job_keys.split(';') if key.strip()]
+        jobs.append({
+            'name': entry.get('name') or f"Job {position}",
+            'source': entry['source'],
+            'target': entry.get('target') or entry['source'],
+            'sheet1': entry.get('sheet1') or 'Sheet1',
+            'sheet2': entry.get('sheet2') or 'Sheet2',
+            'key_columns': job_keys,
+            'output': entry['output'],
+            **settings,
+        })
+        for setting in ('incremental', 'stats', 'profile'):
+            if entry.get(setting):
+                jobs[-1][setting] = entry[setting]
+            elif settings[setting]:
+                stem, extension = os.path.splitext(settings[setting])
+                jobs[-1][setting] = f"{stem}_job{position}{extension}"
+    return jobs
+
+def run_batch_job(job):
+    """Reconcile one manifest job inside a worker process; returns its roll-up row."""
+    global COLUMN_POLICIES, REPORT_OUTPUT_FORMAT, REPORT_CSV_COMPRESSION, REPORT_SPLIT_WORKBOOKS
+    COLUMN_POLICIES = job['policies']
+    REPORT_OUTPUT_FORMAT = job['output_format']
+    REPORT_CSV_COMPRESSION = job['csv_compression']
+    REPORT_SPLIT_WORKBOOKS = job['split_workbooks']
+
+    row = {'Job': job['name'], 'Status': '', 'KPI': 'FAIL', 'Source': job['source'], 'Target': job['target'],
+           'Output': job['output'], 'Common Rows': None, 'Extra in Sheet1': None, 'Extra in Sheet2': None, 'Failed Columns': ''}
+    if job['stats'] or job['run_stats_sheet'] or job['profile']:
+        start_profiling(job['profile'])
+    try:
+        result = run_in_memory(job['source'], job['key_columns'], job['output'], sheet1_name=job['sheet1'],
+                               sheet2_name=job['sheet2'], use_cache=job['use_cache'], target_path=job['target'],
+                               run_stats_sheet=job['run_stats_sheet'], state_file=job['incremental'] or False, lean=job['lean'])
+    except Exception as error:
+        row['Status'] = f"Error: {error}"
+        return row
+    finally:
+        profiler = stop_profiling()
+        if profiler is not None and job['stats']:
+            profiler.save(job['stats'])
+
+    failed_columns = result.column_status.loc[result.column_status['KPI'] == 'FAIL', 'Column'].tolist()
+    extra_count = result.extra_source_count + result.extra_target_count
+    row.update({
+        'Common Rows': result.common_count,
+        'Extra in Sheet1': result.extra_source_count,
+        'Extra in Sheet2': result.extra_target_count,
+        'Failed Columns': ', '.join(failed_columns),
+    })
+    if failed_columns or extra_count:
+        row['Status'] = f"{len(failed_columns)} failed columns, {extra_count} extra rows"
+    else:
+        row['Status'] = 'All columns and rows match'
+        row['KPI'] = 'PASS'
+    return row
+
+def available_memory():
+    """Bytes of memory currently available, or None when it cannot be determined."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def estimate_job_memory(job):
+    """Rough peak memory of a job from the size of its input files."""
+    inputs = {os.path.abspath(job['source']), os.path.abspath(job['target'])}
+    return sum(os.path.getsize(path) for path in inputs if os.path.exists(path)) * BATCH_MEMORY_PER_INPUT_BYTE
+
+def batch_error_row(job, error):
+    """Roll-up row of a job that never returned one."""
+    return {'Job': job['name'], 'Status': f"Error: {error}", 'KPI': 'FAIL',
+            'Source': job['source'], 'Target': job['target'], 'Output': job['output']}
+
+def run_batch(manifest_path, rollup_output, workers=None, memory_budget=None, settings=None):
+    """Run every manifest job on a reused process pool, never starting more jobs than the
+    memory budget allows, and write a consolidated Overall Result roll-up.
+
+    A dying worker breaks the whole pool, so every job it interrupted is retried once on
+    its own; only a job that also dies alone is reported as failed.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    from concurrent.futures.process import BrokenProcessPool
+
+    jobs = read_batch_manifest(manifest_path, settings)
+    workers = workers or BATCH_WORKERS or os.cpu_count() or 1
+    memory_budget = BATCH_MEMORY_BUDGET if memory_budget is None else memory_budget
+    if memory_budget is None:
+        available = available_memory()
+        memory_budget = available * 0.8 if available else float('inf')
+    print(f"🗂️ Batch: {len(jobs)} jobs on up to {workers} workers")
+
+    pending = [(position, job, False) for position, job in enumerate(jobs)]  # (position, job, run alone)
+    running, rows = {}, {}
+    memory_in_use = 0
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while pending or running:
+            # Start jobs while there is a free worker and memory headroom (always at least one);
+            # a job retried alone shares the pool with no other job
+            while pending and len(running) < workers:
+                estimate = estimate_job_memory(pending[0][1])
+                alone = pending[0][2] or any(solo for _, _, _, solo in running.values())
+                if running and (alone or memory_in_use + estimate > memory_budget):
+                    break
+                position, job, solo = pending.pop(0)
+                try:
+                    future = pool.submit(run_batch_job, job)
+                except BrokenProcessPool:
+                    # A worker died and took the pool down; its jobs are retried below on a fresh pool
+                    print("   ⚠️ A worker process died, restarting the pool")
+                    pool.shutdown(wait=False)
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                    future = pool.submit(run_batch_job, job)
+                running[future] = (position, job, estimate, solo)
+                memory_in_use += estimate
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            retries = []
+            for future in done:
+                position, job, estimate, solo = running.pop(future)
+                memory_in_use -= estimate
+                try:
+                    rows[position] = future.result()
+                except BrokenProcessPool:
+                    if not solo:  # any job on the broken pool may have been the one that died
+                        print(f"   🔁 {job['name']}: interrupted by a dying worker, retrying it alone")
+                        retries.append((position, job, True))
+                        continue
+                    rows[position] = batch_error_row(job, "worker process died")
+                except Exception as error:  # the job could not be sent to its worker
+                    rows[position] = batch_error_row(job, error)
+                print(f"   {'✅' if rows[position]['KPI'] == 'PASS' else '❌'} {job['name']}: {rows[position]['Status']}")
+            pending = sorted(retries, key=lambda entry: entry[0]) + pending
+    finally:
+        pool.shutdown()
+
+    rollup_df = pd.DataFrame([rows[position] for position in sorted(rows)])
+    write_report(rollup_output, {"Overall Result": rollup_df}, [])
+    passed = int((rollup_df['KPI'] == 'PASS').sum())
+    print(f"📊 Batch Summary: {passed}/{len(rollup_df)} jobs passed")
+    print(f"✨ Roll-up written to '{rollup_output}'")
+    return rollup_df
+
+# === Command Line ===
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two sheets and write a color-coded reconciliation report.")
+    parser.add_argument('input', nargs='?', default=file_path, help="Excel file holding both sheets (default: file_path in Config)")
+    parser.add_argument('-k', '--key-columns', nargs='+', default=key_columns, help="Columns that together identify a row")
+    parser.add_argument('-o', '--output', default=None,
+                        help="Report path, or roll-up path with --batch (default: output_file in Config; none for --summary-only)")
+    parser.add_argument('--sheet1', default='Sheet1', help="Source sheet name")
+    parser.add_argument('--sheet2', default='Sheet2', help="Target sheet name")
+    parser.add_argument('--target', default=None, help="Separate workbook holding the target sheet")
+    parser.add_argument('--summary-only', action='store_true', help="Only compute and print the Overall Result")
+    parser.add_argument('--aggregate', nargs='*', metavar='GROUP_COLUMN', default=None,
+                        help="Compare group totals by these key columns (default: AGGREGATE_GROUP_COLUMNS), then drill down")
+    parser.add_argument('--aggregate-functions', nargs='+', default=AGGREGATE_FUNCTIONS, choices=['sum', 'count', 'min', 'max'],
+                        help="Aggregates of the matched numeric columns")
+    parser.add_argument('--streaming', action='store_true', default=STREAMING_MODE, help="Reconcile bucket by bucket (out-of-core)")
+    parser.add_argument('--sources', nargs=2, metavar=('SHEET1_FILE', 'SHEET2_FILE'), default=STREAM_SOURCES,
+                        help="Separate .xlsx/.csv/.parquet inputs for streaming and SQL mode")
+    parser.add_argument('--lean', action='store_true', default=MEMORY_LEAN,
+                        help="Memory-lean run: categorical text, downcast numbers and Arrow-backed keys")
+    parser.add_argument('--sql', nargs='?', const='auto', default=SQL_BACKEND, choices=['auto', 'sqlite', 'duckdb'],
+                        help="Build keys, join and compare inside an embedded database (default ENGINE: DuckDB when installed, else SQLite)")
+    parser.add_argument('--sql-database', default=SQL_DATABASE, metavar='PATH',
+                        help="New database file for --sql (a temporary file by default)")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the parsed-input cache")
+    parser.add_argument('--clear-cache', action='store_true', default=CLEAR_INPUT_CACHE, help="Empty the parsed-input cache first")
+    parser.add_argument('--batch', metavar='MANIFEST', help="Run every job of a JSON/CSV manifest on a process pool")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help="Batch process pool size")
+    parser.add_argument('--output-format', choices=['xlsx', 'parquet', 'csv'], default=REPORT_OUTPUT_FORMAT,
+                        help="Write Source/Target Data, Row Comparison and Side by Side Result as Parquet/CSV files next to a compact workbook")
+    parser.add_argument('--csv-compression', default=REPORT_CSV_COMPRESSION, choices=['gzip', 'bz2', 'zstd', 'xz', 'zip'],
+                        help="Compression of CSV outputs")
+    parser.add_argument('--split-workbooks', action='store_true', default=REPORT_SPLIT_WORKBOOKS,
+                        help="Continue sheets past the Excel row limit in extra workbooks instead of extra sheets")
+    parser.add_argument('--policies', metavar='JSON_FILE',
+                        help="Per-column comparison policies (see COLUMN_POLICIES), replacing the Config value")
+    parser.add_argument('--incremental', metavar='STATE_FILE', default=INCREMENTAL_STATE_FILE,
+                        help="Only recompare rows that changed since the run that saved STATE_FILE (created on first use)")
+    parser.add_argument('--stats', metavar='PATH', default=RUN_STATS_FILE,
+                        help="Write per-stage wall/CPU time, peak RSS and row/column counts to a .json or .csv file")
+    parser.add_argument('--run-stats-sheet', action='store_true', default=RUN_STATS_SHEET,
+                        help="Add a \"Run Stats\" sheet to the report")
+    parser.add_argument('--profile', nargs='?', const='', default=PROFILE_DIR, metavar='DIR',
+                        help="Dump cProfile stats of the hot stages (default DIR: <output>_profile)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global COLUMN_POLICIES, REPORT_OUTPUT_FORMAT, REPORT_CSV_COMPRESSION, REPORT_SPLIT_WORKBOOKS
+    args = parse_args(argv)
+    REPORT_OUTPUT_FORMAT = args.output_format
+    REPORT_CSV_COMPRESSION = args.csv_compression
+    REPORT_SPLIT_WORKBOOKS = args.split_workbooks
+    output = args.output or (None if args.summary_only else output_file)
+
+    if args.clear_cache:
+        clear_input_cache(INPUT_CACHE_DIR)
+    if args.policies:
+        with open(args.policies, encoding='utf-8') as handle:
+            COLUMN_POLICIES = json.load(handle)
+
+    cprofile_dir = args.profile
+    if cprofile_dir == '':
+        cprofile_dir = os.path.splitext(output or output_file)[0] + '_profile'
+
+    if args.batch:
+        settings = batch_settings(use_cache=USE_INPUT_CACHE and not args.no_cache, lean=args.lean, incremental=args.incremental,
+                                  stats=args.stats, run_stats_sheet=args.run_stats_sheet, profile=cprofile_dir,
+                                  policies=COLUMN_POLICIES, output_format=args.output_format,
+                                  csv_compression=args.csv_compression, split_workbooks=args.split_workbooks)
+        return run_batch(args.batch, output or output_file, workers=args.workers, settings=settings)
+    if args.stats or args.run_stats_sheet or cprofile_dir:
+        start_profiling(cprofile_dir)
+    try:
+        if args.aggregate is not None or AGGREGATE_MODE:
+            return run_aggregate(args.input, args.key_columns, output, sheet1_name=args.sheet1, sheet2_name=args.sheet2,
+                                 group_columns=args.aggregate, functions=args.aggregate_functions,
+                                 use_cache=USE_INPUT_CACHE and not args.no_cache, target_path=args.target,
+                                 run_stats_sheet=args.run_stats_sheet)
+        if args.sql:
+            return run_sql(args.input, args.key_columns, output or output_file, sources=args.sources,
+                           sheet1_name=args.sheet1, sheet2_name=args.sheet2, engine=args.sql, database=args.sql_database,
+                           run_stats_sheet=args.run_stats_sheet)
+        if args.streaming:
+            return run_streaming(args.input, args.key_columns, output or output_file, sources=args.sources,
+                                 sheet1_name=args.sheet1, sheet2_name=args.sheet2, work_dir=STREAM_WORK_DIR,
+                                 run_stats_sheet=args.run_stats_sheet)
+        return run_in_memory(args.input, args.key_columns, output, sheet1_name=args.sheet1, sheet2_name=args.sheet2,
+                             summary_only=args.summary_only, use_cache=USE_INPUT_CACHE and not args.no_cache,
+                             target_path=args.target, run_stats_sheet=args.run_stats_sheet, state_file=args.incremental or False,
+                             lean=args.lean)
+    finally:
+        profiler = stop_profiling()
+        if profiler is not None:
+            print(f"\n⏱️ Run Stats:")
+            print(profiler.to_frame().drop(columns='cprofile').to_string(index=False))
+            if args.stats:
+                profiler.save(args.stats)
+                print(f"   Stage profile written to '{args.stats}'")
+            if cprofile_dir:
+                print(f"   cProfile dumps written to '{cprofile_dir}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import Code
+
+
+# === Benchmark Settings ===
+BENCHMARK_RESULTS_FILE = "benchmark_results.json"
+BENCHMARK_BASELINE_FILE = "benchmark_baseline.json"
+BENCHMARK_REGRESSION_THRESHOLD = 0.20  # A stage regresses when it is this much slower than the baseline (0.20 = 20%)
+BENCHMARK_MIN_SECONDS = 0.05  # Stages faster than this in the baseline are too noisy to flag
+BENCHMARK_REPEAT = 1  # Runs per scenario; the fastest wall time of each stage is kept
+BENCHMARK_PEAK_RSS_TARGET_MB = None  # Fail when a scenario's peak RSS exceeds this many MB (e.g. 800 for --rows 1000000 --lean --no-write)
+
+# Base scenario; every other scenario varies one of these settings
+BASE_SCENARIO = {
+    'rows': 10_000,
+    'columns': 10,  # Total columns per sheet, key columns included
+    'duplicate_rate': 0.0,  # Share of rows whose key repeats an earlier row
+    'one_sided_rate': 0.02,  # Share of rows only present in one of the sheets (split between both)
+    'mismatch_rate': 0.05,  # Share of common cells that differ between the sheets
+    'messy_headers': True,  # Sheet2 headers like 'Profit Center(Transaction Data)', 'Net  Amount'
+}
+SCENARIO_VARIANTS = {
+    'rows': [10_000, 100_000, 500_000, 2_000_000],
+    'columns': [10, 40],
+    'duplicate_rate': [0.0, 0.01],
+    'one_sided_rate': [0.02, 0.2],
+    'mismatch_rate': [0.05, 0.5],
+    'messy_headers': [True, False],
+}
+QUICK_ROWS = [10_000, 100_000]
+
+BENCHMARK_KEY_COLUMNS = ['Company Code', 'Profit Center', 'Billing Document']
+EXCEL_MAX_DATA_ROWS = Code.EXCEL_MAX_ROWS - 1  # Rows below the header that fit on one worksheet
+
+
+# === Synthetic Workbooks ===
+def data_column_names(count):
+    """Sheet1 and (messy) Sheet2 names for the non-key columns."""
+    templates = [
+        ('Net Amount {}', 'Net  Amount {}'),
+        ('Quantity {}', 'quantity {}'),
+        ('Customer Name {}', 'Customer Name {}(Master Data)'),
+        ('Posting Date {}', 'Posting  Date {}'),
+        ('Status Text {}', 'STATUS TEXT {}'),
+    ]
+    names = [templates[position % len(templates)] for position in range(count)]
+    return [(clean.format(position), messy.format(position)) for position, (clean, messy) in enumerate(names)]
+
+def generate_sheets(rows, columns, duplicate_rate, one_sided_rate, mismatch_rate, messy_headers, seed=0):
+    """Synthetic (Sheet1, Sheet2) pair with the requested size, key duplication, extra rows and mismatches."""
+    rng = np.random.default_rng(seed)
+    data_count = max(columns - len(BENCHMARK_KEY_COLUMNS), 1)
+
+    billing = np.arange(rows, dtype=np.int64) + 90_000_000
+    duplicates = rng.random(rows) < duplicate_rate
+    duplicates[0] = False
+    billing[duplicates] = billing[rng.integers(0, np.maximum(np.flatnonzero(duplicates), 1))]
+    sheet1 = pd.DataFrame({
+        'Company Code': rng.choice(['1000', '2000', '3000', '4000'], rows),
+        'Profit Center': rng.integers(100, 1000, rows),
+        'Billing Document': billing,
+    })
+    text_values = np.array(['Alpha', 'Beta', 'Gamma', 'Not assigned', '*', '', 'Delta'], dtype=object)
+    for position, (name, _) in enumerate(data_column_names(data_count)):
+        kind = position % 5
+        if kind == 0:
+            sheet1[name] = rng.normal(1000, 300, rows).round(2)
+        elif kind == 1:
+            sheet1[name] = rng.integers(0, 50, rows)
+        elif kind == 2:
+            sheet1[name] = rng.choice(text_values, rows)
+        elif kind == 3:
+            sheet1[name] = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+        else:
+            sheet1[name] = rng.choice(np.array(['Open', 'Closed', 'Blocked'], dtype=object), rows)
+
+    sheet2 = sheet1.copy()
+    for position, (name, _) in enumerate(data_column_names(data_count)):
+        changed = rng.random(rows) < mismatch_rate
+        kind = position % 5
+        if kind in (0, 1):
+            sheet2.loc[changed, name] = sheet2.loc[changed, name] + 1
+        elif kind == 3:
+            sheet2.loc[changed, name] = sheet2.loc[changed, name] + pd.Timedelta(days=1)
+        else:
+            sheet2.loc[changed, name] = 'Changed'
+
+    # One-sided rows: half dropped from Sheet2, half new keys added to it
+    one_sided = int(rows * one_sided_rate)
+    dropped = rng.choice(rows, one_sided // 2, replace=False)
+    added = sheet2.iloc[rng.choice(rows, one_sided - len(dropped), replace=False)].copy()
+    added['Billing Document'] = added['Billing Document'] + 10 ** 9
+    sheet2 = pd.concat([sheet2.drop(index=dropped), added], ignore_index=True)
+    sheet2 = sheet2.iloc[rng.permutation(len(sheet2))].reset_index(drop=True)
+
+    if messy_headers:
+        # Same values in the types another export would produce, under near-miss headers
+        sheet2['Company Code'] = sheet2['Company Code'].astype(int)
+        sheet2['Profit Center'] = sheet2['Profit Center'].astype(float)
+        sheet2['Billing Document'] = sheet2['Billing Document'].astype(str)
+        renames = {'Profit Center': 'Profit Center(Transaction Data)'}
+        renames.update(data_column_names(data_count))
+        sheet2 = sheet2.rename(columns=renames)
+    return sheet1, sheet2
+
+def write_workbook(sheet1, sheet2, path):
+    """Save a generated pair as the Sheet1/Sheet2 workbook Code.py expects."""
+    with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+        sheet1.to_excel(writer, sheet_name='Sheet1', index=False)
+        sheet2.to_excel(writer, sheet_name='Sheet2', index=False)
+
+# === Scenarios ===
+def scenario_name(params, lean=False):
+    return (f"rows={params['rows']} cols={params['columns']} dup={params['duplicate_rate']} "
+            f"one_sided={params['one_sided_rate']} mismatch={params['mismatch_rate']} "
+            f"{'messy' if params['messy_headers'] else 'clean'}{' lean' if lean else ''}")
+
+def build_scenarios(variants):
+    """The base scenario plus one scenario per variant value (one setting changed at a time)."""
+    scenarios = {scenario_name(BASE_SCENARIO): dict(BASE_SCENARIO)}
+    for setting, values in variants.items():
+        for value in values:
+            params = dict(BASE_SCENARIO, **{setting: value})
+            scenarios.setdefault(scenario_name(params), params)
+    return list(scenarios.values())
+
+def run_scenario(params, work_dir, repeat=BENCHMARK_REPEAT, excel_input=False, write=True, lean=False):
+    """Time every pipeline stage of one scenario; returns its result record."""
+    sheet1, sheet2 = generate_sheets(**params)
+    input_path = os.path.join(work_dir, 'input.xlsx')
+    output_path = os.path.join(work_dir, 'report.xlsx')
+    excel_input = excel_input and max(len(sheet1), len(sheet2)) <= EXCEL_MAX_DATA_ROWS
+    if excel_input:
+        write_workbook(sheet1, sheet2, input_path)
+
+    runs = []
+    for _ in range(repeat):
+        Code.COLUMN_MATCH_CACHE.clear()
+        profiler = Code.start_profiling()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                with profiler.stage("total"):
+                    if excel_input:
+                        Code.run_in_memory(input_path, BENCHMARK_KEY_COLUMNS, output_path if write else None, use_cache=False,
+                                           lean=lean)
+                    else:
+                        if lean:
+                            with profiler.stage("compact dtypes", rows=len(sheet1) + len(sheet2)):
+                                sheet1, sheet2 = Code.compact_dtypes(sheet1), Code.compact_dtypes(sheet2)
+                        result = Code.reconcile(sheet1, sheet2, BENCHMARK_KEY_COLUMNS, lean=lean)
+                        if write:
+                            Code.write_report(output_path, result.report_sheets(), result.key_columns, result.mismatch_comparison)
+        finally:
+            Code.stop_profiling()
+        runs.append(profiler.records)
+
+    # Keep the fastest run of each stage
+    stages = {}
+    for records in runs:
+        for record in records:
+            best = stages.get(record['stage'])
+            if best is None or record['wall_s'] < best['wall_s']:
+                stages[record['stage']] = {key: record.get(key) for key in ('stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rows', 'columns')}
+    return {
+        'name': scenario_name(params, lean),
+        'params': params,
+        'sheet_rows': [len(sheet1), len(sheet2)],
+        'excel_input': excel_input,
+        'report_written': write,
+        'lean': lean,
+        'stages': list(stages.values()),
+    }
+
+def run_benchmarks(scenarios, repeat=BENCHMARK_REPEAT, excel_input=False, write=True, lean=False):
+    results = []
+    with tempfile.TemporaryDirectory(prefix='reconcile_benchmark_') as work_dir:
+        for position, params in enumerate(scenarios, start=1):
+            print(f"⏱️ [{position}/{len(scenarios)}] {scenario_name(params, lean)}")
+            result = run_scenario(params, work_dir, repeat=repeat, excel_input=excel_input, write=write, lean=lean)
+            total = next(stage for stage in result['stages'] if stage['stage'] == 'total')
+            print(f"   total {total['wall_s']:.3f}s, peak RSS {total['peak_rss_mb']:.0f} MB")
+            results.append(result)
+    return {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'scenarios': results,
+    }
+
+# === Regression Check ===
+def compare_to_baseline(results, baseline, threshold=BENCHMARK_REGRESSION_THRESHOLD, min_seconds=BENCHMARK_MIN_SECONDS):
+    """Per-stage comparison of two result files; returns a DataFrame with a Regression flag."""
+    baseline_stages = {
+        (scenario['name'], stage['stage']): stage['wall_s']
+        for scenario in baseline['scenarios'] for stage in scenario['stages']
+    }
+    rows = []
+    for scenario in results['scenarios']:
+        for stage in scenario['stages']:
+            before = baseline_stages.get((scenario['name'], stage['stage']))
+            if before is None:
+                continue
+            ratio = stage['wall_s'] / before if before else float('inf')
+            rows.append({
+                'Scenario': scenario['name'],
+                'Stage': stage['stage'],
+                'Baseline (s)': before,
+                'Current (s)': stage['wall_s'],
+                'Change': f"{ratio - 1:+.0%}",
+                'Regression': before >= min_seconds and ratio > 1 + threshold,
+            })
+    return pd.DataFrame(rows, columns=['Scenario', 'Stage', 'Baseline (s)', 'Current (s)', 'Change', 'Regression'])
+
+def peak_rss_over_target(results, target_mb):
+    """(scenario name, peak RSS MB) of every scenario whose total stage peaked above target_mb."""
+    over = []
+    for scenario in results['scenarios']:
+        peak = next(stage['peak_rss_mb'] for stage in scenario['stages'] if stage['stage'] == 'total')
+        if peak is not None and peak > target_mb:
+            over.append((scenario['name'], peak))
+    return over
+
+def save_json(data, path):
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(data, handle, indent=2, default=str)
+
+# === Command Line ===
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Code.py on synthetic Sheet1/Sheet2 workbooks.")
+    parser.add_argument('--quick', action='store_true', help=f"Only row counts {QUICK_ROWS} and no other variants")
+    parser.add_argument('--rows', type=int, nargs='+', help="Row counts to benchmark")
+    parser.add_argument('--columns', type=int, nargs='+', help="Column counts to benchmark")
+    parser.add_argument('--duplicate-rates', type=float, nargs='+', help="Duplicate-key rates to benchmark")
+    parser.add_argument('--one-sided-rates', type=float, nargs='+', help="One-sided-row rates to benchmark")
+    parser.add_argument('--mismatch-rates', type=float, nargs='+', help="Mismatch densities to benchmark")
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT, help="Runs per scenario (fastest is kept)")
+    parser.add_argument('--excel-input', action='store_true', help="Write each scenario to .xlsx and time loading it too")
+    parser.add_argument('--no-write', action='store_true', help="Skip writing the report")
+    parser.add_argument('--lean', action='store_true', help="Run Code.py in memory-lean mode (compacted dtypes, Arrow keys)")
+    parser.add_argument('--peak-rss-target', type=float, default=BENCHMARK_PEAK_RSS_TARGET_MB, metavar='MB',
+                        help="Fail when a scenario's peak RSS exceeds this many MB")
+    parser.add_argument('-o', '--output', default=BENCHMARK_RESULTS_FILE, help="Results JSON")
+    parser.add_argument('--baseline', default=BENCHMARK_BASELINE_FILE, help="Baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="Also store the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=BENCHMARK_REGRESSION_THRESHOLD,
+                        help="Slow-down (0.2 = 20%%) above which a stage counts as a regression")
+    parser.add_argument('--min-seconds', type=float, default=BENCHMARK_MIN_SECONDS,
+                        help="Ignore stages faster than this in the baseline")
+    parser.add_argument('--generate', metavar='PATH', help="Only write the base scenario (with --rows etc.) as a workbook")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    overrides = {
+        'rows': args.rows, 'columns': args.columns, 'duplicate_rate': args.duplicate_rates,
+        'one_sided_rate': args.one_sided_rates, 'mismatch_rate': args.mismatch_rates,
+    }
+
+    if args.generate:
+        params = dict(BASE_SCENARIO, **{setting: values[0] for setting, values in overrides.items() if values})
+        write_workbook(*generate_sheets(**params), args.generate)
+        print(f"✨ Synthetic workbook written to '{args.generate}' ({scenario_name(params)})")
+        return 0
+
+    variants = {'rows': QUICK_ROWS} if args.quick else dict(SCENARIO_VARIANTS)
+    variants.update({setting: values for setting, values in overrides.items() if values})
+    results = run_benchmarks(build_scenarios(variants), repeat=args.repeat, excel_input=args.excel_input,
+                             write=not args.no_write, lean=args.lean)
+    save_json(results, args.output)
+    print(f"📊 Results written to '{args.output}'")
+
+    memory_ok = True
+    if args.peak_rss_target:
+        over = peak_rss_over_target(results, args.peak_rss_target)
+        memory_ok = not over
+        if memory_ok:
+            print(f"✅ Every scenario stayed within the {args.peak_rss_target:.0f} MB peak-RSS target")
+        for name, peak in over:
+            print(f"❌ {name}: peak RSS {peak:.0f} MB exceeds the {args.peak_rss_target:.0f} MB target")
+
+    if args.save_baseline:
+        save_json(results, args.baseline)
+        print(f"📌 Baseline saved to '{args.baseline}'")
+        return 0 if memory_ok else 1
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️ No baseline at '{args.baseline}'; run with --save-baseline to create one")
+        return 0 if memory_ok else 1
+
+    with open(args.baseline, encoding='utf-8') as handle:
+        baseline = json.load(handle)
+    comparison = compare_to_baseline(results, baseline, args.threshold, args.min_seconds)
+    regressions = comparison[comparison['Regression']]
+    if regressions.empty:
+        print(f"✅ No stage is more than {args.threshold:.0%} slower than the baseline")
+        return 0 if memory_ok else 1
+    print(f"❌ {len(regressions)} stages are more than {args.threshold:.0%} slower than the baseline:")
+    print(regressions.drop(columns='Regression').to_string(index=False))
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
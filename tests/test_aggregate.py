@@ -0,0 +1,41 @@
+"""Group-level totals with drill-down into failing groups."""
+import pandas as pd
+
+import Code
+
+
+def frames():
+    source = pd.DataFrame({'Company': ['A', 'A', 'B', 'B', 'C'], 'Line': [1, 2, 1, 2, 1],
+                           'Amount': [10.0, 20.0, 30.0, 40.0, 50.0]})
+    target = pd.DataFrame({'Company': ['A', 'A', 'B', 'B', 'D'], 'Line': [2, 1, 1, 2, 1],
+                           'Amount': [20.0, 10.0, 30.0, 41.0, 60.0]})
+    return source, target
+
+
+def test_group_status():
+    result = Code.reconcile_aggregate(*frames(), ['Company', 'Line'], group_columns=['Company'],
+                                      functions=['sum', 'count'], drill_down=False)
+    status = dict(zip(result.group_totals['Company'], result.group_totals['Status']))
+    assert status == {'A': 'PASS', 'B': 'FAIL', 'C': 'Only in Sheet1', 'D': 'Only in Sheet2'}
+    assert result.failed_groups == 3
+    assert result.drill_down is None
+    groups = result.column_status.set_index('Column').loc['Groups']
+    assert groups['KPI'] == 'FAIL' and groups['Status'] == '1 only in Sheet1, 1 only in Sheet2'
+
+
+def test_drill_down_covers_only_failing_groups():
+    result = Code.reconcile_aggregate(*frames(), ['Company', 'Line'], group_columns=['Company'],
+                                      functions=['sum'], drill_down=True)
+    drill_down = result.drill_down
+    assert set(drill_down.source['Company']) == {'B', 'C'}
+    assert set(drill_down.target['Company']) == {'B', 'D'}
+    assert (drill_down.common_count, drill_down.extra_source_count, drill_down.extra_target_count) == (2, 1, 1)
+    assert drill_down.mismatch_details['Company'].tolist() == ['B']
+
+
+def test_all_groups_pass_without_drill_down():
+    source, target = frames()
+    source, target = source[source['Company'] == 'A'], target[target['Company'] == 'A']
+    result = Code.reconcile_aggregate(source, target, ['Company', 'Line'], group_columns=['Company'], drill_down=True)
+    assert result.group_totals['Status'].tolist() == ['PASS']
+    assert result.failed_groups == 0 and result.drill_down is None
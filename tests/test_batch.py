@@ -0,0 +1,83 @@
+"""Batch runs on the process pool."""
+import json
+import multiprocessing
+import os
+import time
+import types
+
+import pandas as pd
+import pytest
+
+import Code
+
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                                reason="workers must inherit the patched run_in_memory")
+
+
+def fake_run_in_memory(source, *args, **kwargs):
+    if os.path.basename(source) == 'crash.xlsx':
+        time.sleep(0.2)  # let the other workers pick up their jobs first
+        os._exit(1)
+    if os.path.basename(source).startswith('slow'):
+        time.sleep(1)
+    return types.SimpleNamespace(column_status=pd.DataFrame({'Column': ['Amount'], 'KPI': ['PASS']}),
+                                 common_count=1, extra_source_count=0, extra_target_count=0)
+
+
+def test_dead_worker_does_not_abort_the_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(Code, 'run_in_memory', fake_run_in_memory)
+    manifest = tmp_path / 'jobs.json'
+    manifest.write_text(json.dumps([{'name': name, 'source': str(tmp_path / f'{name}.xlsx'),
+                                     'output': str(tmp_path / f'{name}_report.xlsx')}
+                                    for name in ('first', 'crash', 'second', 'third')]))
+
+    rollup = Code.run_batch(str(manifest), str(tmp_path / 'rollup.xlsx'), workers=1)
+
+    assert rollup['Job'].tolist() == ['first', 'crash', 'second', 'third']
+    assert rollup['KPI'].tolist() == ['PASS', 'FAIL', 'PASS', 'PASS']
+    assert rollup['Status'][1] == 'Error: worker process died'
+
+
+def test_jobs_sharing_the_pool_with_a_dead_worker_are_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(Code, 'run_in_memory', fake_run_in_memory)
+    manifest = tmp_path / 'jobs.json'
+    manifest.write_text(json.dumps([{'name': name, 'source': str(tmp_path / f'{name}.xlsx'),
+                                     'output': str(tmp_path / f'{name}_report.xlsx')}
+                                    for name in ('slow_a', 'crash', 'slow_b', 'after')]))
+
+    rollup = Code.run_batch(str(manifest), str(tmp_path / 'rollup.xlsx'), workers=3, memory_budget=float('inf'))
+
+    assert rollup['Job'].tolist() == ['slow_a', 'crash', 'slow_b', 'after']
+    assert rollup['KPI'].tolist() == ['PASS', 'FAIL', 'PASS', 'PASS']
+    assert rollup['Status'][1] == 'Error: worker process died'
+
+
+def recording_run_in_memory(source, key_columns, output_file, **kwargs):
+    """Record what the worker ran with next to the job's output."""
+    with open(f'{output_file}.json', 'w') as handle:
+        json.dump({'kwargs': kwargs, 'policies': Code.COLUMN_POLICIES, 'output_format': Code.REPORT_OUTPUT_FORMAT,
+                   'csv_compression': Code.REPORT_CSV_COMPRESSION, 'split_workbooks': Code.REPORT_SPLIT_WORKBOOKS}, handle)
+    return fake_run_in_memory(source)
+
+
+def test_settings_travel_with_each_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(Code, 'run_in_memory', recording_run_in_memory)
+    manifest = tmp_path / 'jobs.json'
+    manifest.write_text(json.dumps([
+        {'name': 'a', 'source': 'a.xlsx', 'output': str(tmp_path / 'a.xlsx')},
+        {'name': 'b', 'source': 'b.xlsx', 'output': str(tmp_path / 'b.xlsx'), 'incremental': str(tmp_path / 'b_state.pkl')},
+    ]))
+    settings = Code.batch_settings(use_cache=False, lean=True, incremental=str(tmp_path / 'state.pkl'),
+                                   policies={'numeric': {'abs_tol': 0.01}}, output_format='parquet',
+                                   csv_compression='gzip', split_workbooks=True)
+
+    Code.run_batch(str(manifest), str(tmp_path / 'rollup.xlsx'), workers=1, settings=settings)
+
+    seen = {name: json.loads((tmp_path / f'{name}.xlsx.json').read_text()) for name in ('a', 'b')}
+    assert seen['a']['kwargs']['use_cache'] is False
+    assert seen['a']['kwargs']['lean'] is True
+    assert seen['a']['kwargs']['state_file'] == str(tmp_path / 'state_job1.pkl')
+    assert seen['b']['kwargs']['state_file'] == str(tmp_path / 'b_state.pkl')
+    assert seen['a']['policies'] == {'numeric': {'abs_tol': 0.01}}
+    assert (seen['a']['output_format'], seen['a']['csv_compression'], seen['a']['split_workbooks']) == ('parquet', 'gzip', True)
+    assert Code.COLUMN_POLICIES == {} and Code.REPORT_OUTPUT_FORMAT == 'xlsx'
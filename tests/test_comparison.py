@@ -0,0 +1,122 @@
+"""The vectorized comparator against the original cell-by-cell comparison."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import Code
+
+
+def baseline_values_equal(v1, v2):
+    """are_values_equal_enhanced() as it was before the comparison was vectorized."""
+    def normalize_value(val):
+        if pd.isna(val) or val is None:
+            return 0
+        if isinstance(val, (int, float)):
+            if val == 0:
+                return 0
+            return val
+        if isinstance(val, str):
+            cleaned = val.strip()
+            if cleaned in Code.EMPTY_LIKE_VALUES:
+                return 0
+            try:
+                num_val = float(cleaned)
+                return 0 if num_val == 0.0 else num_val
+            except (ValueError, TypeError):
+                return cleaned
+        str_val = str(val).strip()
+        if str_val in Code.EMPTY_LIKE_VALUES:
+            return 0
+        try:
+            num_val = float(str_val)
+            return 0 if num_val == 0.0 else num_val
+        except (ValueError, TypeError):
+            return str_val
+
+    norm_v1, norm_v2 = normalize_value(v1), normalize_value(v2)
+    if norm_v1 == 0 and norm_v2 == 0:
+        return True
+    return norm_v1 == norm_v2
+
+
+def assert_matches_baseline(values1, values2, dtype1=None, dtype2=None):
+    series1 = pd.Series(values1, dtype=dtype1)
+    series2 = pd.Series(values2, dtype=dtype2)
+    expected = [baseline_values_equal(series1.iloc[i], series2.iloc[i]) for i in range(len(series1))]
+    assert Code.compare_columns_vectorized(series1, series2).tolist() == expected
+
+
+def test_sub_second_timestamps_differ():
+    values1 = pd.to_datetime(['2024-01-01 10:00:00', '2024-01-01 10:00:00.750', '2024-01-01 10:00:00.000000750', None],
+                             format='mixed')
+    values2 = pd.to_datetime(['2024-01-01 10:00:00', '2024-01-01 10:00:00', '2024-01-01 10:00:00.000000750', None],
+                             format='mixed')
+    assert_matches_baseline(values1, values2)
+    assert Code.compare_columns_vectorized(pd.Series(values1), pd.Series(values2)).tolist() == [True, False, True, True]
+
+
+def test_timestamp_text_keeps_fraction():
+    values = pd.Series(pd.to_datetime(['2024-01-01 10:00:00', '2024-01-01 10:00:00.750', None], format='mixed'))
+    assert Code.column_to_text(values).tolist() == [str(value) for value in values]
+
+
+def test_large_integers_compare_exactly():
+    series1 = pd.Series([10 ** 17 + 1, 10 ** 17, 0, 5], dtype=np.int64)
+    series2 = pd.Series([10 ** 17, 10 ** 17, 0, 6], dtype=np.int64)
+    assert Code.compare_columns_vectorized(series1, series2).tolist() == [False, True, True, False]
+
+
+def test_missing_and_empty_like_values():
+    assert_matches_baseline([None, np.nan, None, '', 'Not assigned', None, 'x', 0],
+                            [np.nan, '', 0, '0.00', '-', 'x', 'x ', None], object, object)
+
+
+def test_numbers_against_text():
+    assert_matches_baseline([1.5, 2.0, 100.0, 3.25, np.nan], ['1.50', '2', '1e2', 'abc', '0'], float, object)
+
+
+def test_boolean_column_compares_as_text():
+    assert_matches_baseline([True, False, False, True], [True, False, True, False], bool, bool)
+    assert_matches_baseline([True, False, False], ['True', None, '0'], bool, object)
+
+
+def test_python_bools_in_object_column_count_as_numbers():
+    assert_matches_baseline([True, False, True, 'a', None], [1, None, 2.0, 'a', False], object, object)
+
+
+def baseline_key_value(val):
+    """normalize_key_value() as it was before key building was vectorized."""
+    if pd.isna(val):
+        return str(val)
+    str_val = str(val).strip()
+    if str_val.endswith('.0'):
+        str_val = str_val[:-2]
+    if str_val.replace('.', '').replace('-', '').isdigit():
+        try:
+            return str(int(float(str_val)))
+        except (ValueError, OverflowError):
+            return str_val
+    return str_val
+
+
+@pytest.mark.parametrize('values, dtype', [
+    ([1234.0, np.nan, -7.0, 0.5], float),
+    ([None, pd.NaT, 5], object),
+    (['00123', ' 42 ', '12.50', '-7.0', 'AB-1', None, np.nan, 1234.0, 99], object),
+    (pd.to_datetime(['2024-01-01 10:00:00', '2024-01-01 10:00:00.750', None], format='mixed'), None),
+])
+def test_key_normalization_matches_baseline(values, dtype):
+    series = pd.Series(values, dtype=dtype)
+    expected = [baseline_key_value(series.iloc[i]) for i in range(len(series))]
+    assert Code.normalize_key_column(series).tolist() == expected
+
+
+def test_sub_second_keys_are_not_duplicates():
+    frame = pd.DataFrame({'Posted': pd.to_datetime(['2024-01-01 10:00:00', '2024-01-01 10:00:00.750'], format='mixed'),
+                          'Doc': [None, None]})
+    keys = Code.build_composite_key(frame, ['Posted', 'Doc']).tolist()
+    assert keys == ['2024-01-01 10:00:00|None', '2024-01-01 10:00:00.750000|None']
+
+
+def test_empty_timestamp_column_to_text():
+    assert Code.column_to_text(pd.Series([], dtype='datetime64[us]')).tolist() == []
@@ -0,0 +1,21 @@
+"""Pairing of repeated keys."""
+import pandas as pd
+
+import Code
+
+
+def frames():
+    source = pd.DataFrame({'Doc': ['A', 'A'], 'Line': [2, 1], 'Amount': [20, 10]})
+    target = pd.DataFrame({'Doc': ['A', 'A'], 'Line': [1, 2], 'Amount': [10, 20]})
+    return source, target
+
+
+def test_sort_column_is_read_when_called(monkeypatch):
+    monkeypatch.setattr(Code, 'DUPLICATE_SORT_COLUMN', 'Line')
+    result = Code.reconcile(*frames(), ['Doc'])
+    assert result.comparison['Amount'].all()
+
+
+def test_sort_column_argument():
+    assert not Code.reconcile(*frames(), ['Doc']).comparison['Amount'].all()
+    assert Code.reconcile(*frames(), ['Doc'], sort_column='Line').comparison['Amount'].all()
@@ -0,0 +1,51 @@
+"""Incremental runs against the digests saved by the previous run."""
+import pandas as pd
+
+import Code
+
+
+def frames():
+    source = pd.DataFrame({'K': [1, 2, 3, 4, 5], 'Amount': [10.0, 20.0, 30.0, 40.0, 50.0],
+                           'Note': ['a', 'b', 'none', 'd', 'e']})
+    target = pd.DataFrame({'K': [1, 2, 3, 4, 6], 'Amount': [10.0, 21.0, 30.0, 40.0, 60.0],
+                           'Note': ['a', 'b', '', 'd', 'f']})
+    return source, target
+
+
+def assert_same_result(result, full):
+    assert result.column_status.equals(full.column_status)
+    assert result.comparison.equals(full.comparison)
+    assert result.mismatch_details.reset_index(drop=True).equals(full.mismatch_details.reset_index(drop=True))
+
+
+def test_carry_forward_matches_full_run_after_edits(tmp_path):
+    state_file = str(tmp_path / 'state.pkl')
+    source, target = frames()
+    first = Code.reconcile(source, target, ['K'], incremental=True)
+    Code.save_incremental_state(state_file, first.state)
+
+    source.loc[source['K'] == 1, 'Amount'] = 11.0  # new mismatch on a previously matching row
+    target.loc[target['K'] == 2, 'Amount'] = 20.0  # previous mismatch fixed
+    target.loc[len(target)] = [5, 50.0, 'e']  # previously extra row now paired
+
+    result = Code.reconcile(source, target, ['K'], incremental=True,
+                            previous_state=Code.load_incremental_state(state_file))
+    full = Code.reconcile(source, target, ['K'])
+
+    assert result.carried_forward_count == 2  # keys 3 and 4
+    assert_same_result(result, full)
+    assert not result.comparison.loc[result.comparison.index.astype(str) == '1', 'Amount'].any()
+
+
+def test_changed_signature_drops_the_state(monkeypatch):
+    source, target = frames()
+    first = Code.reconcile(source, target, ['K'], incremental=True)
+    assert first.comparison['Note'].all()  # 'none' and '' are both empty by default
+
+    monkeypatch.setattr(Code, 'COLUMN_POLICIES', {'Note': {'empty_values': ['']}})
+    result = Code.reconcile(source, target, ['K'], incremental=True, previous_state=first.state)
+    full = Code.reconcile(source, target, ['K'])
+
+    assert result.carried_forward_count == 0
+    assert_same_result(result, full)
+    assert not result.comparison['Note'].all()
@@ -0,0 +1,42 @@
+"""Parsed-input cache shared by concurrent jobs."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+import Code
+
+pytest.importorskip('pyarrow')
+
+
+def test_concurrent_writers_and_eviction(tmp_path):
+    cache_dir = str(tmp_path)
+    frames = {'arrow': pd.DataFrame({'Amount': range(1000)}),
+              'pickle': pd.DataFrame({'Mixed': [1, 'a', 2.5] * 300})}
+
+    def job(position):
+        kind = 'arrow' if position % 2 else 'pickle'
+        Code.write_cached_sheet(cache_dir, kind, frames[kind])
+        Code.evict_input_cache(cache_dir, max_bytes=0 if position % 3 == 0 else 1 << 30)
+        Code.read_cached_sheet(cache_dir, kind)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(job, range(64)))
+
+    assert not [name for name in tmp_path.iterdir() if name.suffix == '.tmp']
+    Code.write_cached_sheet(cache_dir, 'arrow', frames['arrow'])
+    assert Code.read_cached_sheet(cache_dir, 'arrow').equals(frames['arrow'])
+
+
+def test_cache_dir_set_after_import_is_used(tmp_path, monkeypatch):
+    workbook = tmp_path / 'book.xlsx'
+    pd.DataFrame({'ID': [1, 2], 'Amount': [1.5, 2.5]}).to_excel(workbook, sheet_name='Sheet1', index=False)
+    cache_dir = tmp_path / 'cache'
+    monkeypatch.setattr(Code, 'USE_INPUT_CACHE', True)
+    monkeypatch.setattr(Code, 'INPUT_CACHE_DIR', str(cache_dir))
+
+    Code.load_sheet(str(workbook), 'Sheet1')
+
+    assert cache_dir.is_dir() and any(cache_dir.iterdir())
+    Code.clear_input_cache(str(cache_dir))
+    assert not cache_dir.exists() or not any(cache_dir.iterdir())
@@ -0,0 +1,41 @@
+"""Memory-lean runs must produce the same report as normal runs."""
+import numpy as np
+import pandas as pd
+
+import Code
+
+
+def workbook(path):
+    rows = 60
+    source = pd.DataFrame({
+        'ID': [f'ID{i % 50}' for i in range(rows)],  # ten repeated keys
+        'Company Code': ['1000', '2000', '3000'] * 20,
+        'Amount': np.arange(rows) * 1.25,
+        'Quantity': np.arange(rows) % 7,
+        'Posting Date': pd.date_range('2024-01-01', periods=rows),
+        'Note': ['open', 'closed', None, 'pending'] * 15,
+    })
+    target = source.copy()
+    target.loc[3, 'Amount'] += 1
+    target.loc[7, 'Company Code'] = '9000'
+    target.loc[11, 'Note'] = 'reopened'
+    target.loc[15, 'Quantity'] = 100
+    target.loc[20, 'ID'] = 'ID999'  # one extra row on each side
+    with pd.ExcelWriter(path) as writer:
+        source.to_excel(writer, sheet_name='Sheet1', index=False)
+        target.to_excel(writer, sheet_name='Sheet2', index=False)
+
+
+def test_lean_run_writes_the_same_report(tmp_path):
+    source = str(tmp_path / 'book.xlsx')
+    workbook(source)
+    reports = {}
+    for lean in (False, True):
+        output = str(tmp_path / f'report_{lean}.xlsx')
+        Code.run_in_memory(source, ['ID'], output, use_cache=False, state_file=False, lean=lean)
+        reports[lean] = pd.read_excel(output, sheet_name=None, dtype=str)
+
+    assert list(reports[True]) == list(reports[False])
+    for sheet_name, frame in reports[False].items():
+        pd.testing.assert_frame_equal(reports[True][sheet_name], frame, obj=sheet_name)
+    assert len(reports[False]['Mismatch Details']) == 4
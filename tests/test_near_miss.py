@@ -0,0 +1,36 @@
+"""Near-miss key suggestions among the extra rows."""
+import pandas as pd
+import pytest
+
+import Code
+
+pytest.importorskip('rapidfuzz')
+
+
+def extra_rows():
+    source = pd.DataFrame({'Doc': ['INV-1', 'INV-10045', 'INV-10047', 'INV-20077', 'INV-10045', 'XINV-3321'],
+                           'Company': ['X', 'X', 'X', 'X', 'Y', 'X'], 'Amount': [1, 2, 3, 4, 5, 6]})
+    target = pd.DataFrame({'Doc': ['INV-1', 'INV-10046', 'INV-20078', 'YINV-3321Z'],
+                           'Company': ['X', 'X', 'X', 'X'], 'Amount': [1, 2, 4, 6]})
+    return Code.reconcile(source, target, ['Doc', 'Company']).extra_rows
+
+
+def test_pairs_are_one_to_one():
+    near_misses = Code.find_near_miss_keys(extra_rows(), ['Doc', 'Company'], min_score=80)
+    # INV-10045|X and INV-10047|X both resemble INV-10046|X; only one of them gets it
+    assert len(near_misses) == 2
+    assert near_misses['Sheet1 Key'].is_unique and near_misses['Sheet2 Key'].is_unique
+    assert set(near_misses['Sheet2 Key']) == {'INV-10046|X', 'INV-20078|X'}
+    assert 'INV-20077|X' in set(near_misses['Sheet1 Key'])
+    assert (near_misses['Differing Column'] == 'Doc').all()
+
+
+def test_candidates_must_share_a_block():
+    near_misses = Code.find_near_miss_keys(extra_rows(), ['Doc', 'Company'], min_score=80)
+    # Same company required: INV-10045|Y is never offered for INV-10046|X
+    assert 'INV-10045|Y' not in set(near_misses['Sheet1 Key'])
+    # Scores above min_score but shares neither the first nor the last three characters
+    assert 'XINV-3321|X' not in set(near_misses['Sheet1 Key'])
+
+    unblocked = Code.find_near_miss_keys(extra_rows(), ['Doc', 'Company'], min_score=80, block_length=0)
+    assert 'XINV-3321|X' in set(unblocked['Sheet1 Key'])
@@ -0,0 +1,77 @@
+"""Report writing edge cases."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import Code
+
+
+def test_infinite_values_are_written(tmp_path):
+    output = tmp_path / 'report.xlsx'
+    frame = pd.DataFrame({'__key__': ['a', 'b', 'c'], 'Amount': [np.inf, -np.inf, np.nan],
+                          'Mixed': pd.Series([-np.inf, 'x', pd.Timestamp('2024-01-01')], dtype=object)})
+    Code.write_report(str(output), {'Side by Side Result': frame}, ['__key__'], output_format='xlsx')
+    written = pd.read_excel(output, sheet_name='Side by Side Result', dtype=object, keep_default_na=False)
+    assert written['__key__'].tolist() == ['a', 'b', 'c']
+    assert written['Amount'].tolist() == ['inf', '-inf', '']
+    assert written['Mixed'].tolist()[:2] == ['-inf', 'x']
+
+
+def fill(cell):
+    return cell.fill.fgColor.rgb[-6:] if cell.fill.fill_type else None
+
+
+def test_sheets_past_the_row_limit_are_split_with_their_fills(tmp_path, monkeypatch):
+    import openpyxl
+
+    monkeypatch.setattr(Code, 'EXCEL_MAX_ROWS', 4)  # 3 data rows per sheet
+    output = tmp_path / 'report.xlsx'
+    details = pd.DataFrame({'__key__': list('abcdefg'), 'Amount': range(7), 'Amount (target)': range(7)})
+    comparison = pd.DataFrame({'Amount': [True, True, True, True, False, True, False]})
+    extra = pd.DataFrame({'__key__': list('vwxyz'), 'Source': ['Sheet1 Only', 'Sheet2 Only'] * 2 + ['Sheet1 Only']})
+    Code.write_report(str(output), {'Mismatch Details': details, 'Extra Rows Analysis': extra}, ['__key__'],
+                      mismatch_comparison_df=comparison, output_format='xlsx', split_workbooks=False)
+
+    workbook = openpyxl.load_workbook(output)
+    assert workbook.sheetnames == ['Mismatch Details', 'Mismatch Details (2)', 'Mismatch Details (3)',
+                                   'Extra Rows Analysis', 'Extra Rows Analysis (2)']
+    keys = [cell.value for name in workbook.sheetnames[:3] for cell in workbook[name]['A'][1:]]
+    assert keys == list('abcdefg')
+    red = {(name, cell.row) for name in workbook.sheetnames[:3] for cell in workbook[name]['B'][1:]
+           if fill(cell) == Code.REPORT_FILLS['red'][1:]}
+    assert red == {('Mismatch Details (2)', 3), ('Mismatch Details (3)', 2)}
+    row_fills = [fill(workbook[name].cell(row, 1)) for name in workbook.sheetnames[3:] for row in range(2, workbook[name].max_row + 1)]
+    yellow, blue = Code.REPORT_FILLS['yellow'][1:], Code.REPORT_FILLS['blue'][1:]
+    assert row_fills == [yellow, blue, yellow, blue, yellow]
+
+
+def test_split_workbooks(tmp_path, monkeypatch):
+    monkeypatch.setattr(Code, 'EXCEL_MAX_ROWS', 4)
+    output = tmp_path / 'report.xlsx'
+    frame = pd.DataFrame({'__key__': list('abcde'), 'Amount': range(5)})
+    Code.write_report(str(output), {'Side by Side Result': frame}, ['__key__'], output_format='xlsx', split_workbooks=True)
+    first = pd.read_excel(output, sheet_name='Side by Side Result')
+    second = pd.read_excel(tmp_path / 'report_part2.xlsx', sheet_name='Side by Side Result')
+    assert pd.concat([first, second], ignore_index=True).equals(frame)
+
+
+@pytest.mark.parametrize('output_format, csv_compression, extension', [
+    ('parquet', None, '.parquet'), ('csv', None, '.csv'), ('csv', 'gzip', '.csv.gz')])
+def test_bulk_tables_go_to_files(tmp_path, output_format, csv_compression, extension):
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    output = tmp_path / 'report.xlsx'
+    side_by_side = pd.DataFrame({'__key__': ['a', 'b'], 'Amount': [1.5, 2.5], 'Mixed': [1, 'x']})
+    status = pd.DataFrame({'Column': ['Amount'], 'Status': ['OK'], 'KPI': ['PASS']})
+    Code.write_report(str(output), {'Overall Result': status, 'Side by Side Result': side_by_side}, ['__key__'],
+                      output_format=output_format, csv_compression=csv_compression)
+
+    path = tmp_path / f'report_side_by_side_result{extension}'
+    written = pd.read_parquet(path) if output_format == 'parquet' else pd.read_csv(path, dtype={'Mixed': str})
+    assert written[['__key__', 'Amount']].equals(side_by_side[['__key__', 'Amount']].astype({'__key__': written['__key__'].dtype}))
+    assert written['Mixed'].tolist() == ['1', 'x']
+
+    sheets = pd.read_excel(output, sheet_name=None)
+    assert list(sheets) == ['Overall Result', 'Output Files']
+    assert sheets['Output Files']['File'].tolist() == [str(path)]
+    assert sheets['Output Files']['Rows'].tolist() == [2]
@@ -0,0 +1,34 @@
+"""The row-hash short-circuit must not change any comparison result."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import Code
+
+COLUMNS = {
+    'bool': pd.Series([True, False, True, False]),
+    'int': pd.Series([1, 0, 2, 1]),
+    'float': pd.Series([1.0, 0.0, 2.0, np.nan]),
+    'text': pd.Series(['True', 'False', '1', '0'], dtype=object),
+    'object_bool': pd.Series([True, 'x', False, 1], dtype=object),
+    'date': pd.Series(pd.to_datetime(['2024-01-01', '2024-01-02', None, '2024-01-04'])),
+}
+
+
+@pytest.mark.parametrize('left', COLUMNS)
+@pytest.mark.parametrize('right', COLUMNS)
+def test_same_result_with_and_without_short_circuit(left, right, monkeypatch):
+    source = pd.DataFrame({'K': [1, 2, 3, 4], 'Value': COLUMNS[left]})
+    target = pd.DataFrame({'K': [1, 2, 3, 4], 'Value': COLUMNS[right]})
+    results = []
+    for enabled in (True, False):
+        monkeypatch.setattr(Code, 'ROW_HASH_SHORT_CIRCUIT', enabled)
+        results.append(Code.reconcile(source, target, ['K']).column_status['Status'].tolist())
+    assert results[0] == results[1]
+
+
+def test_bool_against_int_is_compared(monkeypatch):
+    monkeypatch.setattr(Code, 'ROW_HASH_SHORT_CIRCUIT', True)
+    source = pd.DataFrame({'K': [1, 2, 3], 'Flag': [True, False, True]})
+    target = pd.DataFrame({'K': [1, 2, 3], 'Flag': [1, 0, 2]})
+    assert Code.reconcile(source, target, ['K']).column_status['Status'].tolist() == ['Mismatches: 3/3']
@@ -0,0 +1,113 @@
+"""The SQL backend against the in-memory reconciliation."""
+import itertools
+
+import pandas as pd
+import pytest
+
+import Code
+
+pytest.importorskip('pyarrow')
+ENGINES = ['sqlite', pytest.param('duckdb', marks=pytest.mark.skipif(Code.resolve_sql_engine('auto') != 'duckdb',
+                                                                      reason="duckdb is not installed"))]
+
+TOKENS = ['nan', 'NaN', 'inf', '-inf', 'Infinity', '1e400', ' 5 ', '5', '5.0', '1_000', '1000', '1e2', '100', '', '-', 'null',
+          '0.00', '0', None, 'abc', ' abc', 'ABC', '12abc', '.5', '+5', '2.5', '3.5', '0.25']
+POLICIES = [{}, {'round': 0}, {'round': 1, 'case_insensitive': True}, {'abs_tol': 0.5, 'empty_values': ['', '-', 'nan']},
+            {'rel_tol': 0.01}]
+
+
+def token_frames():
+    pairs = list(itertools.product(TOKENS, TOKENS))
+    source = pd.DataFrame({'Key': range(len(pairs)), 'Value': [left for left, _ in pairs]})
+    target = pd.DataFrame({'Key': range(len(pairs)), 'Value': [right for _, right in pairs]})
+    return source.astype({'Value': object}), target.astype({'Value': object})
+
+
+def run_both(tmp_path, engine, source, target):
+    source_path, target_path = tmp_path / 'source.parquet', tmp_path / 'target.parquet'
+    source.to_parquet(source_path)
+    target.to_parquet(target_path)
+    output = tmp_path / f'{engine}.xlsx'
+    Code.run_sql(None, ['Key'], str(output), sources=(str(source_path), str(target_path)), engine=engine)
+    expected = Code.reconcile(source, target, ['Key'])
+    return pd.read_excel(output, sheet_name=None), expected
+
+
+@pytest.mark.parametrize('policy', POLICIES)
+@pytest.mark.parametrize('engine', ENGINES)
+def test_mismatches_match_in_memory(tmp_path, engine, policy, monkeypatch):
+    monkeypatch.setattr(Code, 'COLUMN_POLICIES', {'Value': policy})
+    report, expected = run_both(tmp_path, engine, *token_frames())
+    assert report['Overall Result']['Status'].tolist() == expected.column_status['Status'].tolist()
+
+
+@pytest.mark.parametrize('policy', [{}, {'round': 0}, {'round': 2}, {'round': -1}])
+@pytest.mark.parametrize('engine', ENGINES)
+def test_typed_columns_match_in_memory(tmp_path, engine, policy, monkeypatch):
+    monkeypatch.setattr(Code, 'COLUMN_POLICIES', {'numeric': policy})
+    source = pd.DataFrame({'Key': range(6), 'Amount': [2.5, 3.5, -2.5, 0.125, 2.675, 15.0],
+                           'Big': [10**17, 5, -3, 10**17 + 1, 0, 7], 'Flag': [True, False, True, False, True, True]})
+    target = pd.DataFrame({'Key': range(6), 'Amount': [2.0, 4.0, -2.0, 0.12, 2.68, 20.0],
+                           'Big': [10**17 + 1, 5, -3, 10**17 + 1, 0, 8], 'Flag': ['True', 'False', '1', '0', 'true', 'True']})
+    report, expected = run_both(tmp_path, engine, source, target)
+    assert report['Overall Result']['Status'].tolist() == expected.column_status['Status'].tolist()
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_mismatch_details_keep_cell_text(tmp_path, engine):
+    source = pd.DataFrame({'Key': [1, 2], 'Code': ['000456', '5.0']}).astype({'Code': object})
+    target = pd.DataFrame({'Key': [1, 2], 'Code': ['000457', '5.10']}).astype({'Code': object})
+    run_both(tmp_path, engine, source, target)
+    # dtype=str keeps text cells as written, a stored number 456 would read back as '456'
+    details = pd.read_excel(tmp_path / f'{engine}.xlsx', sheet_name='Mismatch Details', dtype=str)
+    assert details['Code'].tolist() == ['000456', '5.0']
+    assert details['Code (target)'].tolist() == ['000457', '5.10']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_duplicates_follow_numeric_sort_column(tmp_path, engine, monkeypatch):
+    monkeypatch.setattr(Code, 'DUPLICATE_SORT_COLUMN', 'Line')
+    source = pd.DataFrame({'Key': ['A', 'A'], 'Line': [2, 10], 'Value': ['first', 'second']})
+    target = pd.DataFrame({'Key': ['A', 'A'], 'Line': [2, 3], 'Value': ['first', 'second']})  # '10' < '2' < '3' as text
+    report, expected = run_both(tmp_path, engine, source, target)
+    assert report['Overall Result']['Status'].tolist() == expected.column_status['Status'].tolist()
+    assert expected.column_status.set_index('Column').loc['Value', 'KPI'] == 'PASS'
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_dtype_policies_follow_the_whole_column(tmp_path, engine, monkeypatch):
+    monkeypatch.setattr(Code, 'COLUMN_POLICIES', {'numeric': {'abs_tol': 0.01}})
+    source = pd.DataFrame({'Key': range(400), 'Amount': ['100.0'] * 400})
+    source.loc[250, 'Amount'] = 'pending'  # only the whole column is text, the first chunks are numbers
+    target = pd.DataFrame({'Key': range(400), 'Amount': [100.001] * 400})
+    source.to_csv(tmp_path / 'source.csv', index=False)
+    target.to_csv(tmp_path / 'target.csv', index=False)
+    output = tmp_path / f'{engine}.xlsx'
+    Code.run_sql(None, ['Key'], str(output), sources=(str(tmp_path / 'source.csv'), str(tmp_path / 'target.csv')),
+                 engine=engine, chunk_rows=100)
+    expected = Code.reconcile(pd.read_csv(tmp_path / 'source.csv'), pd.read_csv(tmp_path / 'target.csv'), ['Key'])
+    report = pd.read_excel(output, sheet_name='Overall Result')
+    assert report['Status'].tolist() == expected.column_status['Status'].tolist() == ['Mismatches: 400/400']
+
+
+def test_existing_database_file_is_left_alone(tmp_path):
+    database = tmp_path / 'mine.db'
+    database.write_bytes(b'not yours')
+    with pytest.raises(FileExistsError):
+        Code.run_sql(None, ['Key'], str(tmp_path / 'out.xlsx'), sources=('a.xlsx', 'b.xlsx'), engine='sqlite',
+                     database=str(database))
+    assert database.read_bytes() == b'not yours'
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_integer_keys_beyond_int64_stay_apart(engine):
+    connection = Code.open_sql_database(engine, ':memory:')
+    connection.execute("CREATE TABLE k (x VARCHAR)")
+    values = ['99999999999999999999', '123456789012345678901234567890', '9' * 40, '12.0']
+    for value in values:
+        connection.execute("INSERT INTO k VALUES (?)", [value])
+    keys = [key for (key,) in connection.execute(f"SELECT {Code.sql_key_expression(engine, 'x')} FROM k").fetchall()]
+    expected = Code.normalize_key_column(pd.Series(values, dtype=object)).tolist()
+    assert '9223372036854775807' not in keys
+    assert all(key in (pandas_key, value) for key, pandas_key, value in zip(keys, expected, values))  # pandas or stripped text
+    assert len(set(keys)) == len(values)
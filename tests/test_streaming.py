@@ -0,0 +1,37 @@
+"""The bucketed streaming run against the in-memory reconciliation."""
+import pandas as pd
+
+import Code
+
+
+def pending_amounts(tmp_path):
+    """An Amount column that is numeric in every chunk but one, so only the whole column is text."""
+    source = pd.DataFrame({'Key': range(400), 'Amount': ['100.0'] * 400})
+    source.loc[250, 'Amount'] = 'pending'
+    target = pd.DataFrame({'Key': range(400), 'Amount': [100.001] * 400})
+    source.to_csv(tmp_path / 'source.csv', index=False)
+    target.to_csv(tmp_path / 'target.csv', index=False)
+    return str(tmp_path / 'source.csv'), str(tmp_path / 'target.csv')
+
+
+def test_dtype_policies_follow_the_whole_column(tmp_path, monkeypatch):
+    monkeypatch.setattr(Code, 'COLUMN_POLICIES', {'numeric': {'abs_tol': 0.01}})
+    source_path, target_path = pending_amounts(tmp_path)
+    expected = Code.reconcile(pd.read_csv(source_path), pd.read_csv(target_path), ['Key'])
+    output = tmp_path / 'streamed.xlsx'
+    Code.run_streaming(None, ['Key'], str(output), sources=(source_path, target_path), n_buckets=64, chunk_rows=20)
+    report = pd.read_excel(output, sheet_name='Overall Result')
+    assert report['Status'].tolist() == expected.column_status['Status'].tolist() == ['Mismatches: 400/400']
+
+
+def test_dtype_sample_matches_reading_the_whole_column():
+    chunks = [pd.DataFrame({'Int': [1, 2], 'Flag': [True, False], 'Amount': [1.5, 2.0]}),
+              pd.DataFrame({'Int': [None, None], 'Flag': [None, None], 'Amount': ['n/a', '3']})]
+    sample = {}
+    for chunk in chunks:
+        Code.update_dtype_sample(sample, chunk)
+    whole = pd.concat(chunks, ignore_index=True).astype({'Amount': object})
+    frame = Code.dtype_sample_frame(sample, ['Int', 'Flag', 'Amount'])
+    assert frame['Int'].dtype == float
+    assert frame['Flag'].dtype == object == whole['Flag'].dtype
+    assert not pd.api.types.is_numeric_dtype(frame['Amount'])